@@ -1,6 +1,5 @@
 ################################################################################
 ### Loading the required modules
-import json
 import re
 
 import requests
@@ -10,11 +9,41 @@ from jinja2 import TemplateNotFound
 from werkzeug.routing import BaseConverter
 
 # from wikidataintegrator import wdi_core
-from wikibaseintegrator import wbi_helpers
 
 # Import BioStudies extractor
 from biostudies.search import BioStudiesExtractor
 
+# Import compound similarity search, the Compound Wiki -> Wikidata ID map,
+# the compound property catalog and the experimental data aggregation
+from compounds import expdata, idmap, properties, similarity
+from upstream import deadline, http, ratelimit, sparql
+
+# Import the server-side glossary index used by the term highlighter
+from glossary.store import glossary_snapshot
+
+# Import the cached ontology label resolver used on method pages
+from ontology import labels
+
+# Import the cached markdown renderer of the tool and method metadata files
+from metadata.render import metadata_html
+
+# Import the cached case study content
+from casestudies.content import case_study_content, content_ref
+
+# Import the per-page asset bundles resolved by base.html
+from assets.bundles import resolve_page_assets
+from assets import pipeline as asset_pipeline
+from assets import images as image_proxy
+
+# Import the Prometheus metrics, the request instrumentation and the
+# per-request trace spans reported in the Server-Timing header
+from monitoring import metrics, profiler, tracing
+from monitoring.instrument import instrument_app, metrics_authorized
+
+# Import the organ-tissue-gene expression store
+from expression import store as expression_store
+from expression import mie as mie_expression
+
 ################################################################################
 ### Configuration for BioStudies Integration
 # Change these variables to switch between collections
@@ -82,6 +111,38 @@ class RegexConverter(BaseConverter):
 
 
 app = Flask(__name__)
+app.jinja_env.globals["resolve_page_assets"] = resolve_page_assets
+app.jinja_env.globals["asset_url"] = asset_pipeline.asset_url
+app.jinja_env.globals["image_url"] = image_proxy.image_url
+instrument_app(app)
+tracing.trace_requests(app)
+profiler.profile_requests(app)
+deadline.apply_deadlines(app)
+ratelimit.prioritize_requests(app)
+
+
+# Content-hashed static files built by `python -m assets.pipeline`
+@app.route("/assets/<path:filename>")
+def hashed_asset(filename):
+    return asset_pipeline.send_asset(filename)
+
+
+# Resized WebP versions of tool logos and partner images, cached on disk,
+# e.g. /image?src=images/partners/HU.png&w=360
+@app.route("/image")
+def proxied_image():
+    try:
+        source = image_proxy.normalize_source(request.args.get("src", ""))
+    except image_proxy.ImageError as e:
+        return jsonify({"error": str(e)}), 400
+    width = image_proxy.choose_width(request.args.get("w", image_proxy.WIDTHS[-1], type=int))
+    try:
+        path, etag = image_proxy.get_image(source, width)
+    except image_proxy.ImageError as e:
+        return jsonify({"error": str(e)}), 404
+    except requests.RequestException as e:
+        return jsonify({"error": f"Fetching the image failed: {e}"}), 502
+    return send_file(path, mimetype="image/webp", etag=etag, max_age=24 * 3600)
 
 
 # Provide methods list to all templates for the Methods dropdown in the navbar
@@ -92,7 +153,7 @@ def inject_methods_menu():
     """
     try:
         url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/methods_index.json"
-        resp = requests.get(url, timeout=5)
+        resp = http.get(url, timeout=5)
         if resp.status_code != 200:
             return {"methods_menu": []}
         data = resp.json()
@@ -107,13 +168,24 @@ def inject_methods_menu():
         return {"methods_menu": []}
 
 
+# Versioned URL of the glossary index for glossary_highlighter.js
+@app.context_processor
+def inject_glossary_index_url():
+    """Never waits for the glossary: before the first load the URL is unversioned."""
+    snapshot = glossary_snapshot.peek()
+    if snapshot is None:
+        return {"glossary_index_url": "/glossary/index.json"}
+    return {"glossary_index_url": f"/glossary/index.json?v={snapshot.version}"}
+
+
 ################################################################################
 ### The landing page
 @app.route("/")
+@deadline.budget(10)
 def home():
     # get number of tools:
     url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/service_index.json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching service list: {response.status_code}", 503
@@ -141,6 +213,7 @@ def home():
 ################################################################################
 ### Pages under 'Data'
 @app.route("/data")
+@deadline.budget(15)
 def data():
     # Get query parameters for pagination and search
     page = request.args.get("page", 1, type=int)
@@ -211,11 +284,90 @@ def data():
         hits_returned=hits_returned,
         pages_fetched=pages_fetched,
         page_size_met=page_size_met,
+        incomplete=deadline.exceeded(),
         stage_explanations=STAGE_EXPLANATIONS,
         reg_question_explanations=REG_QUESTION_EXPLANATIONS,
     )
 
 
+
+# Organ-tissue-gene expression rows, e.g. /expression?gene=ENSG00000096433&min_level=Medium
+@app.route("/expression")
+def expression_rows():
+    """
+    Query parameters gene, gene_name, tissue, organ and level can be repeated
+    (or comma separated) to accept several values; offset and limit page the rows.
+    """
+    filters = {
+        name: [value.strip() for arg in request.args.getlist(name) for value in arg.split(",") if value.strip()]
+        for name in expression_store.INDEXED
+    }
+    min_level = request.args.get("min_level")
+    if min_level is not None and min_level not in expression_store.LEVELS:
+        return jsonify({"error": f"min_level must be one of {', '.join(expression_store.LEVELS)}"}), 400
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+
+    try:
+        store = expression_store.get_store()
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Expression data unavailable: {e}"}), 503
+    return jsonify(store.query(filters, min_level=min_level, offset=offset, limit=limit)), 200
+
+
+# Distinct values of one indexed expression column, e.g. /expression/values/organ
+@app.route("/expression/values/<name>")
+def expression_values(name):
+    if name not in expression_store.INDEXED:
+        abort(404)
+    try:
+        store = expression_store.get_store()
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Expression data unavailable: {e}"}), 503
+    return jsonify(store.values(name)), 200
+
+
+
+def mie_expression_filters():
+    """Read the aop, mie, gene and organ query parameters of the MIE expression routes."""
+    return {name: request.args.get(name) or None for name in ("aop", "mie", "gene", "organ")}
+
+
+# MIE -> model -> gene -> tissue expression rows, e.g. /expression/mie?aop=464&min_level=High
+@app.route("/expression/mie")
+def mie_expression_rows():
+    min_level = request.args.get("min_level")
+    if min_level is not None and min_level not in expression_store.LEVELS:
+        return jsonify({"error": f"min_level must be one of {', '.join(expression_store.LEVELS)}"}), 400
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+
+    try:
+        join = mie_expression.get_join()
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Expression data unavailable: {e}"}), 503
+    return jsonify(join.rows(offset=offset, limit=limit, min_level=min_level, **mie_expression_filters())), 200
+
+
+# Organs where the MIE genes are expressed, e.g. /expression/mie/organs?aop=464
+@app.route("/expression/mie/organs")
+def mie_expression_organs():
+    min_level = request.args.get("min_level", "Low")
+    if min_level not in expression_store.LEVELS:
+        return jsonify({"error": f"min_level must be one of {', '.join(expression_store.LEVELS)}"}), 400
+    try:
+        join = mie_expression.get_join()
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Expression data unavailable: {e}"}), 503
+    return jsonify(join.organs(min_level=min_level, **mie_expression_filters())), 200
+
+
 ################################################################################
 ### Pages under 'Tools'
 
@@ -315,11 +467,65 @@ def tools():
 """
 
 
+def normalize_tools(tools):
+    """Map the stage URLs of service_index.json entries to stage names and add
+    the URLs the tools page links to; the entries are updated in place."""
+    # Mapping the URLs with glossary IDs to their text values.
+    stage_mapping = {
+        "https://vhp4safety.github.io/glossary#VHP0000056": "ADME",
+        "https://vhp4safety.github.io/glossary#VHP0000102": "Hazard Assessment",
+        "https://vhp4safety.github.io/glossary#VHP0000148": "Chemical Information",
+        "https://vhp4safety.github.io/glossary#VHP0000149": "General",
+    }
+
+    for tool in tools:
+        full_stage_url = tool.get("stage", "")
+
+        # Writing the service name and stage values in the logs for troubleshooting.
+        # print(f"Tool: {tool['service']}, Stage URL: {full_stage_url}")  # Log the full URL
+
+        # Checking if the full URL is in the mapping and updating the stage.
+        if full_stage_url in stage_mapping:
+            # print(f"Mapping stage URL {full_stage_url} to {stage_mapping[full_stage_url]}")  # Log the mapping
+            tool["stage"] = stage_mapping[full_stage_url]
+        elif tool["stage"] in ["NA", "Unknown"]:
+            tool["stage"] = (
+                "Other"  # Combining "NA" and "Unknown" stages in a single stage-type, "Other".
+            )
+
+        html_name = tool.get("html_name")
+        md_name = tool.get("md_file_name")
+        png_name = tool.get("png_file_name")
+
+        tool["url"] = f"https://cloud.vhp4safety.nl/service/{html_name}"
+        tool["meta_data"] = (
+            f"https://raw.githubusercontent.com/VHP4Safety/cloud/main/docs/service/{md_name}"
+            if md_name
+            else "md file not found"
+        )
+
+        # Check if the tool has the placeholder logo
+        placeholder_logo = "https://github.com/VHP4Safety/ui-design/blob/main/static/images/logo.png"
+        if png_name == placeholder_logo:
+            tool["png"] = None  # set to None if it's the common placeholder
+        else:
+            tool["png"] = (
+                f"https://raw.githubusercontent.com/VHP4Safety/cloud/main/docs/service/{png_name}"
+                if not png_name.startswith("http")
+                else png_name
+            )
+
+        inst_url = tool.get("inst_url", "no_url")
+        if not inst_url:  # catches "" as well
+            inst_url = "no_url"
+        tool["inst_url"] = inst_url
+
+
 ### Here begins the updated version for creating the tool list page.
 @app.route("/tools")
 def tools():
     url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/service_index.json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching service list: {response.status_code}", 503
@@ -330,93 +536,47 @@ def tools():
         )  # Geting the service_list.json in the dictionary format.
         tools = list(tools.values())  # Converting the dictionary to a list object.
 
-        # Mapping the URLs with glossary IDs to their text values.
-        stage_mapping = {
-            "https://vhp4safety.github.io/glossary#VHP0000056": "ADME",
-            "https://vhp4safety.github.io/glossary#VHP0000102": "Hazard Assessment",
-            "https://vhp4safety.github.io/glossary#VHP0000148": "Chemical Information",
-            "https://vhp4safety.github.io/glossary#VHP0000149": "General",
-        }
+        with tracing.span("tools.normalize"):
+            normalize_tools(tools)
 
-        for tool in tools:
-            full_stage_url = tool.get("stage", "")
-
-            # Writing the service name and stage values in the logs for troubleshooting.
-            # print(f"Tool: {tool['service']}, Stage URL: {full_stage_url}")  # Log the full URL
-
-            # Checking if the full URL is in the mapping and updating the stage.
-            if full_stage_url in stage_mapping:
-                # print(f"Mapping stage URL {full_stage_url} to {stage_mapping[full_stage_url]}")  # Log the mapping
-                tool["stage"] = stage_mapping[full_stage_url]
-            elif tool["stage"] in ["NA", "Unknown"]:
-                tool["stage"] = (
-                    "Other"  # Combining "NA" and "Unknown" stages in a single stage-type, "Other".
-                )
-
-            html_name = tool.get("html_name")
-            md_name = tool.get("md_file_name")
-            png_name = tool.get("png_file_name")
-
-            tool["url"] = f"https://cloud.vhp4safety.nl/service/{html_name}"
-            tool["meta_data"] = (
-                f"https://raw.githubusercontent.com/VHP4Safety/cloud/main/docs/service/{md_name}"
-                if md_name
-                else "md file not found"
-            )
+        with tracing.span("tools.filter"):
+            # Getting selected stages from the URL.
+            selected_stages = request.args.getlist("stage")
 
-            # Check if the tool has the placeholder logo
-            placeholder_logo = "https://github.com/VHP4Safety/ui-design/blob/main/static/images/logo.png"
-            if png_name == placeholder_logo:
-                tool["png"] = None  # set to None if it's the common placeholder
-            else:
-                tool["png"] = (
-                    f"https://raw.githubusercontent.com/VHP4Safety/cloud/main/docs/service/{png_name}"
-                    if not png_name.startswith("http")
-                    else png_name
-                )
-
-            inst_url = tool.get("inst_url", "no_url")
-            if not inst_url:  # catches "" as well
-                inst_url = "no_url"
-            tool["inst_url"] = inst_url
-
-        # Getting selected stages from the URL.
-        selected_stages = request.args.getlist("stage")
-
-        # Filtering tools by selected stages.
-        if selected_stages:
-            tools = [tool for tool in tools if tool.get("stage") in selected_stages]
-
-        # Getting all unique stages from the tools for the filter options.
-        stages = sorted(set(tool.get("stage") for tool in tools if tool.get("stage")))
-
-        # Forcing "Other" to be the last item in the list of stages.
-        if "Other" in stages:
-            stages.remove("Other")
-            stages.append("Other")
+            # Filtering tools by selected stages.
+            if selected_stages:
+                tools = [tool for tool in tools if tool.get("stage") in selected_stages]
 
-        # Filtering over the regulatory questions.
-        reg_questions = { v["label"]: k for k, v in REG_QUESTIONS.items() }
+            # Getting all unique stages from the tools for the filter options.
+            stages = sorted(set(tool.get("stage") for tool in tools if tool.get("stage")))
 
-        selected_questions = request.args.getlist("reg_q")
+            # Forcing "Other" to be the last item in the list of stages.
+            if "Other" in stages:
+                stages.remove("Other")
+                stages.append("Other")
 
-        for question in selected_questions:
-            field = reg_questions.get(question)
-            if field:
-                tools = [
-                    tool for tool in tools if str(tool.get(field, "")).lower() == "true"
-                ]
+            # Filtering over the regulatory questions.
+            reg_questions = { v["label"]: k for k, v in REG_QUESTIONS.items() }
+
+            selected_questions = request.args.getlist("reg_q")
+
+            for question in selected_questions:
+                field = reg_questions.get(question)
+                if field:
+                    tools = [
+                        tool for tool in tools if str(tool.get(field, "")).lower() == "true"
+                    ]
 
-        # Getting the search query from URL to add a search bar based on tool names.
-        search_query = request.args.get("search", "").strip().lower()
+            # Getting the search query from URL to add a search bar based on tool names.
+            search_query = request.args.get("search", "").strip().lower()
 
-        # Filtering tools by search query.
-        if search_query:
-            tools = [
-                tool
-                for tool in tools
-                if search_query in tool.get("service", "").lower()
-            ]
+            # Filtering tools by search query.
+            if search_query:
+                tools = [
+                    tool
+                    for tool in tools
+                    if search_query in tool.get("service", "").lower()
+                ]
 
         return render_template(
             "tools/tools.html",
@@ -433,13 +593,59 @@ def tools():
         return f"Error processing service data: {e}", 500
 
 
+def normalize_methods(methods):
+    """
+    Normalize methods_index.json entries for the methods templates
+
+    Returns:
+        tuple: (normalized methods, set of the workflow stages used)
+    """
+    stages_set = set()
+    normalized = []
+    for m in methods:
+        norm = {}
+        norm["id"] = m.get("id", "")
+        # template expects 'service' and 'description'
+        norm["service"] = (
+            m.get("method")
+            or m.get("method_name_content")
+            or m.get("method_name")
+            or ""
+        )
+        norm["description"] = (
+            m.get("method_description_content")
+            or m.get("method_description")
+            or ""
+        )
+        # main_url used for method webpage (catalog page)
+        norm["main_url"] = m.get("catalog_webpage_url") or "no_url"
+        # interactive instance not present in methods index
+        norm["inst_url"] = m.get("inst_url") or "no_url"
+        # metadata md file not available in index; keep empty string
+        norm["meta_data"] = m.get("meta_data") or ""
+        # placeholder/no png
+        norm["png"] = None
+        # keep original raw data for potential details page
+        norm["raw"] = m
+
+        # collect stages (split comma-separated values)
+        stage_field = (m.get("vhp4safety_workflow_stage_content") or "").strip()
+        if stage_field:
+            for part in [s.strip() for s in stage_field.split(",")]:
+                if part:
+                    stages_set.add(part)
+
+        normalized.append(norm)
+    return normalized, stages_set
+
+
 ### New route to list methods (similar to the tools page)
 @app.route("/methods")
 @app.route("/methods/")
 def methods():
     """Fetch methods_index.json from the cloud repo, normalize fields and render a methods list page."""
     url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/methods_index.json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching methods list: {response.status_code}", 503
@@ -449,63 +655,30 @@ def methods():
         methods = list(methods.values())  # convert dict to list
 
         # Normalize fields for the template and collect stages
-        stages_set = set()
-        normalized = []
-        for m in methods:
-            norm = {}
-            norm["id"] = m.get("id", "")
-            # template expects 'service' and 'description'
-            norm["service"] = (
-                m.get("method")
-                or m.get("method_name_content")
-                or m.get("method_name")
-                or ""
-            )
-            norm["description"] = (
-                m.get("method_description_content")
-                or m.get("method_description")
-                or ""
-            )
-            # main_url used for method webpage (catalog page)
-            norm["main_url"] = m.get("catalog_webpage_url") or "no_url"
-            # interactive instance not present in methods index
-            norm["inst_url"] = m.get("inst_url") or "no_url"
-            # metadata md file not available in index; keep empty string
-            norm["meta_data"] = m.get("meta_data") or ""
-            # placeholder/no png
-            norm["png"] = None
-            # keep original raw data for potential details page
-            norm["raw"] = m
-
-            # collect stages (split comma-separated values)
-            stage_field = (m.get("vhp4safety_workflow_stage_content") or "").strip()
-            if stage_field:
-                for part in [s.strip() for s in stage_field.split(",")]:
-                    if part:
-                        stages_set.add(part)
-
-            normalized.append(norm)
-
-        # Apply search and filters similar to /tools
-        selected_stages = request.args.getlist("stage")
-        selected_questions = request.args.getlist("reg_q")
-        search_query = request.args.get("search", "").strip().lower()
-
-        methods_filtered = normalized
-
-        if selected_stages:
-            methods_filtered = [m for m in methods_filtered if any(s in ((m["raw"].get("vhp4safety_workflow_stage_content") or "").split(",")) for s in selected_stages)]
-
-        # Filter by regulatory questions if provided (REG_QUESTIONS keys map to internal fields)
-        reg_questions = { v["label"]: k for k, v in REG_QUESTIONS.items() }
-        if selected_questions:
-            for question in selected_questions:
-                field = reg_questions.get(question)
-                if field:
-                    methods_filtered = [m for m in methods_filtered if str(m["raw"].get(field, "")).lower() == "true"]
+        with tracing.span("methods.normalize"):
+            normalized, stages_set = normalize_methods(methods)
+
+        with tracing.span("methods.filter"):
+            # Apply search and filters similar to /tools
+            selected_stages = request.args.getlist("stage")
+            selected_questions = request.args.getlist("reg_q")
+            search_query = request.args.get("search", "").strip().lower()
+
+            methods_filtered = normalized
+
+            if selected_stages:
+                methods_filtered = [m for m in methods_filtered if any(s in ((m["raw"].get("vhp4safety_workflow_stage_content") or "").split(",")) for s in selected_stages)]
+
+            # Filter by regulatory questions if provided (REG_QUESTIONS keys map to internal fields)
+            reg_questions = { v["label"]: k for k, v in REG_QUESTIONS.items() }
+            if selected_questions:
+                for question in selected_questions:
+                    field = reg_questions.get(question)
+                    if field:
+                        methods_filtered = [m for m in methods_filtered if str(m["raw"].get(field, "")).lower() == "true"]
 
-        if search_query:
-            methods_filtered = [m for m in methods_filtered if search_query in m.get("service", "").lower()]
+            if search_query:
+                methods_filtered = [m for m in methods_filtered if search_query in m.get("service", "").lower()]
 
         stages = sorted(stages_set)
         if "Other" in stages:
@@ -534,7 +707,7 @@ def method_page(methodid):
     Method details are taken from methods_index.json (keyed by method id).
     """
     url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/methods_index.json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching methods list: {response.status_code}", 503
@@ -557,7 +730,7 @@ def method_page(methodid):
         + f"{encoded}.json"
     )
     try:
-        r = requests.get(raw_url, timeout=5)
+        r = http.get(raw_url, timeout=5)
         if r.status_code == 200:
             method_json = r.json()
         else:
@@ -576,11 +749,23 @@ def method_page(methodid):
     )
 
 
+# Resolve the labels of the ontology links on a method page in one request
+@app.route("/ontology/labels", methods=["POST"])
+def ontology_labels():
+    """Expects {"iris": [...]}; returns {"labels": {iri: {label, shortForm, url} or null}}."""
+    iris = (request.get_json(silent=True) or {}).get("iris")
+    if not isinstance(iris, list) or not all(isinstance(iri, str) for iri in iris):
+        return jsonify({"error": "Expected a JSON body with a list of IRIs under 'iris'"}), 400
+    if len(iris) > labels.MAX_BATCH:
+        return jsonify({"error": f"At most {labels.MAX_BATCH} IRIs per request"}), 400
+    return jsonify({"labels": labels.resolve_labels(iris)}), 200
+
+
 @app.route("/tools/<toolname>")
 def tool_page(toolname):
     # get the tools metadata:
     url = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/service_index.json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching service list: {response.status_code}", 503
@@ -599,7 +784,7 @@ def tool_page(toolname):
 
     # get the tools metadata:
     url = "https://cloud.vhp4safety.nl/service/" + toolname+ ".json"
-    response = requests.get(url)
+    response = http.get(url)
 
     if response.status_code != 200:
         return f"Error fetching service list: {response.status_code}", 503
@@ -615,14 +800,85 @@ def tool_page(toolname):
     # Pass the json filename to the template (for JS to pick up)
     return render_template("tools/tool.html", tool_json=tools[toolname], tool_details=tool_details)
 
+################################################################################
+### Rendered metadata files of tools and methods
+
+
+# The .md metadata file of a tool or method as a sanitized HTML fragment,
+# shown by metadata_modal.js, e.g. /metadata?url=https://raw.githubusercontent.com/...
+@app.route("/metadata")
+def metadata_fragment():
+    url = request.args.get("url", "")
+    try:
+        entry = metadata_html(url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.RequestException as e:
+        return jsonify({"error": f"Fetching the metadata failed: {e}"}), 502
+    if entry["html"] is None:
+        return jsonify({"error": f"No metadata file at {url}"}), 404
+
+    response = app.response_class(entry["html"], mimetype="text/html")
+    response.set_etag(entry["version"])
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+
+################################################################################
+### Glossary index for the term highlighter
+
+
+@app.route("/glossary/index.json")
+def glossary_index():
+    """
+    Serve the glossary terms and the precompiled term matcher
+
+    With ?v=<current version> the response never changes and is cached
+    for a year; other requests are revalidated against the version ETag.
+    """
+    try:
+        snapshot = glossary_snapshot.get()
+    except Exception as e:
+        return jsonify({"error": f"Glossary unavailable: {e}"}), 503
+
+    response = app.response_class(snapshot.index_json, mimetype="application/json")
+    response.set_etag(snapshot.version)
+    response.cache_control.public = True
+    if request.args.get("v") == snapshot.version:
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+
 ################################################################################
 ### Pages under 'Process Flow'
 
 
-# General Process Flow page
+# General Process Flow page; the steps come from the cached glossary snapshot.
+# If the glossary has not been loaded yet, process_flow.js fetches them from
+# /process_flow/steps.json instead of delaying the page.
 @app.route("/process_flow")
 def processflow():
-    return render_template("process_flow.html")
+    snapshot = glossary_snapshot.peek()
+    steps = snapshot.process_flow_steps if snapshot is not None else None
+    return render_template("process_flow.html", steps=steps)
+
+
+@app.route("/process_flow/steps.json")
+def process_flow_steps():
+    try:
+        snapshot = glossary_snapshot.get()
+    except Exception as e:
+        return jsonify({"error": f"Glossary unavailable: {e}"}), 503
+
+    response = jsonify({"version": snapshot.version, "steps": snapshot.process_flow_steps})
+    response.set_etag(snapshot.version)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
 
 
 ################################################################################
@@ -641,7 +897,15 @@ def casestudy_main(case):
     # Only allow known case studies
     if case not in CASESTUDIES:
         abort(404)
-    return render_template(f"case_studies/casestudy.html", case=case)
+    try:
+        ref = content_ref(
+            request.args.get("casestudybranch"), request.args.get("casestudycommit")
+        )
+    except ValueError:
+        abort(400)
+    # Inlined into the page, so casestudies.js does not fetch it from GitHub
+    content, _ = case_study_content(case, ref)
+    return render_template(f"case_studies/casestudy.html", case=case, content=content)
 
 
 @app.route("/workflow/<workflow>")
@@ -670,16 +934,26 @@ def show_compound(cwid):
         abort(404)
 
 
+def sparql_error_response(e):
+    """Map a SPARQL client error onto a JSON error response."""
+    if isinstance(e, sparql.SparqlTimeout):
+        return jsonify({"error": str(e)}), 504
+    if isinstance(e, sparql.SparqlUnavailable):
+        return jsonify({"error": str(e)}), 503
+    if isinstance(e, sparql.ResultTooLarge):
+        return jsonify({"error": str(e)}), 502
+    return jsonify({"error": str(e)}), 500
+
+
 @app.route("/get_compound_properties/<cwid>")
 def show_compounds_properties_as_json(cwid):
     if not is_valid_qid(cwid):
         return jsonify({"error": "Invalid compound identifier"}), 400
-    compoundwikiEP = "https://compoundcloud.wikibase.cloud/query/sparql"
     sparqlquery = (
         "PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>\n"
         "PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>\n\n"
         "SELECT ?cmp ?cmpLabel ?formula ?mass ?inchi ?inchiKey ?SMILES WHERE {\n"
-        "  VALUES ?cmp { wd:" + cwid + " }\n"
+        "  VALUES ?cmp { $cmp }\n"
         "  ?cmp wdt:P9 ?inchi ;\n"
         "       wdt:P10 ?inchiKey .\n"
         "  OPTIONAL { ?cmp wdt:P2 ?mass }\n"
@@ -691,24 +965,23 @@ def show_compounds_properties_as_json(cwid):
         "}"
     )
     try:
-        compound_dat = wbi_helpers.execute_sparql_query(
-            sparqlquery, endpoint=compoundwikiEP
+        compound_dat = sparql.compoundwiki().select(
+            sparqlquery, params={"cmp": sparql.PrefixedName("wd:" + cwid)}, max_rows=10
         )
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    if not bool(compound_dat):
+    except sparql.SparqlError as e:
+        return sparql_error_response(e)
+    if not compound_dat.rows:
         return jsonify({"error": "No data found"}), 404
-    compound_dat = compound_dat["results"]["bindings"][0]
-    # return jsonify(compound_dat);
+    compound_dat = compound_dat.dicts()[0]
     compound_list = [
         {
-            "wcid": compound_dat["cmp"]["value"],
-            "label": compound_dat["cmpLabel"]["value"],
-            "inchi": compound_dat["inchi"]["value"],
-            "inchikey": compound_dat["inchiKey"]["value"],
-            "SMILES": compound_dat["SMILES"]["value"],
-            "formula": compound_dat["formula"]["value"],
-            "mass": compound_dat["mass"]["value"],
+            "wcid": compound_dat["cmp"],
+            "label": compound_dat.get("cmpLabel") or "",
+            "inchi": compound_dat.get("inchi"),
+            "inchikey": compound_dat.get("inchiKey"),
+            "SMILES": compound_dat.get("SMILES") or "",
+            "formula": compound_dat.get("formula") or "",
+            "mass": compound_dat.get("mass") or "",
         }
     ]
     return jsonify(compound_list), 200
@@ -718,44 +991,13 @@ def show_compounds_properties_as_json(cwid):
 def show_compounds_identifiers_as_json(cwid):
     if not is_valid_qid(cwid):
         return jsonify({"error": "Invalid compound identifier"}), 400
-    compoundwikiEP = "https://compoundcloud.wikibase.cloud/query/sparql"
-    sparqlquery = (
-        "PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>\n"
-        "PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>\n\n"
-        "SELECT DISTINCT ?propertyLabel ?value ?formatterURL\n"
-        "WHERE {\n"
-        "  VALUES ?property { wd:P13 wd:P22 wd:P23 wd:P26 wd:P27 wd:P28 wd:P36 wd:P41 wd:P43 wd:P44 wd:P45 }\n"
-        "  ?property wikibase:directClaim ?valueProp .\n"
-        "  OPTIONAL { wd:" + cwid + " ?valueProp ?value }\n"
-        "  OPTIONAL { ?property wdt:P6 ?formatterURL }\n"
-        '  SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }\n'
-        "}"
-    )
+    # Property labels and formatter URLs come from the cached property catalog.
     try:
-        compound_dat = wbi_helpers.execute_sparql_query(
-            sparqlquery, endpoint=compoundwikiEP
+        compound_list = properties.compound_property_values(
+            cwid, properties.IDENTIFIER_PROPERTIES
         )
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    if len(compound_dat["results"]["bindings"]) == 0:
-        return jsonify({"error": "No data found"}), 404
-    compound_dat = compound_dat["results"]["bindings"]
-    # return jsonify(compound_dat)
-
-    compound_list = []
-    for expProp in compound_dat:
-        if "value" in expProp:
-            compound_list.append(
-                {
-                    "propertyLabel": expProp["propertyLabel"]["value"],
-                    "value": expProp["value"]["value"],
-                    "formatterURL": expProp["formatterURL"]["value"],
-                }
-            )
-        else:
-            compound_list.append(
-                {"propertyLabel": expProp["propertyLabel"]["value"], "value": "", "formatterURL": ""}
-            )
+    except sparql.SparqlError as e:
+        return sparql_error_response(e)
     return jsonify(compound_list), 200
 
 
@@ -763,126 +1005,125 @@ def show_compounds_identifiers_as_json(cwid):
 def show_compounds_toxicology_as_json(cwid):
     if not is_valid_qid(cwid):
         return jsonify({"error": "Invalid compound identifier"}), 400
-    compoundwikiEP = "https://compoundcloud.wikibase.cloud/query/sparql"
-    sparqlquery = (
-        "PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>\n"
-        "PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>\n\n"
-        "SELECT DISTINCT ?propertyLabel ?value ?formatterURL\n"
-        "WHERE {\n"
-        "  VALUES ?property { wd:P17 wd:P19 wd:P4 }\n"
-        "  ?property wikibase:directClaim ?valueProp .\n"
-        "  OPTIONAL { wd:" + cwid + " ?valueProp ?value }\n"
-        "  OPTIONAL { ?property wdt:P6 ?formatterURL }\n"
-        '  SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }\n'
-        "}"
-    )
     try:
-        compound_dat = wbi_helpers.execute_sparql_query(
-            sparqlquery, endpoint=compoundwikiEP
+        compound_list = properties.compound_property_values(
+            cwid, properties.TOXICOLOGY_PROPERTIES
         )
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    if len(compound_dat["results"]["bindings"]) == 0:
-        return jsonify({"error": "No data found"}), 404
-    compound_dat = compound_dat["results"]["bindings"]
-    # return jsonify(compound_dat)
-
-    compound_list = []
-    for expProp in compound_dat:
-        print(expProp)
-        if "value" in expProp:
-            compound_list.append(
-                {
-                    "propertyLabel": expProp["propertyLabel"]["value"],
-                    "value": expProp["value"]["value"]
-                }
-            )
-        else:
-            compound_list.append(
-                {"propertyLabel": expProp["propertyLabel"]["value"], "value": ""}
-            )
+    except sparql.SparqlError as e:
+        return sparql_error_response(e)
+    compound_list = [
+        {"propertyLabel": prop["propertyLabel"], "value": prop["value"]}
+        for prop in compound_list
+    ]
     return jsonify(compound_list), 200
 
 
 @app.route("/get_compound_expdata/<cwid>")
 def show_compounds_expdata_as_json(cwid):
+    """Experimental data of a compound from Wikidata.
+
+    view=summary aggregates the values per property and unit, view=rows
+    returns one page of the raw rows (page, page_size, property, unit).
+    Without a view all raw rows are returned as a list.
+    """
     if not is_valid_qid(cwid):
         return jsonify({"error": "Invalid compound identifier"}), 400
-    compoundwikiEP = "https://compoundcloud.wikibase.cloud/query/sparql"
-    sparqlquery = (
-        "PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>\n"
-        "PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>\n"
-        "PREFIX wid: <http://www.wikidata.org/entity/>\n"
-        "PREFIX widt: <http://www.wikidata.org/prop/direct/>\n"
-        "PREFIX prov: <http://www.w3.org/ns/prov#>\n\n"
-        "SELECT ?qid WHERE {\n"
-        "  wd:P5 wikibase:directClaim ?identifierProp .\n"
-        "  wd:" + cwid + " ?identifierProp ?wikidata .\n"
-        '  BIND (iri(CONCAT("http://www.wikidata.org/entity/", ?wikidata)) AS ?qid)\n'
-        "}"
-    )
+    view = request.args.get("view", "", type=str)
+    if view not in ("", "summary", "rows"):
+        return jsonify({"error": "view must be 'summary' or 'rows'"}), 400
+    # The Compound Wiki -> Wikidata mapping is loaded in bulk and kept in memory.
     try:
-        compound_dat = wbi_helpers.execute_sparql_query(
-            sparqlquery, endpoint=compoundwikiEP
-        )
+        wikidata_qid = idmap.wikidata_qid(cwid)
+    except sparql.SparqlError as e:
+        return sparql_error_response(e)
+    if not wikidata_qid:
+        return jsonify({"error": "No data found"}), 404
+    try:
+        compound_list = expdata.fetch_expdata(wikidata_qid)
+    except sparql.SparqlError as e:
+        return sparql_error_response(e)
+
+    if view == "summary":
+        return jsonify(expdata.summarize(compound_list)), 200
+    if view == "rows":
+        page = max(request.args.get("page", 1, type=int), 1)
+        page_size = min(max(request.args.get("page_size", 50, type=int), 1), 500)
+        return jsonify(
+            expdata.paginate(
+                compound_list,
+                page=page,
+                page_size=page_size,
+                prop=request.args.get("property"),
+                units=request.args.get("unit"),
+            )
+        ), 200
+    return jsonify(compound_list), 200
+
+
+@app.route("/get_compound_similar/<cwid>")
+def show_similar_compounds_as_json(cwid):
+    """Return the compounds most similar to the given compound (Tanimoto on path fingerprints)."""
+    if not is_valid_qid(cwid):
+        return jsonify({"error": "Invalid compound identifier"}), 400
+    k = min(max(request.args.get("k", 10, type=int), 1), 100)
+    threshold = request.args.get("threshold", 0.0, type=float)
+    try:
+        index = similarity.get_index()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    if not bool(compound_dat):
-        return jsonify({"error": "No data found"}), 404
-    if len(compound_dat["results"]["bindings"]) == 0:
-        return jsonify({"error": "No data found"}), 404
-    compound_dat = compound_dat["results"]["bindings"][0]
-    qid = compound_dat["qid"]["value"]
-    # the next query may be affected by https://github.com/ad-freiburg/qlever-control/issues/187
-    sparqlquery = (
-        "PREFIX wd: <http://www.wikidata.org/entity/>\n"
-        "PREFIX wdt: <http://www.wikidata.org/prop/direct/>\n"
-        "PREFIX prov: <http://www.w3.org/ns/prov#>\n"
-        "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>\n"
-        "PREFIX pr: <http://www.wikidata.org/prop/reference/>\n"
-        "PREFIX wikibase: <http://wikiba.se/ontology#>\n\n"
-        "SELECT DISTINCT ?propEntityLabel ?value ?unitsLabel ?source ?doi ?statement\n"
-        "WHERE {\n"
-        "    <" + qid + "> ?propp ?statement .\n"
-        "    ?statement a wikibase:BestRank ;\n"
-        "      ?proppsv [ wikibase:quantityAmount ?value ; wikibase:quantityUnit ?units ] .\n"
-        "    #OPTIONAL { ?statement prov:wasDerivedFrom/pr:P248 ?sourceTmp . OPTIONAL { ?sourceTmp wdt:P356 ?doiTmp . } }\n"
-        "    ?property wikibase:claim ?propp ; wikibase:statementValue ?proppsv ; wdt:P1629 ?propEntity ; wdt:P31 wd:Q21077852 .\n"
-        "    ?propEntity @en@rdfs:label ?propEntityLabel .\n"
-        "    ?units @en@rdfs:label ?unitsLabel .\n"
-        '    BIND (COALESCE(IF(BOUND(?sourceTmp), ?sourceTmp, 1/0), "") AS ?source)\n'
-        '    BIND (COALESCE(IF(BOUND(?doiTmp), ?doiTmp, 1/0), "") AS ?doi)\n'
-        "}"
-    )
-    # return sparqlquery
+    query_fp = index.fingerprint_of(cwid)
+    if query_fp is None:
+        return jsonify({"error": "No SMILES found for this compound"}), 404
+    return jsonify(index.top_k(query_fp, k=k, threshold=threshold, exclude=cwid)), 200
+
+
+@app.route("/search_compounds")
+def search_compounds_as_json():
+    """Search the compound catalog by SMILES.
+
+    mode=similarity (default) returns the top-k most similar compounds,
+    mode=substructure returns the compounds passing the substructure screen.
+    """
+    smiles = request.args.get("smiles", "", type=str).strip()
+    mode = request.args.get("mode", "similarity", type=str)
+    k = min(max(request.args.get("k", 10, type=int), 1), 100)
+    if not smiles:
+        return jsonify({"error": "A SMILES query is required"}), 400
+    if mode not in ("similarity", "substructure"):
+        return jsonify({"error": "mode must be 'similarity' or 'substructure'"}), 400
     try:
-        sparqlqueryURL = (
-            "https://qlever.cs.uni-freiburg.de/api/wikidata?format=json&query="
-            + urllib.parse.quote_plus(sparqlquery)
-        )
-        # return sparqlqueryURL
-        compound_dat = requests.get(sparqlqueryURL)
-        # return json.loads(compound_dat.content)
+        query_fp = similarity.smiles_fingerprint(smiles)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid SMILES: {e}"}), 400
+    try:
+        index = similarity.get_index()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    if not bool(compound_dat):
-        return jsonify({"error": "No data found"}), 404
-    compound_dat = json.loads(compound_dat.content)["results"]["bindings"]
-    # return jsonify(compound_dat)
-    compound_list = []
-    for expProp in compound_dat:
-        # return jsonify(expProp)
-        compound_list.append(
-            {
-                "propEntityLabel": expProp["propEntityLabel"]["value"],
-                "value": expProp["value"]["value"],
-                "unitsLabel": expProp["unitsLabel"]["value"],
-                "source": expProp["source"]["value"],
-                "doi": expProp["doi"]["value"],
-                "seeAlso": expProp["statement"]["value"],
-            }
-        )
-    return jsonify(compound_list), 200
+    if mode == "substructure":
+        candidates, total = index.substructure_candidates(query_fp, limit=k)
+        return jsonify({"total": total, "candidates": candidates}), 200
+    threshold = request.args.get("threshold", 0.0, type=float)
+    return jsonify(index.top_k(query_fp, k=k, threshold=threshold)), 200
+
+
+################################################################################
+### Monitoring
+
+
+# Request, upstream and cache metrics in the Prometheus text format; 404
+# without VHP_METRICS_TOKEN, or from other than loopback when none is set
+@app.route("/metrics")
+def prometheus_metrics():
+    if not metrics_authorized():
+        abort(404)
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Flamegraphs stored by the profiler (VHP_PROFILE_TOKEN required), e.g.
+# /profiles/continuous.svg?profile=<token>
+@app.route("/profiles/<name>")
+def stored_profile(name):
+    return profiler.profile_response(name)
 
 
 ################################################################################
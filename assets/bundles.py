@@ -0,0 +1,34 @@
+from assets.pipeline import asset_url
+
+
+# Asset bundles a page template can ask for with {% set page_assets = [...] %}
+# (after its extends tag). Eager bundles are included by base.html; lazy ones
+# are only loaded when a script calls LazyAssets.load(name) or
+# LazyAssets.whenVisible(element, name) from static/js/lazy_assets.js.
+BUNDLES = {
+    # Molecular viewer of the compound page; its j2s tree is loaded by JSmol itself.
+    "jsmol": {"scripts": ["js/JSmol.min.js"], "lazy": True},
+}
+
+
+def resolve_page_assets(names):
+    """
+    Resolve the asset bundles declared by a page template
+
+    Args:
+        names (list): Names of bundles in BUNDLES
+
+    Returns:
+        dict: 'scripts' (URLs of eager scripts, in order) and 'lazy'
+            ({bundle name: {"scripts": [URL, ...]}} for lazy_assets.js)
+    """
+    scripts = []
+    lazy = {}
+    for name in dict.fromkeys(names):
+        bundle = BUNDLES[name]
+        urls = [asset_url(filename) for filename in bundle["scripts"]]
+        if bundle.get("lazy"):
+            lazy[name] = {"scripts": urls}
+        else:
+            scripts.extend(urls)
+    return {"scripts": scripts, "lazy": lazy}
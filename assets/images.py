@@ -0,0 +1,220 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+import requests
+from flask import url_for
+from PIL import Image, ImageOps
+
+from assets.pipeline import STATIC_DIR
+from monitoring import metrics
+from upstream import http
+from upstream.diskcache import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images")
+# Widths an image can be resized to; other requested widths are rounded up.
+WIDTHS = (120, 240, 360, 480, 720, 960)
+# Remote images are only fetched from the VHP4Safety repositories on GitHub
+# and the VHP4Safety cloud.
+ALLOWED_PREFIXES = ("https://raw.githubusercontent.com/VHP4Safety/", "https://cloud.vhp4safety.nl/")
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+# Size of the resized images kept on disk; the least recently written are removed above it.
+MAX_CACHE_BYTES = int(os.environ.get("VHP_IMAGE_CACHE_MB", 256)) * 1024 * 1024
+REVALIDATE_AFTER = 24 * 3600  # Seconds before a remote source is checked for changes.
+WEBP_QUALITY = 80
+
+
+class ImageError(Exception):
+    """The image source is not allowed or cannot be converted."""
+
+
+def normalize_source(src):
+    """
+    Return the canonical source of an image: a URL under ALLOWED_PREFIXES,
+    or a path relative to static/ (e.g. images/partners/HU.png)
+
+    Raises:
+        ImageError: If the source is not allowed
+    """
+    parts = urllib.parse.urlsplit(src)
+    if parts.scheme in ("http", "https"):
+        if (
+            not src.startswith(ALLOWED_PREFIXES)
+            or ".." in urllib.parse.unquote(parts.path).split("/")
+            or parts.query
+            or parts.fragment
+        ):
+            raise ImageError(f"Images from {src} are not proxied")
+        return src
+    if parts.scheme or parts.netloc:
+        raise ImageError(f"Unsupported image source: {src}")
+    path = os.path.normpath(urllib.parse.unquote(parts.path).lstrip("./").replace("\\", "/"))
+    if path.startswith("static/"):
+        path = path[len("static/"):]
+    if not path.startswith("images/") or ".." in path.split("/"):
+        raise ImageError(f"Only files under static/images can be proxied: {src}")
+    return path
+
+
+def choose_width(width):
+    """Round a requested width up to the next width in WIDTHS."""
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def image_url(src, width):
+    """
+    Return the proxy URL of an image at the given display width, or src
+    itself if it cannot be proxied
+    """
+    if not src:
+        return src
+    try:
+        source = normalize_source(src)
+    except ImageError:
+        return src
+    return url_for("proxied_image", src=source, w=choose_width(width))
+
+
+def _read_source(source, meta):
+    """Return (bytes or None if unchanged, upstream etag)."""
+    if not source.startswith(("http://", "https://")):
+        path = os.path.join(STATIC_DIR, source)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise ImageError(f"No such image: {source}")
+        version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if meta and meta.get("upstream_etag") == version:
+            return None, version
+        with open(path, "rb") as f:
+            return f.read(), version
+
+    headers = {"User-Agent": "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"}
+    if meta and meta.get("upstream_etag"):
+        headers["If-None-Match"] = meta["upstream_etag"]
+    with http.get(source, headers=headers, timeout=15, stream=True) as response:
+        if response.status_code == 304 and meta:
+            return None, meta["upstream_etag"]
+        if response.status_code == 404:
+            raise ImageError(f"No such image: {source}")
+        response.raise_for_status()
+        data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ImageError(f"Image too large: {source}")
+    return data, response.headers.get("ETag")
+
+
+def to_webp(data, width):
+    """
+    Resize an image to at most width pixels wide and encode it as WebP
+
+    Raises:
+        ImageError: If the data is not an image Pillow can read
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=WEBP_QUALITY, method=4)
+            return out.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageError(f"Cannot convert image: {e}")
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _evict(keep):
+    """Remove the least recently written images until the cache fits in MAX_CACHE_BYTES."""
+    files = []
+    total = 0
+    with os.scandir(IMAGE_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".webp"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    for _, size, path in sorted(files):
+        if total <= MAX_CACHE_BYTES:
+            break
+        if path == keep:
+            continue
+        for name in (path, path[: -len(".webp")] + ".json"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+        total -= size
+
+
+def get_image(source, width):
+    """
+    Return a resized WebP version of an image, from the disk cache if possible
+
+    Args:
+        source (str): Source as returned by normalize_source
+        width (int): One of WIDTHS
+
+    Returns:
+        tuple: (path of the WebP file, strong ETag)
+
+    Raises:
+        ImageError: If the source does not exist or cannot be converted
+        requests.RequestException: If a remote source cannot be fetched and
+            was never cached
+    """
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    key = hashlib.sha256(f"{source}|{width}".encode("utf-8")).hexdigest()
+    path = os.path.join(IMAGE_CACHE_DIR, key + ".webp")
+    meta_path = os.path.join(IMAGE_CACHE_DIR, key + ".json")
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+    if meta is not None and not os.path.exists(path):
+        meta = None
+
+    is_remote = source.startswith(("http://", "https://"))
+    if meta is not None and is_remote and time.time() - meta["checked"] < REVALIDATE_AFTER:
+        metrics.CACHE_LOOKUPS.inc(cache="images", result="hit")
+        return path, meta["etag"]
+
+    try:
+        data, upstream_etag = _read_source(source, meta)
+    except requests.RequestException as e:
+        if meta is None:
+            raise
+        logger.warning("Revalidating image %s failed, serving cached copy: %s", source, e)
+        metrics.CACHE_LOOKUPS.inc(cache="images", result="hit")
+        return path, meta["etag"]
+
+    metrics.CACHE_LOOKUPS.inc(cache="images", result="hit" if data is None else "miss")
+    if data is not None:
+        webp = to_webp(data, width)
+        meta = {"etag": hashlib.sha256(webp).hexdigest()[:32], "upstream_etag": upstream_etag}
+        _write(path, webp)
+    meta["checked"] = time.time()
+    _write(meta_path, json.dumps(meta).encode("utf-8"))
+    if data is not None:
+        _evict(keep=path)
+    return path, meta["etag"]
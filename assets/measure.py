@@ -0,0 +1,135 @@
+"""
+Measure the scripts and stylesheets a page loads before any user interaction
+
+    python -m assets.measure / /compound/Q37
+    python -m assets.measure --base-url http://localhost:5050 / /tools /data
+
+For every page the transferred bytes (raw and gzip-compressed) of its
+<script src> and stylesheet assets are reported, and the JavaScript compile
+time when Node.js is available. Without --base-url the pages are rendered
+with the Flask test client; lazily loaded bundles are not counted.
+"""
+
+import argparse
+import gzip
+import html.parser
+import json
+import shutil
+import subprocess
+import sys
+import urllib.parse
+
+import requests
+
+
+# Compiles the scripts given on stdin (JSON list of sources) and prints the
+# total compile time in milliseconds.
+NODE_PARSE_TIMER = """
+const vm = require('vm');
+const sources = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const start = process.hrtime.bigint();
+for (const source of sources) { new vm.Script(source); }
+console.log(Number(process.hrtime.bigint() - start) / 1e6);
+"""
+
+
+class AssetCollector(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.scripts = []
+        self.styles = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script" and attrs.get("src"):
+            self.scripts.append(attrs["src"])
+        elif tag == "link" and "stylesheet" in (attrs.get("rel") or "") and attrs.get("href"):
+            self.styles.append(attrs["href"])
+
+
+def _fetcher(base_url):
+    if base_url:
+        session = requests.Session()
+
+        def fetch(url):
+            response = session.get(urllib.parse.urljoin(base_url, url), timeout=30)
+            response.raise_for_status()
+            return response.content
+
+        return fetch
+
+    from app import app
+
+    client = app.test_client()
+
+    def fetch(url):
+        if urllib.parse.urlsplit(url).netloc:
+            response = requests.get(url if "://" in url else "https:" + url, timeout=30)
+            response.raise_for_status()
+            return response.content
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code}")
+        return response.get_data()
+
+    return fetch
+
+
+def _parse_time(sources):
+    node = shutil.which("node")
+    if node is None:
+        return None
+    result = subprocess.run(
+        [node, "-e", NODE_PARSE_TIMER], input=json.dumps(sources), capture_output=True, text=True
+    )
+    return float(result.stdout) if result.returncode == 0 else None
+
+
+def measure_page(fetch, path):
+    """
+    Returns:
+        dict: Number of 'scripts' and 'styles', their 'bytes' and
+            'gzip_bytes', and 'parse_ms' (None without Node.js)
+    """
+    collector = AssetCollector()
+    collector.feed(fetch(path).decode("utf-8", "replace"))
+    total = compressed = 0
+    sources = []
+    for url in collector.scripts + collector.styles:
+        try:
+            body = fetch(url)
+        except Exception as e:
+            print(f"  {path}: skipping {url} ({e})", file=sys.stderr)
+            continue
+        total += len(body)
+        compressed += len(gzip.compress(body))
+        if url in collector.scripts:
+            sources.append(body.decode("utf-8", "replace"))
+    return {
+        "scripts": len(collector.scripts),
+        "styles": len(collector.styles),
+        "bytes": total,
+        "gzip_bytes": compressed,
+        "parse_ms": _parse_time(sources),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="Page paths, e.g. / /compound/Q37")
+    parser.add_argument("--base-url", help="Measure a running server instead of the test client")
+    args = parser.parse_args(argv)
+
+    fetch = _fetcher(args.base_url)
+    print(f"{'page':<24} {'scripts':>7} {'styles':>6} {'KiB':>9} {'gzip KiB':>9} {'parse ms':>9}")
+    for path in args.paths:
+        m = measure_page(fetch, path)
+        parse = f"{m['parse_ms']:.1f}" if m["parse_ms"] is not None else "n/a"
+        print(
+            f"{path:<24} {m['scripts']:>7} {m['styles']:>6} {m['bytes'] / 1024:>9.1f} "
+            f"{m['gzip_bytes'] / 1024:>9.1f} {parse:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped without the brotli package.
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT_DIR, "static")
+DIST_DIR = os.environ.get("VHP_ASSET_DIR", os.path.join(ROOT_DIR, "dist"))
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# JSmol loads its j2s tree itself, from fixed paths under j2sPath.
+EXCLUDE = ("js/j2s/",)
+COMPRESSIBLE = {".css", ".csv", ".html", ".js", ".json", ".md", ".svg", ".txt", ".ttl"}
+MIN_COMPRESS_SIZE = 256  # Smaller files are not worth a compressed variant.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def hashed_name(filename, digest):
+    """Return filename with the first 12 hex digits of its content hash before the extension."""
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{digest[:12]}{ext}"
+
+
+def _write(path, data):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """
+    Copy the static files to content-hashed names with precompressed variants
+
+    Every file under static_dir (except EXCLUDE) is written to dist_dir as
+    e.g. js/search_bar.3f2a1b9c0d4e.js, text files also with .gz and .br
+    variants when those are smaller. Files of earlier builds are kept, so
+    pages rendered before a deploy keep working.
+
+    Returns:
+        dict: The manifest, {static filename: hashed filename}
+    """
+    manifest = {}
+    for directory, _, files in os.walk(static_dir):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            if filename.startswith(EXCLUDE):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            target = hashed_name(filename, hashlib.sha256(data).hexdigest())
+            out_path = os.path.join(dist_dir, target)
+            _write(out_path, data)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(compressed) < len(data):
+                    _write(out_path + ".gz", compressed)
+                if brotli is not None:
+                    compressed = brotli.compress(data, quality=11)
+                    if len(compressed) < len(data):
+                        _write(out_path + ".br", compressed)
+            manifest[filename] = target
+
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest_path = os.path.join(dist_dir, "manifest.json")
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+_manifest = {}
+_manifest_mtime = None
+_lock = threading.Lock()
+
+
+def load_manifest():
+    """Return the manifest of the last build, or {} if assets were never built."""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return {}
+    if mtime != _manifest_mtime:
+        with _lock:
+            if mtime != _manifest_mtime:
+                with open(MANIFEST_PATH, encoding="utf-8") as f:
+                    _manifest = json.load(f)
+                _manifest_mtime = mtime
+    return _manifest
+
+
+def asset_url(filename):
+    """
+    Return the URL of a static file, e.g. asset_url('css/base.css')
+
+    Built assets are served under their content-hashed name from /assets/;
+    without a build (or for files added since) the plain /static/ URL is used.
+    """
+    hashed = load_manifest().get(filename)
+    if hashed is None:
+        return url_for("static", filename=filename)
+    return url_for("hashed_asset", filename=hashed)
+
+
+def send_asset(filename):
+    """
+    Send a built asset, precompressed if the client accepts it
+
+    The content of a hashed name never changes, so it is cached as immutable.
+    """
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+    for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+        path = safe_join(DIST_DIR, filename + suffix)
+        if candidate in request.accept_encodings and path is not None and os.path.isfile(path):
+            encoding = candidate
+            filename += suffix
+            break
+
+    response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    manifest = build()
+    logger.info("Built %d assets into %s", len(manifest), DIST_DIR)
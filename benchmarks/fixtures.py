@@ -0,0 +1,345 @@
+"""
+Fixture payloads of the benchmark suite
+
+Every fixture exists in two forms: a synthetic payload generated from a
+fixed seed, shaped like the documented upstream responses, and optionally
+a recorded copy of a live response in benchmarks/recorded/. No recorded
+copies are committed, so the synthetic fixtures are the reference of the
+suite and the numbers of saved runs refer to them. Recorded copies are
+used when present; record them (network access required) with
+
+    python -m benchmarks.fixtures --record
+
+and compare runs on recorded fixtures only with runs on the same
+recordings (run saves the source and digest of every fixture).
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+
+import requests
+
+
+RECORDED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded")
+SEED = 4242
+
+SERVICE_INDEX_URL = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/service_index.json"
+METHODS_INDEX_URL = "https://raw.githubusercontent.com/VHP4Safety/cloud/refs/heads/main/cap/methods_index.json"
+BIOSTUDIES_API = "https://www.ebi.ac.uk/biostudies/api/v1"
+QLEVER_WIKIDATA_EP = "https://qlever.cs.uni-freiburg.de/api/wikidata"
+SMALL_STUDY = "S-TOXR1735"
+EXPDATA_COMPOUND = "Q2270"
+
+STAGE_URLS = [
+    "https://vhp4safety.github.io/glossary#VHP0000056",
+    "https://vhp4safety.github.io/glossary#VHP0000102",
+    "https://vhp4safety.github.io/glossary#VHP0000148",
+    "https://vhp4safety.github.io/glossary#VHP0000149",
+    "NA",
+    "Unknown",
+]
+REG_QUESTION_FIELDS = ["reg_q_1a", "reg_q_1b", "reg_q_2a", "reg_q_2b", "reg_q_3a", "reg_q_3b"]
+CASE_STUDIES = ["Thyroid", "Kidney", "Parkinson", ""]
+FLOW_STEPS = ["ADME", "Hazard Assessment", "Chemical Information", "(External) exposure", ""]
+WORDS = (
+    "toxicity assay exposure kidney thyroid neuron liver hepatocyte dose response viability "
+    "compound cisplatin dinoseb silychristin model pathway transcriptomics endpoint luminescence"
+).split()
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+################################################################################
+### Synthetic payloads
+
+
+def study(rng, files, authors, organizations, protocols, attributes):
+    """A BioStudies study as returned by /studies/<accession>."""
+    orgs = [
+        {
+            "accno": f"ORG{i}",
+            "type": "Organization",
+            "attributes": [{"name": "Name", "value": f"Organization {i} {_text(rng, 2)}"}],
+        }
+        for i in range(organizations)
+    ]
+    people = [
+        {
+            "type": "Author",
+            "attributes": [
+                {"name": "Name", "value": f"Author {i}"},
+                {"name": "E-mail", "value": f"author{i}@example.org"},
+                {"name": "Role", "value": "investigator"},
+                {"name": "affiliation", "value": f"ORG{rng.randrange(max(organizations, 1))}", "reference": True},
+            ],
+        }
+        for i in range(authors)
+    ]
+    protocol_section = {
+        "type": "Protocols",
+        "subsections": [
+            {
+                "type": "Protocol",
+                "description": _text(rng, 12),
+                "attributes": [{"name": "Name", "value": f"Protocol {i}"}, {"name": "Description", "value": _text(rng, 20)}],
+            }
+            for i in range(protocols)
+        ],
+    }
+    # Large studies spread their files over nested subsections.
+    file_sections = []
+    for start in range(0, files, 500):
+        file_sections.append(
+            {
+                "type": "Data",
+                "attributes": [{"name": "Time point", "value": f"{start // 500} h"}],
+                "files": [
+                    {
+                        "path": f"data/part{start // 500}/file_{i}.png",
+                        "size": rng.randrange(1000, 50000),
+                        "type": "file",
+                        "attributes": [
+                            {"name": "Type", "value": "image file"},
+                            {"name": "Description", "value": "dose-response plot"},
+                        ],
+                    }
+                    for i in range(start, min(start + 500, files))
+                ],
+            }
+        )
+    section_attributes = [
+        {"name": "Title", "value": _text(rng, 6)},
+        {"name": "Organism", "value": "human"},
+        {"name": "Organ", "value": rng.choice(["brain", "kidney", "thyroid", "liver"])},
+        {"name": "Cell type", "value": "cell line"},
+        {"name": "Assay", "value": "ATP"},
+    ] + [
+        {"name": rng.choice(["Compound", "Endpoint definition", "Treatment", "Exposure time"]), "value": _text(rng, 2)}
+        for _ in range(attributes)
+    ]
+    return {
+        "accno": f"S-SYN{rng.randrange(10000)}",
+        "type": "submission",
+        "attributes": [
+            {"name": "ReleaseDate", "value": "2024-03-27"},
+            {"name": "AttachTo", "value": "VHP4Safety"},
+            {"name": "Case Study", "value": rng.choice(CASE_STUDIES)},
+            {"name": "Regulatory Question", "value": rng.choice(REG_QUESTION_FIELDS)},
+            {"name": "Flow Step", "value": rng.choice(FLOW_STEPS)},
+        ],
+        "section": {
+            "type": "Study",
+            "attributes": section_attributes,
+            "links": [{"url": f"https://doi.org/10.1000/{i}", "type": "DOI"} for i in range(5)],
+            "subsections": orgs + people + [protocol_section] + file_sections,
+        },
+        "links": [{"url": f"https://pubmed.example.org/{i}", "type": "pubmed", "description": "publication"} for i in range(3)],
+    }
+
+
+def biostudies_hits(rng, count):
+    """Search hits with loaded metadata, as passed to BioStudiesExtractor._apply_filters."""
+    return [
+        {
+            "accession": f"S-SYN{i}",
+            "type": "study",
+            "title": _text(rng, 6),
+            "metadata": {
+                "accession": f"S-SYN{i}",
+                "case_study": rng.choice(CASE_STUDIES),
+                "regulatory_question": rng.choice(REG_QUESTION_FIELDS),
+                "flow_step": rng.choice(FLOW_STEPS),
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def service_index(rng, count):
+    """service_index.json of the cloud repository."""
+    index = {}
+    for i in range(count):
+        png = rng.choice(
+            [f"tool{i}.png", "https://github.com/VHP4Safety/ui-design/blob/main/static/images/logo.png", f"https://example.org/{i}.png"]
+        )
+        index[f"tool{i}"] = {
+            "service": f"Tool {i} {_text(rng, 2)}",
+            "description": _text(rng, 25),
+            "stage": rng.choice(STAGE_URLS),
+            "html_name": f"tool{i}.html",
+            "md_file_name": rng.choice([f"tool{i}.md", ""]),
+            "png_file_name": png,
+            "inst_url": rng.choice(["", f"https://tool{i}.cloud.vhp4safety.nl"]),
+            **{field: rng.choice(["true", "false"]) for field in REG_QUESTION_FIELDS},
+        }
+    return index
+
+
+def methods_index(rng, count):
+    """methods_index.json of the cloud repository."""
+    stages = ["ADME", "Hazard Assessment", "Chemical Information", "Other"]
+    return {
+        f"method{i}": {
+            "id": f"method{i}",
+            "method": f"Method {i} {_text(rng, 2)}",
+            "method_description_content": _text(rng, 40),
+            "catalog_webpage_url": rng.choice(["", f"https://example.org/method{i}"]),
+            "vhp4safety_workflow_stage_content": ", ".join(rng.sample(stages, rng.randrange(0, 3))),
+            **{field: rng.choice(["true", "false"]) for field in REG_QUESTION_FIELDS},
+        }
+        for i in range(count)
+    }
+
+
+def qlever_expdata(rng, count):
+    """SPARQL JSON results of compounds.expdata.EXPDATA_QUERY, as bytes."""
+    properties = [f"property {i}" for i in range(40)]
+    units = ["milligram per kilogram", "micromolar", "degree Celsius", "gram per mole"]
+    bindings = []
+    for i in range(count):
+        value = f"{rng.uniform(0, 1000):.4f}" if rng.random() > 0.05 else "unknown"
+        binding = {
+            "propEntityLabel": {"type": "literal", "value": rng.choice(properties), "xml:lang": "en"},
+            "value": {"type": "literal", "value": value, "datatype": "http://www.w3.org/2001/XMLSchema#decimal"},
+            "unitsLabel": {"type": "literal", "value": rng.choice(units), "xml:lang": "en"},
+            "source": {"type": "literal", "value": rng.choice(["", f"https://www.wikidata.org/entity/Q{i}"])},
+            "doi": {"type": "literal", "value": rng.choice(["", f"10.1000/{i % 97}"])},
+            "statement": {"type": "uri", "value": f"http://www.wikidata.org/entity/statement/Q2270-{i}"},
+        }
+        bindings.append(binding)
+    document = {
+        "head": {"vars": ["propEntityLabel", "value", "unitsLabel", "source", "doi", "statement"]},
+        "results": {"bindings": bindings},
+    }
+    return json.dumps(document).encode("utf-8")
+
+
+def glossary_owl(rng, count, steps=10):
+    """
+    The glossary (glossary.owl in Turtle) with count terms, the first steps
+    of them Process Flow Steps related to another term, as bytes
+    """
+    base = "https://vhp4safety.github.io/glossary#VHP"
+    blocks = [
+        "@prefix owl: <http://www.w3.org/2002/07/owl#> .\n"
+        "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .\n"
+        "@prefix dc: <http://purl.org/dc/elements/1.1/> .\n"
+        "@prefix dct: <http://purl.org/dc/terms/> .\n"
+        "@prefix ncit: <http://purl.obolibrary.org/obo/NCIT_> .\n"
+    ]
+    for i in range(count):
+        label = f"{_text(rng, rng.randrange(1, 4))} {i}"
+        props = ["rdf:type owl:Class"]
+        if i < steps:
+            props.append(f'rdfs:label "{label} (Process Flow Step)"@en')
+            props.append(f"dct:relation <{base}{count - 1 - i:07d}>")
+        else:
+            props.append(f'rdfs:label "{label}"@en')
+        props.append(f'dc:description "{_text(rng, 15)}"@en')
+        if rng.random() < 0.2:
+            props.append(f'ncit:C42610 "{_text(rng, 2)}"')
+        blocks.append(f"<{base}{i:07d}>\n    " + " ;\n    ".join(props) + " .\n")
+    return "\n".join(blocks).encode("utf-8")
+
+
+SYNTHETIC = {
+    "study_small": lambda rng: study(rng, files=16, authors=2, organizations=2, protocols=0, attributes=20),
+    "study_huge": lambda rng: study(rng, files=20000, authors=300, organizations=60, protocols=200, attributes=400),
+    "biostudies_hits": lambda rng: biostudies_hits(rng, 10000),
+    "service_index": lambda rng: service_index(rng, 500),
+    "methods_index": lambda rng: methods_index(rng, 500),
+    "qlever_expdata": lambda rng: qlever_expdata(rng, 20000),
+}
+
+
+################################################################################
+### Loading and recording
+
+
+def _recorded_path(name):
+    return os.path.join(RECORDED_DIR, f"{name}.json.gz")
+
+
+def load(name, source="auto"):
+    """
+    Return a fixture payload
+
+    Args:
+        name (str): Key of SYNTHETIC
+        source (str): 'recorded', 'synthetic' or 'auto' (recorded if present)
+
+    Returns:
+        tuple: (payload, source used, digest); the digest identifies the
+            payload so results of different runs can be compared
+    """
+    path = _recorded_path(name)
+    if source == "recorded" or (source == "auto" and os.path.exists(path)):
+        with gzip.open(path, "rb") as f:
+            raw = f.read()
+        source = "recorded"
+    else:
+        payload = SYNTHETIC[name](random.Random(f"{SEED}-{name}"))
+        raw = payload if isinstance(payload, bytes) else json.dumps(payload, sort_keys=True).encode("utf-8")
+        source = "synthetic"
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    # The SPARQL results are benchmarked as raw bytes, everything else as parsed JSON.
+    payload = raw if name == "qlever_expdata" else json.loads(raw)
+    return payload, source, digest
+
+
+def _save(name, raw):
+    os.makedirs(RECORDED_DIR, exist_ok=True)
+    with gzip.open(_recorded_path(name), "wb", mtime=0) as f:
+        f.write(raw)
+    print(f"recorded {name}: {len(raw)} bytes")
+
+
+def record():
+    """Fetch the live upstream responses and store them in RECORDED_DIR."""
+    from compounds.expdata import EXPDATA_QUERY
+    from upstream import sparql
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"
+
+    def fetch(url, **kwargs):
+        response = session.get(url, timeout=120, **kwargs)
+        response.raise_for_status()
+        return response.content
+
+    _save("service_index", fetch(SERVICE_INDEX_URL))
+    _save("methods_index", fetch(METHODS_INDEX_URL))
+    _save("study_small", fetch(f"{BIOSTUDIES_API}/studies/{SMALL_STUDY}"))
+
+    # The huge study is the one with the most files on the first listing pages.
+    hits = []
+    for collection in ("VHP4Safety", "EU-ToxRisk"):
+        listing = json.loads(fetch(f"{BIOSTUDIES_API}/{collection}/search", params={"pageSize": 100}))
+        hits.extend(listing.get("hits", []))
+    largest = max(hits, key=lambda hit: hit.get("files") or 0)
+    _save("study_huge", fetch(f"{BIOSTUDIES_API}/studies/{largest['accession']}"))
+
+    query = sparql.bind(EXPDATA_QUERY, {"qid": sparql.Iri("http://www.wikidata.org/entity/" + EXPDATA_COMPOUND)})
+    _save(
+        "qlever_expdata",
+        fetch(QLEVER_WIKIDATA_EP, params={"query": query, "format": "json"}, headers={"Accept": "application/sparql-results+json"}),
+    )
+    # Filtering needs hits with loaded metadata, which would take thousands of
+    # study requests; biostudies_hits therefore stays synthetic.
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or inspect the benchmark fixtures")
+    parser.add_argument("--record", action="store_true", help="Fetch the live upstream responses")
+    args = parser.parse_args()
+    if args.record:
+        record()
+    for name in SYNTHETIC:
+        _, source, digest = load(name)
+        print(f"{name:<18} {source:<10} {digest}")
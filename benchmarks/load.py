@@ -0,0 +1,231 @@
+"""
+Load test of the app against local stand-in upstreams
+
+    python -m benchmarks.load --concurrency 1,8,32 --duration 30
+    python -m benchmarks.load --latency 150 --latency www.ebi.ac.uk=900 --error-rate 0.02
+    python -m benchmarks.load --route compound --concurrency 16 --save compounds.json
+    python -m benchmarks.load --target http://localhost:5050   # an app started separately
+
+Unless --target is given, the stand-in upstream servers (benchmarks/upstreams.py)
+and the app are started locally, the app with VHP_UPSTREAM_OVERRIDES
+pointing at the stand-ins and an empty cache directory. A separately
+started app must be pointed at `python -m benchmarks.upstreams` itself.
+
+For every concurrency level, that many clients send requests back to back
+(each picks a route by weight) for --duration seconds after --warmup
+seconds; throughput and p50/p95/p99 latency are reported overall and per
+route.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks import upstreams
+
+
+# (route, weight); {tool}, {method} and {compound} are filled in per request.
+ROUTES = (
+    ("/", 2),
+    ("/tools", 3),
+    ("/tools/{tool}", 1),
+    ("/data", 3),
+    ("/data?filter_case_study=Thyroid", 1),
+    ("/methods/{method}", 2),
+    ("/get_compound_properties/{compound}", 1),
+    ("/get_compound_identifiers/{compound}", 1),
+    ("/get_compound_toxicology/{compound}", 1),
+    ("/get_compound_expdata/{compound}?view=summary", 1),
+)
+REQUEST_TIMEOUT = 120
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def start_app(overrides, port, log_path):
+    """Start the app with the Flask server in a subprocess and wait until it answers."""
+    env = os.environ | {
+        "VHP_UPSTREAM_OVERRIDES": overrides,
+        "VHP_UPSTREAM_OVERRIDES_ONLY": "1",
+        "VHP_CACHE_DIR": tempfile.mkdtemp(prefix="vhp-load-cache-"),
+    }
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+    log = open(log_path, "wb")
+    process = subprocess.Popen([sys.executable, "-c", code], env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with status {process.returncode}; see {log_path}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The app did not start within 60 seconds; see {log_path}")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Client(threading.Thread):
+    """Sends requests back to back until stopped, recording (route, status, seconds, started)."""
+
+    def __init__(self, base_url, routes, values, seed, stop):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.routes = [route for route, _ in routes]
+        self.weights = [weight for _, weight in routes]
+        self.values = values
+        self.rng = random.Random(seed)
+        self.stop = stop
+        self.session = requests.Session()
+        self.samples = []
+
+    def run(self):
+        while not self.stop.is_set():
+            route = self.rng.choices(self.routes, self.weights)[0]
+            path = route.format(**{name: self.rng.choice(choices) for name, choices in self.values.items()})
+            started = time.monotonic()
+            try:
+                response = self.session.get(self.base_url + path, timeout=REQUEST_TIMEOUT)
+                response.content
+                status = response.status_code
+            except requests.RequestException:
+                status = "error"
+            self.samples.append((route, status, time.monotonic() - started, started))
+
+
+def run_level(base_url, routes, values, concurrency, warmup, duration, seed):
+    """
+    Run one concurrency level
+
+    Returns:
+        dict: Overall and per-route 'requests', 'errors' (HTTP 5xx and
+            failed connections), 'throughput' (requests per second) and
+            'p50', 'p95', 'p99' latencies in seconds
+    """
+    stop = threading.Event()
+    clients = [Client(base_url, routes, values, f"{seed}-{concurrency}-{i}", stop) for i in range(concurrency)]
+    started = time.monotonic()
+    for client in clients:
+        client.start()
+    time.sleep(warmup + duration)
+    stop.set()
+    for client in clients:
+        client.join(REQUEST_TIMEOUT)
+
+    # Requests started during the warmup are not counted, nor are those
+    # started after the measured window.
+    window = (started + warmup, started + warmup + duration)
+    samples = [s for client in clients for s in client.samples if window[0] <= s[3] < window[1]]
+
+    def summarize(selected):
+        latencies = sorted(s[2] for s in selected)
+        return {
+            "requests": len(selected),
+            "errors": sum(1 for s in selected if s[1] == "error" or s[1] >= 500),
+            "throughput": len(selected) / duration,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+
+    return {
+        "concurrency": concurrency,
+        "overall": summarize(samples),
+        "routes": {route: summarize([s for s in samples if s[0] == route]) for route, _ in routes},
+    }
+
+
+def report(result):
+    def line(name, r):
+        return (
+            f"{name:<46} {r['requests']:>7} {r['errors']:>6} {r['throughput']:>8.1f} "
+            f"{1000 * r['p50']:>8.0f} {1000 * r['p95']:>8.0f} {1000 * r['p99']:>8.0f}"
+        )
+
+    print(f"\nconcurrency {result['concurrency']}")
+    print(f"{'route':<46} {'requests':>7} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in result["routes"].items():
+        if r["requests"]:
+            print(line(route, r))
+    print(line("all", result["overall"]), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before every level")
+    parser.add_argument("--route", action="append", metavar="PATTERN", help="Only routes containing PATTERN")
+    parser.add_argument("--target", help="Base URL of an app started separately")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    upstreams.add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    routes = [(route, weight) for route, weight in ROUTES if not args.route or any(p in route for p in args.route)]
+    if not routes:
+        parser.error("No route matches --route")
+    payloads = upstreams.Payloads(args.fixtures)
+    values = {
+        "tool": list(payloads.service_index),
+        "method": list(payloads.methods_index),
+        "compound": [f"Q{i}" for i in range(1, upstreams.COMPOUNDS + 1)],
+    }
+
+    stand_ins = app = None
+    base_url = (args.target or "").rstrip("/")
+    try:
+        if not args.target:
+            stand_ins = upstreams.StandIns(upstreams.faults_from_arguments(args), payloads).start()
+            port = _free_port()
+            log_path = os.path.join(tempfile.gettempdir(), f"vhp-load-app-{port}.log")
+            app = start_app(stand_ins.overrides, port, log_path)
+            base_url = f"http://127.0.0.1:{port}"
+            print(f"app on {base_url}, log in {log_path}")
+
+        results = []
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            result = run_level(base_url, routes, values, concurrency, args.warmup, args.duration, args.seed)
+            report(result)
+            results.append(result)
+        if stand_ins is not None:
+            print("\nupstream calls: " + ", ".join(f"{host} {n}" for host, n in stand_ins.calls().items()))
+            for host, paths in stand_ins.unknown().items():
+                print(f"not served by the {host} stand-in: " + ", ".join(f"{path} ({n})" for path, n in paths.items()))
+            throttled = {host: n for host, n in stand_ins.throttled().items() if n}
+            if throttled:
+                print("answered 429: " + ", ".join(f"{host} {n}" for host, n in throttled.items()))
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(10)
+        if stand_ins is not None:
+            stand_ins.stop()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Microbenchmarks of the parsing, filtering and normalization hot paths
+
+    python -m benchmarks.run                         # all benchmarks
+    python -m benchmarks.run parse_metadata --min-time 2
+    python -m benchmarks.run --save before.json
+    python -m benchmarks.run --compare before.json   # exit status 1 on regressions
+
+Every benchmark times single calls on fixture payloads (see
+benchmarks/fixtures.py) with the garbage collector disabled, until both
+--min-samples and --min-time are reached. Medians are compared; a
+benchmark counts as regressed when its median and its minimum are both
+more than --threshold slower than in the saved run.
+"""
+
+import argparse
+import copy
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import fixtures
+
+
+_benchmarks = {}
+
+
+def benchmark(name, *fixture_names):
+    """
+    Register a benchmark
+
+    The decorated factory receives the fixture payloads and returns
+    prepare(), which is called before every timed call (untimed) and
+    returns the zero-argument function to time.
+    """
+
+    def register(factory):
+        _benchmarks[name] = (factory, fixture_names)
+        return factory
+
+    return register
+
+
+################################################################################
+### Benchmarks
+
+
+@benchmark("biostudies.parse_metadata[small]", "study_small")
+def parse_small_study(study):
+    from biostudies.search import BioStudiesExtractor
+
+    extractor = BioStudiesExtractor()
+    return lambda: lambda: extractor.parse_metadata(study)
+
+
+@benchmark("biostudies.parse_metadata[huge]", "study_huge")
+def parse_huge_study(study):
+    from biostudies.search import BioStudiesExtractor
+
+    extractor = BioStudiesExtractor()
+    return lambda: lambda: extractor.parse_metadata(study)
+
+
+@benchmark("biostudies.apply_filters[10k hits]", "biostudies_hits")
+def apply_filters(hits):
+    from biostudies.search import BioStudiesExtractor
+
+    extractor = BioStudiesExtractor()
+    filters = [("case_study", "thyroid"), ("flow_step", "hazard assessment")]
+    return lambda: lambda: extractor._apply_filters(hits, filters)
+
+
+@benchmark("app.normalize_tools", "service_index")
+def normalize_tools(index):
+    from app import normalize_tools
+
+    def prepare():
+        # normalize_tools updates the entries in place, so every call gets a fresh copy.
+        tools = copy.deepcopy(list(index.values()))
+        return lambda: normalize_tools(tools)
+
+    return prepare
+
+
+@benchmark("app.normalize_methods", "methods_index")
+def normalize_methods(index):
+    from app import normalize_methods
+
+    methods = list(index.values())
+    return lambda: lambda: normalize_methods(methods)
+
+
+@benchmark("sparql.iter_bindings[expdata]", "qlever_expdata")
+def decode_expdata(document):
+    from upstream.sparql import iter_bindings
+
+    chunks = [document[i:i + 65536] for i in range(0, len(document), 65536)]
+    return lambda: lambda: sum(1 for _ in iter_bindings(chunks, head=[]))
+
+
+@benchmark("compounds.expdata_rows", "qlever_expdata")
+def reshape_expdata(document):
+    from compounds.expdata import expdata_rows
+
+    rows = _expdata_tuples(document)
+    return lambda: lambda: expdata_rows(rows)
+
+
+@benchmark("compounds.summarize", "qlever_expdata")
+def summarize_expdata(document):
+    from compounds.expdata import expdata_rows, summarize
+
+    rows = expdata_rows(_expdata_tuples(document))
+    return lambda: lambda: summarize(rows)
+
+
+@benchmark("compounds.paginate[property]", "qlever_expdata")
+def paginate_expdata(document):
+    from compounds.expdata import expdata_rows, paginate
+
+    rows = expdata_rows(_expdata_tuples(document))
+    prop = rows[0]["propEntityLabel"]
+    return lambda: lambda: paginate(rows, page=2, page_size=50, prop=prop)
+
+
+@benchmark("compounds.property_entries")
+def reshape_properties():
+    from compounds.properties import DIRECT_PREFIX, IDENTIFIER_PROPERTIES, property_entries
+
+    catalog = {pid: {"label": f"label {pid}", "formatterURL": f"https://example.org/{pid}/$1"} for pid in IDENTIFIER_PROPERTIES}
+    rows = [(DIRECT_PREFIX + pid, f"value {pid} {i}") for pid in IDENTIFIER_PROPERTIES[::2] for i in range(3)]
+    return lambda: lambda: property_entries(rows, catalog, IDENTIFIER_PROPERTIES)
+
+
+def _expdata_tuples(document):
+    variables = ("propEntityLabel", "value", "unitsLabel", "source", "doi", "statement")
+    bindings = json.loads(document)["results"]["bindings"]
+    return [tuple(b[v]["value"] if v in b else None for v in variables) for b in bindings]
+
+
+################################################################################
+### Running and comparing
+
+
+def measure(prepare, min_samples, min_time):
+    """Return the durations in seconds of single calls."""
+    for _ in range(2):  # warm up
+        prepare()()
+    samples = []
+    started = time.perf_counter()
+    gc_was_enabled = gc.isenabled()
+    try:
+        while len(samples) < min_samples or time.perf_counter() - started < min_time:
+            function = prepare()
+            gc.collect()
+            gc.disable()
+            t0 = time.perf_counter()
+            function()
+            samples.append(time.perf_counter() - t0)
+            gc.enable()
+            if len(samples) >= 100000:
+                break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def run(patterns=(), source="auto", min_samples=10, min_time=1.0):
+    """
+    Run the benchmarks whose name contains one of the patterns (all without patterns)
+
+    Returns:
+        dict: 'meta' (commit, Python, platform, fixture digests) and
+            'results' ({name: min, median, mean, stdev in seconds and samples})
+    """
+    loaded = {}
+    results = {}
+    for name, (factory, fixture_names) in _benchmarks.items():
+        if patterns and not any(pattern in name for pattern in patterns):
+            continue
+        payloads = []
+        for fixture_name in fixture_names:
+            if fixture_name not in loaded:
+                loaded[fixture_name] = fixtures.load(fixture_name, source)
+            payloads.append(loaded[fixture_name][0])
+        samples = measure(factory(*payloads), min_samples, min_time)
+        results[name] = {
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "mean": statistics.fmean(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "samples": len(samples),
+        }
+        print(
+            f"{name:<40} {_format(results[name]['median']):>10} median {_format(results[name]['min']):>10} min "
+            f"±{100 * results[name]['stdev'] / results[name]['mean']:5.1f}%  ({len(samples)} samples)",
+            flush=True,
+        )
+    return {
+        "meta": {
+            "commit": _commit(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "fixtures": {name: {"source": source, "digest": digest} for name, (_, source, digest) in loaded.items()},
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Print the change of every benchmark against a saved run
+
+    Returns:
+        list: Names of the regressed benchmarks
+    """
+    for name, entry in current["meta"]["fixtures"].items():
+        before = baseline["meta"]["fixtures"].get(name)
+        if before and before["digest"] != entry["digest"]:
+            print(f"warning: fixture {name} differs from the saved run; its results are not comparable")
+    if baseline["meta"].get("machine") != current["meta"]["machine"] or baseline["meta"].get("python") != current["meta"]["python"]:
+        print("warning: the saved run used a different machine or Python version")
+
+    regressed = []
+    print(f"\n{'benchmark':<40} {'before':>10} {'after':>10} {'change':>8}")
+    for name, after in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<40} {'':>10} {_format(after['median']):>10}      new")
+            continue
+        change = after["median"] / before["median"] - 1
+        flag = ""
+        if change > threshold and after["min"] > before["min"] * (1 + threshold):
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} {_format(before['median']):>10} {_format(after['median']):>10} {100 * change:+7.1f}%{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("patterns", nargs="*", help="Only run benchmarks whose name contains one of these")
+    parser.add_argument("--fixtures", choices=("auto", "recorded", "synthetic"), default="auto")
+    parser.add_argument("--min-samples", type=int, default=10)
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum seconds per benchmark")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with results saved by --save")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as regression")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(_benchmarks))
+        return 0
+    current = run(args.patterns, args.fixtures, args.min_samples, args.min_time)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressed = compare(baseline, current, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} regression(s) above {100 * args.threshold:.0f}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""
+Local stand-ins for the upstream services, for load tests
+
+    python -m benchmarks.upstreams --latency 100 --latency www.ebi.ac.uk=800 --error-rate 0.02 --rate-limit www.ebi.ac.uk=5
+
+One HTTP server per upstream host answers the calls the routes make with
+fixture-shaped payloads (see benchmarks/fixtures.py), after an injected
+latency, with an injected error rate and, with a rate limit, answering
+429 to the calls over it. Point the app at them with
+VHP_UPSTREAM_OVERRIDES (printed on start, see upstream/http.py).
+
+Served:
+    raw.githubusercontent.com     service and methods index, method JSON, .md files, glossary.owl,
+                                  case study content (the copies in static/data/casestudies), .png images
+    cloud.vhp4safety.nl           tool JSON, .png images
+    www.ebi.ac.uk                 BioStudies search, listing and study API, OLS term lookups
+    compoundcloud.wikibase.cloud  SPARQL: ID map, property catalog and values, compound properties
+    qlever.cs.uni-freiburg.de     SPARQL: experimental data
+"""
+
+import argparse
+import collections
+import functools
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from benchmarks import fixtures
+
+
+HOSTS = (
+    "raw.githubusercontent.com",
+    "cloud.vhp4safety.nl",
+    "www.ebi.ac.uk",
+    "compoundcloud.wikibase.cloud",
+    "qlever.cs.uni-freiburg.de",
+)
+COMPOUNDS = 200  # Compound Wiki items Q1..Q200, all with a Wikidata ID.
+STUDIES = 600
+EXPDATA_ROWS = 2000
+GLOSSARY_TERMS = 400
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+CASESTUDY_DIR = os.path.join(STATIC_DIR, "data", "casestudies")
+IMAGE = os.path.join(STATIC_DIR, "images", "partners", "UU.png")  # Served for every .png path.
+ENTITY_PREFIX = "https://compoundcloud.wikibase.cloud/entity/"
+DIRECT_PREFIX = "https://compoundcloud.wikibase.cloud/prop/direct/"
+
+
+class Faults:
+    """Latency, error and rate limit injection of one stand-in server."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None, rate_limit=0.0):
+        """
+        Args:
+            latency (float): Mean delay in seconds before every response
+            jitter (float): The delay varies uniformly by up to this many seconds
+            error_rate (float): Fraction of the calls answered with HTTP 503
+            rate_limit (float): Calls per second (burst of one second) above
+                which calls are answered with HTTP 429; 0 for no limit
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay in seconds, whether to fail) for a call."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            return delay, self._rng.random() < self.error_rate
+
+    def admit(self):
+        """Whether a call arriving now is within the rate limit."""
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+################################################################################
+### Payloads
+
+
+class Payloads:
+    """The upstream data, generated once from the fixtures."""
+
+    def __init__(self, source="auto"):
+        self.service_index = fixtures.load("service_index", source)[0]
+        self.methods_index = fixtures.load("methods_index", source)[0]
+        rng = random.Random(fixtures.SEED)
+        self.hits = [
+            {
+                "accession": f"S-SYN{i}",
+                "type": "study",
+                "title": fixtures._text(rng, 6),
+                "author": f"Author {i}",
+                "links": 0,
+                "files": rng.randrange(1, 40),
+                "release_date": "2024-03-27",
+                "views": rng.randrange(1000),
+                "isPublic": True,
+            }
+            for i in range(STUDIES)
+        ]
+        self.expdata = fixtures.qlever_expdata(random.Random(fixtures.SEED), EXPDATA_ROWS)
+        self.glossary = fixtures.glossary_owl(random.Random(fixtures.SEED), GLOSSARY_TERMS)
+
+    @functools.cached_property
+    def image(self):
+        with open(IMAGE, "rb") as f:
+            return f.read()
+
+    def casestudy_content(self, case):
+        with open(os.path.join(CASESTUDY_DIR, f"{case}_content.json"), "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def ols_term(iri):
+        """An OLS4 /api/terms answer for an IRI, labelled after its last segment."""
+        name = iri.rstrip("/#").replace("#", "/").rsplit("/", 1)[-1]
+        ontology = name.split("_", 1)[0].lower() if "_" in name else "synthetic"
+        return {"_embedded": {"terms": [{"label": f"term {name}", "short_form": name, "ontology_name": ontology}]}}
+
+    @functools.lru_cache(maxsize=1024)
+    def study(self, accession):
+        """A small study whose metadata (case study, flow step, ...) depends on the accession."""
+        study = fixtures.study(random.Random(accession), files=16, authors=2, organizations=2, protocols=0, attributes=20)
+        study["accno"] = accession
+        return json.dumps(study).encode("utf-8")
+
+    def search(self, params):
+        page = max(int(params.get("page", 1)), 1)
+        page_size = min(max(int(params.get("pageSize", 20)), 1), 100)
+        hits = self.hits
+        if params.get("query"):
+            words = params["query"].lower().split()
+            hits = [hit for hit in hits if any(word in hit["title"] for word in words)]
+        start = (page - 1) * page_size
+        return {
+            "page": page,
+            "pageSize": page_size,
+            "totalHits": len(hits),
+            "isTotalHitsExact": True,
+            "hits": hits[start:start + page_size],
+        }
+
+
+def _bindings(variables, rows):
+    document = {
+        "head": {"vars": list(variables)},
+        "results": {
+            "bindings": [
+                {var: {"type": "literal", "value": str(value)} for var, value in zip(variables, row) if value is not None}
+                for row in rows
+            ]
+        },
+    }
+    return json.dumps(document).encode("utf-8")
+
+
+def compoundwiki_results(query):
+    """Answer the Compound Wiki queries of compounds/ and app.py by their variables."""
+    lookup = re.search(r"wd:Q(\d+) wdt:P5 \?wikidata", query)
+    if lookup:  # compounds.idmap.LOOKUP_QUERY; Q201..Q400 were added after the map was loaded.
+        number = int(lookup.group(1))
+        return _bindings(("wikidata",), [(f"Q{100000 + number}",)] if number <= 2 * COMPOUNDS else [])
+    if "?wikidata" in query:  # compounds.idmap.IDMAP_QUERY
+        return _bindings(("ID", "wikidata"), [(f"Q{i}", f"Q{100000 + i}") for i in range(1, COMPOUNDS + 1)])
+    if "?formatterURL" in query:  # compounds.properties.CATALOG_QUERY
+        pids = re.findall(r"wd:(P\d+)", query)
+        return _bindings(
+            ("property", "propertyLabel", "formatterURL"),
+            [(ENTITY_PREFIX + pid, f"property {pid}", f"https://example.org/{pid}/$1") for pid in pids],
+        )
+    if "?valueProp" in query:  # compounds.properties.VALUES_QUERY
+        pids = re.findall(r"wdt:(P\d+)", query)
+        return _bindings(("valueProp", "value"), [(DIRECT_PREFIX + pid, f"{pid}-value-{n}") for pid in pids for n in range(2)])
+    if "?inchiKey" in query:  # /get_compound_properties
+        cmp = re.search(r"VALUES \?cmp \{ wd:(Q\d+) \}", query)
+        qid = cmp.group(1) if cmp else "Q1"
+        return _bindings(
+            ("cmp", "cmpLabel", "formula", "mass", "inchi", "inchiKey", "SMILES"),
+            [(ENTITY_PREFIX + qid, f"compound {qid}", "C6H6", "78.11", "InChI=1S/C6H6/c1-2-4-6-5-3-1/h1-6H",
+              "UHOVQNZJYSORNB-UHFFFAOYSA-N", "c1ccccc1")],
+        )
+    if "?SMILES" in query:  # compounds.similarity.CATALOG_QUERY
+        smiles = ["c1ccccc1", "CCO", "CC(=O)O", "c1ccccc1O", "CCN(CC)CC", "O=C(O)c1ccccc1"]
+        return _bindings(("ID", "Term", "SMILES"), [(f"Q{i}", f"compound Q{i}", smiles[i % len(smiles)]) for i in range(1, COMPOUNDS + 1)])
+    return _bindings((), [])
+
+
+################################################################################
+### Servers
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the calls for one upstream host (self.server.host)."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every response
+    # waits for the client's delayed ACK (about 40 ms).
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if not server.faults.admit():
+            with server.lock:
+                server.throttled += 1
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        delay, fail = server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        with server.lock:
+            server.calls += 1
+        if fail:
+            self._send(503, b"injected error", "text/plain")
+            return
+        parts = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(parts.query))
+        try:
+            status, body, content_type = getattr(self, "_" + server.host.replace(".", "_").replace("-", "_"))(parts.path, params)
+        except (KeyError, ValueError, OSError):
+            with server.lock:
+                server.unknown[parts.path] += 1
+            status, body, content_type = 404, b"not found", "text/plain"
+        self._send(status, body, content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, value):
+        return 200, json.dumps(value).encode("utf-8"), "application/json"
+
+    def _raw_githubusercontent_com(self, path, params):
+        payloads = self.server.payloads
+        if path.endswith("/cap/service_index.json"):
+            return self._json(payloads.service_index)
+        if path.endswith("/cap/methods_index.json"):
+            return self._json(payloads.methods_index)
+        match = re.search(r"/docs/methods/([^/]+)\.json$", path)
+        if match:
+            return self._json(payloads.methods_index[urllib.parse.unquote(match.group(1))])
+        if path.endswith(".png"):
+            return 200, payloads.image, "image/png"
+        if path.endswith("/glossary.owl"):
+            return 200, payloads.glossary, "text/plain"
+        match = re.fullmatch(r"/VHP4Safety/ui-casestudy-config/.+/([a-z]+)_content\.json", path)
+        if match:
+            return 200, payloads.casestudy_content(match.group(1)), "application/json"
+        if path.endswith(".md"):
+            return 200, f"# {path.rsplit('/', 1)[-1]}\n\n{fixtures._text(random.Random(path), 80)}\n".encode("utf-8"), "text/plain"
+        raise KeyError(path)
+
+    def _cloud_vhp4safety_nl(self, path, params):
+        if path.endswith(".png"):
+            return 200, self.server.payloads.image, "image/png"
+        match = re.fullmatch(r"/service/([^/]+)\.json", path)
+        if not match:
+            raise KeyError(path)
+        return self._json(self.server.payloads.service_index[match.group(1)])
+
+    def _www_ebi_ac_uk(self, path, params):
+        payloads = self.server.payloads
+        if re.fullmatch(r"/biostudies/api/v1/(?:[^/]+/)?search", path):
+            return self._json(payloads.search(params))
+        match = re.fullmatch(r"/biostudies/api/v1/studies/(S-SYN\d+)", path)
+        if match:
+            return 200, payloads.study(match.group(1)), "application/json"
+        match = re.fullmatch(r"/ols4/api/terms/([^/]+)", path)
+        if match:
+            return self._json(payloads.ols_term(urllib.parse.unquote(urllib.parse.unquote(match.group(1)))))
+        raise KeyError(path)
+
+    def _compoundcloud_wikibase_cloud(self, path, params):
+        if path != "/query/sparql":
+            raise KeyError(path)
+        return 200, compoundwiki_results(params.get("query", "")), "application/sparql-results+json"
+
+    def _qlever_cs_uni_freiburg_de(self, path, params):
+        if path != "/api/wikidata":
+            raise KeyError(path)
+        return 200, self.server.payloads.expdata, "application/sparql-results+json"
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host, faults, payloads, address=("127.0.0.1", 0)):
+        super().__init__(address, StandInHandler)
+        self.host = host
+        self.faults = faults
+        self.payloads = payloads
+        self.calls = 0
+        self.throttled = 0  # Calls answered 429, not counted in calls.
+        self.unknown = collections.Counter()  # Paths without a stand-in answer, answered 404.
+        self.lock = threading.Lock()
+
+
+class StandIns:
+    """All stand-in servers, each on a free local port."""
+
+    def __init__(self, faults, payloads=None):
+        """
+        Args:
+            faults (dict): {host: Faults}; hosts without an entry get no faults
+            payloads (Payloads): Shared payloads (generated when omitted)
+        """
+        payloads = payloads or Payloads()
+        self.servers = {host: StandInServer(host, faults.get(host) or Faults(), payloads) for host in HOSTS}
+        self._threads = []
+
+    @property
+    def overrides(self):
+        """The VHP_UPSTREAM_OVERRIDES value pointing the app at these servers."""
+        return ",".join(f"{host}=http://127.0.0.1:{server.server_address[1]}" for host, server in self.servers.items())
+
+    def calls(self):
+        """Number of calls per host so far."""
+        return {host: server.calls for host, server in self.servers.items()}
+
+    def unknown(self):
+        """Paths per host that got 404 because the stand-in does not serve them."""
+        return {host: dict(server.unknown) for host, server in self.servers.items() if server.unknown}
+
+    def throttled(self):
+        """Number of calls per host answered 429 so far."""
+        return {host: server.throttled for host, server in self.servers.items()}
+
+    def start(self):
+        for server in self.servers.values():
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+def per_host(values, convert, default):
+    """
+    Parse repeated '[host=]value' options into {host: value}; a value
+    without host applies to every host without its own value
+    """
+    result = dict.fromkeys(HOSTS, default)
+    specific = {}
+    for item in values or ():
+        host, sep, value = item.rpartition("=")
+        if not sep:
+            result = dict.fromkeys(HOSTS, convert(value))
+        elif host not in HOSTS:
+            raise ValueError(f"Unknown upstream host {host!r}; expected one of {', '.join(HOSTS)}")
+        else:
+            specific[host] = convert(value)
+    return result | specific
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--latency", action="append", metavar="[HOST=]MS", help="Mean upstream latency in milliseconds")
+    parser.add_argument("--jitter", action="append", metavar="[HOST=]MS", help="Uniform latency variation in milliseconds")
+    parser.add_argument("--error-rate", action="append", metavar="[HOST=]FRACTION", help="Fraction of upstream calls failing with 503")
+    parser.add_argument("--rate-limit", action="append", metavar="[HOST=]PER_SECOND", help="Calls per second above which upstream calls get 429")
+    parser.add_argument("--fixtures", choices=("auto", "recorded", "synthetic"), default="auto")
+    parser.add_argument("--seed", type=int, default=fixtures.SEED)
+
+
+def faults_from_arguments(args):
+    latency = per_host(args.latency, lambda ms: float(ms) / 1000, 0.0)
+    jitter = per_host(args.jitter, lambda ms: float(ms) / 1000, 0.0)
+    error_rate = per_host(args.error_rate, float, 0.0)
+    rate_limit = per_host(args.rate_limit, float, 0.0)
+    return {
+        host: Faults(latency[host], jitter[host], error_rate[host], seed=f"{args.seed}-{host}", rate_limit=rate_limit[host])
+        for host in HOSTS
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stand_ins = StandIns(faults_from_arguments(args), Payloads(args.fixtures)).start()
+    print(f"VHP_UPSTREAM_OVERRIDES={stand_ins.overrides}", flush=True)
+    print("VHP_UPSTREAM_OVERRIDES_ONLY=1", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stand_ins.stop()
+
+
+if __name__ == "__main__":
+    main()
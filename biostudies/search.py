@@ -1,7 +1,20 @@
+import concurrent.futures
+import contextvars
 import requests
 import json
 import time
 
+from monitoring import metrics, tracing
+from upstream import deadline, http
+from upstream.diskcache import DiskCache
+
+
+STUDY_TTL = 24 * 3600  # Seconds the parsed metadata of a study is reused.
+MAX_WORKERS = 4  # Concurrent study requests when loading the metadata of a page of hits.
+
+# Parsed metadata by accession, shared by all workers.
+_studies = DiskCache("biostudies-studies", ttl=STUDY_TTL)
+
 
 class BioStudiesExtractor:
     """Class to handle BioStudies API interactions"""
@@ -50,6 +63,8 @@ class BioStudiesExtractor:
 
         return True, verified_id, None
 
+    @metrics.BIOSTUDIES_OPERATION_DURATION.timed(operation="get_study_metadata")
+    @tracing.traced("biostudies.get_study_metadata")
     def get_study_metadata(self, study_id):
         """
         Extract metadata for a given BioStudies ID
@@ -66,6 +81,10 @@ class BioStudiesExtractor:
             if not is_valid:
                 return {"error": validation_error}
 
+            cached = _studies.get(verified_id)
+            if cached is not None:
+                return cached
+
             # Construct API URL
             url = self.studies_url + f"/{verified_id}"
 
@@ -75,7 +94,7 @@ class BioStudiesExtractor:
                 "User-Agent": "BioStudies-VHP4Safety-App/1.0",
             }
 
-            response = requests.get(url, headers=headers, timeout=30)
+            response = http.get(url, headers=headers, timeout=30)
 
             if response.status_code == 200:
                 try:
@@ -89,6 +108,11 @@ class BioStudiesExtractor:
                     md = self.parse_metadata(data)
                     collection = md.get("collection", "")
                     url = self.build_study_url(verified_id, collection).get("url", "")
+                    # The raw response is only kept for debugging the fresh parse.
+                    _studies.set(
+                        verified_id,
+                        {k: v for k, v in md.items() if k != "raw_data"} | {"url": url},
+                    )
                     return md | {"url": url}
                 except json.JSONDecodeError as e:
                     return {
@@ -164,6 +188,8 @@ class BioStudiesExtractor:
 
         return {"accession": verified_id, "url": url}
 
+    @metrics.BIOSTUDIES_OPERATION_DURATION.timed(operation="search_studies")
+    @tracing.traced("biostudies.search_studies")
     def search_studies(
         self,
         query,
@@ -202,7 +228,7 @@ class BioStudiesExtractor:
                 "User-Agent": "BioStudies-VHP4Safety-App/1.0",
             }
 
-            response = requests.get(
+            response = http.get(
                 self.search_url, headers=headers, params=params, timeout=30
             )
 
@@ -287,13 +313,29 @@ class BioStudiesExtractor:
                 hit["url"] = self.build_study_url(acc).get("url", "")
         return hits
 
+    @tracing.traced("biostudies.hit_metadata")
     def _hit_metadata(self, hits: list) -> list:
-        for hit in hits:
-            acc = hit.get("accession") or hit.get("accno")
-            if acc:
-                hit["metadata"] = self.get_study_metadata(acc)
+        """Load the metadata of the hits, MAX_WORKERS studies at a time."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            # Each load runs in a copy of the caller's context, so the request
+            # deadline and rate limit priority apply.
+            futures = [
+                (hit, pool.submit(contextvars.copy_context().run, self._load_hit_metadata, acc))
+                for hit in hits
+                for acc in [hit.get("accession") or hit.get("accno")]
+                if acc
+            ]
+            for hit, future in futures:
+                hit["metadata"] = future.result()
         return hits
 
+    def _load_hit_metadata(self, accession):
+        if deadline.expired():
+            deadline.mark_exceeded()
+            return {"error": "Not loaded: the request deadline was reached"}
+        return self.get_study_metadata(accession)
+
+    @tracing.traced("biostudies.apply_filters")
     def _apply_filters(self, hits: list, filters: list[tuple]) -> list:
         """
         Filter hits based on metadata field values (case-insensitive AND logic)
@@ -327,10 +369,12 @@ class BioStudiesExtractor:
         
         return filtered
 
+    @tracing.traced("biostudies.backfill_filtered_results")
     def _backfill_filtered_results(self, initial_hits: list, page: int, page_size: int, 
                                    filters: list[tuple], query: str = None) -> tuple:
         """
-        Backfill filtered results by fetching additional pages until page_size is met or timeout
+        Backfill filtered results by fetching additional pages until page_size is met,
+        30 seconds have passed or the request deadline is reached
         
         Args:
             initial_hits (list): Initial filtered hits from first page
@@ -348,7 +392,10 @@ class BioStudiesExtractor:
         pages_fetched = 1
         
         while len(filtered) < page_size:
-            # Timeout check (30 seconds)
+            # Timeout check (30 seconds, or less when the request deadline is near)
+            if deadline.expired():
+                deadline.mark_exceeded()
+                break
             if time.time() - start_time > 30:
                 break
             
@@ -363,7 +410,7 @@ class BioStudiesExtractor:
                         "Accept": "application/json",
                         "User-Agent": "BioStudies-VHP4Safety-App/1.0",
                     }
-                    response = requests.get(self.search_url, headers=headers, params=params, timeout=30)
+                    response = http.get(self.search_url, headers=headers, params=params, timeout=30)
                     
                     if response.status_code != 200:
                         break
@@ -377,7 +424,7 @@ class BioStudiesExtractor:
                         "Accept": "application/json",
                         "User-Agent": "BioStudies-VHP4Safety-App/1.0",
                     }
-                    response = requests.get(self.search_url, headers=headers, params=params, timeout=30)
+                    response = http.get(self.search_url, headers=headers, params=params, timeout=30)
                     
                     if response.status_code != 200:
                         break
@@ -404,6 +451,8 @@ class BioStudiesExtractor:
         page_size_met = len(filtered) >= page_size
         return filtered[:page_size], page_size_met, pages_fetched
 
+    @metrics.BIOSTUDIES_OPERATION_DURATION.timed(operation="list_studies")
+    @tracing.traced("biostudies.list_studies")
     def list_studies(self, page=1, page_size=50, include_urls: bool = False, load_metadata:bool=False, filter: list[tuple] = list(tuple())) -> dict:
         """
         List studies in the configured BioStudies collection for a specific page.
@@ -433,7 +482,7 @@ class BioStudiesExtractor:
         params = {"page": page, "pageSize": page_size}
 
         try:
-            response = requests.get(
+            response = http.get(
                 self.search_url, headers=headers, params=params, timeout=30
             )
         except requests.exceptions.RequestException as e:
@@ -497,6 +546,7 @@ class BioStudiesExtractor:
             # No filtering - return standard response
             return {"total": total_hits, "hits": hits}
 
+    @tracing.traced("biostudies.parse_metadata")
     def parse_metadata(self, raw_data):
         """
         Parse and structure the metadata from BioStudies API response
@@ -530,13 +580,13 @@ class BioStudiesExtractor:
 
             # Extract attributes with enhanced categorization
             if "attributes" in raw_data:
+                # initialize VHP4Safety specific fields
+                metadata["case_study"] = ""
+                metadata["regulatory_question"] = ""
+                metadata["flow_step"] = ""
                 for attr in raw_data["attributes"]:
                     attr_name = attr.get("name", "").lower()
                     attr_value = attr.get("value", "")
-                    # initialize VHP4Safety specific fields
-                    metadata["case_study"] = ""
-                    metadata["regulatory_question"] = ""
-                    metadata["flow_step"] = ""
 
                     metadata["attributes"].append(
                         {"name": attr.get("name", ""), "value": attr_value}
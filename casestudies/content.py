@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import re
+import time
+
+import requests
+
+from upstream import http
+from upstream.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_URL = "https://raw.githubusercontent.com/VHP4Safety/ui-casestudy-config/{ref}/{case}_content.json"
+LOCAL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "data", "casestudies"
+)
+REVALIDATE_AFTER = 300  # Seconds a cached content file is used before asking GitHub again.
+KEEP_FOR = 7 * 24 * 3600  # Seconds a content file is kept to bridge GitHub outages.
+LOCAL_REFS = ("main", "refs/heads/main")  # Refs the copies in static/data/casestudies stand in for.
+
+# Branch names and commit hashes; the ref ends up in the GitHub URL.
+VALID_REF = re.compile(r"^(refs/heads/)?[A-Za-z0-9._-]+(/[A-Za-z0-9._-]+)*$")
+
+_cache = TTLCache(maxsize=64, ttl=KEEP_FOR, name="casestudy-content")
+
+
+def content_ref(branch=None, commit=None):
+    """
+    Return the git ref of the content files, as selected by the
+    casestudybranch and casestudycommit query parameters
+
+    Raises:
+        ValueError: If the branch or commit is not a valid ref
+    """
+    ref = "refs/heads/" + branch if branch else commit or "main"
+    if not VALID_REF.match(ref) or ".." in ref:
+        raise ValueError(f"Invalid case study branch or commit: {ref}")
+    return ref
+
+
+def _load_local(case):
+    with open(os.path.join(LOCAL_DIR, f"{case}_content.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def case_study_content(case, ref="main"):
+    """
+    Return the content of a case study page from ui-casestudy-config
+
+    Content is cached per ref and case and revalidated against GitHub with
+    its ETag every REVALIDATE_AFTER seconds. When GitHub cannot be reached
+    the cached copy is used, and without one, for the main branch only, the
+    copy in static/data/casestudies. A content file that does not exist on
+    the ref is not replaced by a copy.
+
+    Args:
+        case (str): Case study name, e.g. thyroid
+        ref (str): Git ref as returned by content_ref
+
+    Returns:
+        tuple: (content dict, source) with source "cache", "github" or "local";
+            content is None if no copy of the ref is available
+    """
+    key = (ref, case)
+    entry = _cache.get(key)
+    if entry is not None and time.monotonic() - entry["checked"] < REVALIDATE_AFTER:
+        return entry["content"], "cache"
+
+    headers = {"User-Agent": "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    try:
+        response = http.get(CONTENT_URL.format(ref=ref, case=case), headers=headers, timeout=5)
+        if response.status_code == 304 and entry is not None:
+            source = "cache"
+        elif response.status_code == 404:
+            return None, "github"
+        else:
+            response.raise_for_status()
+            entry = {"content": response.json(), "etag": response.headers.get("ETag")}
+            source = "github"
+        entry["checked"] = time.monotonic()
+        _cache.set(key, entry)
+        return entry["content"], source
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Fetching %s content for %s failed: %s", case, ref, e)
+
+    if entry is not None:
+        return entry["content"], "cache"
+    if ref not in LOCAL_REFS:
+        # The local copies are of main; showing one would pass it off as the requested ref.
+        return None, "github"
+    try:
+        content = _load_local(case)
+    except (OSError, ValueError) as e:
+        logger.warning("No local content for case study %s: %s", case, e)
+        return None, "local"
+    # Cached like a GitHub copy, so GitHub is only retried after REVALIDATE_AFTER.
+    _cache.set(key, {"content": content, "etag": None, "checked": time.monotonic()})
+    return content, "local"
@@ -0,0 +1,167 @@
+import math
+
+import numpy as np
+
+from upstream import sparql
+from upstream.cache import TTLCache
+
+
+CACHE_TTL = 600  # Seconds the experimental data of a compound is kept in memory.
+
+# the query may be affected by https://github.com/ad-freiburg/qlever-control/issues/187
+EXPDATA_QUERY = """
+PREFIX wd: <http://www.wikidata.org/entity/>
+PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+PREFIX prov: <http://www.w3.org/ns/prov#>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX pr: <http://www.wikidata.org/prop/reference/>
+PREFIX wikibase: <http://wikiba.se/ontology#>
+
+SELECT DISTINCT ?propEntityLabel ?value ?unitsLabel ?source ?doi ?statement
+WHERE {
+    $qid ?propp ?statement .
+    ?statement a wikibase:BestRank ;
+      ?proppsv [ wikibase:quantityAmount ?value ; wikibase:quantityUnit ?units ] .
+    #OPTIONAL { ?statement prov:wasDerivedFrom/pr:P248 ?sourceTmp . OPTIONAL { ?sourceTmp wdt:P356 ?doiTmp . } }
+    ?property wikibase:claim ?propp ; wikibase:statementValue ?proppsv ; wdt:P1629 ?propEntity ; wdt:P31 wd:Q21077852 .
+    ?propEntity @en@rdfs:label ?propEntityLabel .
+    ?units @en@rdfs:label ?unitsLabel .
+    BIND (COALESCE(IF(BOUND(?sourceTmp), ?sourceTmp, 1/0), "") AS ?source)
+    BIND (COALESCE(IF(BOUND(?doiTmp), ?doiTmp, 1/0), "") AS ?doi)
+}
+"""
+
+_cache = TTLCache(maxsize=256, ttl=CACHE_TTL, name="expdata", keep_stale=True)
+
+
+def fetch_expdata(wikidata_qid):
+    """
+    Fetch the experimental data rows of a compound from Wikidata (qlever)
+
+    Results are cached for CACHE_TTL seconds so paging through the rows
+    does not query qlever again. When qlever fails, an expired result of
+    the compound is returned if there is one.
+
+    Args:
+        wikidata_qid (str): Wikidata QID, e.g. Q2270
+
+    Returns:
+        list: One dict per statement with propEntityLabel, value, unitsLabel,
+            source, doi and seeAlso
+    """
+
+    def load():
+        qid = sparql.Iri("http://www.wikidata.org/entity/" + wikidata_qid)
+        result = sparql.qlever_wikidata().select(EXPDATA_QUERY, params={"qid": qid})
+        return expdata_rows(result.rows)
+
+    try:
+        return _cache.get_or_load(wikidata_qid, load)
+    except sparql.SparqlError:
+        stale = _cache.get_stale(wikidata_qid)
+        if stale is None:
+            raise
+        return stale
+
+
+def expdata_rows(rows):
+    """Turn the row tuples of EXPDATA_QUERY into the dicts returned by fetch_expdata."""
+    return [
+        {
+            "propEntityLabel": label,
+            "value": value,
+            "unitsLabel": units,
+            "source": source or "",
+            "doi": doi or "",
+            "seeAlso": statement,
+        }
+        for label, value, units, source, doi, statement in rows
+    ]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def summarize(rows):
+    """
+    Aggregate experimental data rows per property and unit
+
+    Args:
+        rows (list): Rows as returned by fetch_expdata
+
+    Returns:
+        list: One dict per (propEntityLabel, unitsLabel) with count, min,
+            max, median (None when no value is numeric) and the distinct
+            non-empty sources and dois, sorted by property label
+    """
+    if not rows:
+        return []
+
+    groups = {}
+    group_ids = np.fromiter(
+        (groups.setdefault((r["propEntityLabel"], r["unitsLabel"]), len(groups)) for r in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    values = np.fromiter((_to_float(r["value"]) for r in rows), dtype=np.float64, count=len(rows))
+
+    # Sort by group, then by value; NaN (non-numeric) values sort last within a group.
+    order = np.lexsort((values, group_ids))
+    sorted_ids = group_ids[order]
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    counts = ends - starts
+    numeric = np.add.reduceat((~np.isnan(sorted_values)).astype(np.int64), starts)
+
+    has_numeric = numeric > 0
+    last = starts + np.maximum(numeric - 1, 0)
+    low = starts + np.maximum(numeric - 1, 0) // 2
+    high = starts + numeric // 2
+    minimum = np.where(has_numeric, sorted_values[starts], np.nan)
+    maximum = np.where(has_numeric, sorted_values[last], np.nan)
+    median = np.where(has_numeric, (sorted_values[low] + sorted_values[np.minimum(high, last)]) / 2, np.nan)
+
+    keys = list(groups)
+    summary = []
+    for i, gid in enumerate(sorted_ids[starts]):
+        label, units = keys[gid]
+        members = [rows[j] for j in order[starts[i]:ends[i]]]
+        summary.append(
+            {
+                "propEntityLabel": label,
+                "unitsLabel": units,
+                "count": int(counts[i]),
+                "min": None if not has_numeric[i] else float(minimum[i]),
+                "max": None if not has_numeric[i] else float(maximum[i]),
+                "median": None if not has_numeric[i] else float(median[i]),
+                "sources": sorted({r["source"] for r in members} - {""}),
+                "dois": sorted({r["doi"] for r in members} - {""}),
+            }
+        )
+    summary.sort(key=lambda g: (g["propEntityLabel"].lower(), g["unitsLabel"]))
+    return summary
+
+
+def paginate(rows, page=1, page_size=50, prop=None, units=None):
+    """
+    Return one page of experimental data rows, optionally for one property/unit
+
+    Returns:
+        dict: total (matching rows), page, page_size and rows
+    """
+    if prop is not None:
+        rows = [r for r in rows if r["propEntityLabel"] == prop]
+    if units is not None:
+        rows = [r for r in rows if r["unitsLabel"] == units]
+    start = (page - 1) * page_size
+    return {
+        "total": len(rows),
+        "page": page,
+        "page_size": page_size,
+        "rows": rows[start:start + page_size],
+    }
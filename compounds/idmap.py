@@ -0,0 +1,75 @@
+from upstream import sparql
+from upstream.cache import TTLCache
+from upstream.refresh import RefreshingValue
+
+
+REFRESH_INTERVAL = 6 * 3600  # Seconds between two bulk reloads of the map.
+LOOKUP_TTL = 600  # Seconds the single-ID lookup of an ID missing from the map is kept, also when it found nothing.
+
+# All Compound Wiki items with a Wikidata identifier (P5) in one query.
+IDMAP_QUERY = """
+PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>
+PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>
+
+SELECT (substr(str(?cmp), 45) as ?ID) ?wikidata WHERE {
+  ?cmp wdt:P5 ?wikidata .
+}
+"""
+
+# The Wikidata identifier of one Compound Wiki item, for IDs added since the last bulk load.
+LOOKUP_QUERY = """
+PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>
+PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>
+
+SELECT ?wikidata WHERE {
+  $cmp wdt:P5 ?wikidata .
+}
+LIMIT 1
+"""
+
+
+def load_wikidata_map():
+    """
+    Fetch the Compound Wiki ID to Wikidata QID mapping for the whole collection
+
+    Returns:
+        dict: {compound wiki id: wikidata qid}, e.g. {"Q37": "Q2270"}
+    """
+    result = sparql.compoundwiki().select(IDMAP_QUERY, timeout=(5, 120))
+    return dict(result.rows)
+
+
+def lookup_wikidata_qid(cwid):
+    """
+    Fetch the Wikidata QID of one Compound Wiki ID
+
+    Returns:
+        str: The QID, or None if the item has none
+    """
+    result = sparql.compoundwiki().select(LOOKUP_QUERY, params={"cmp": sparql.PrefixedName("wd:" + cwid)})
+    return result.rows[0][0] if result.rows else None
+
+
+wikidata_map = RefreshingValue("wikidata-map", load_wikidata_map, REFRESH_INTERVAL)
+_lookups = TTLCache(maxsize=1024, ttl=LOOKUP_TTL, name="wikidata-id")
+
+
+def wikidata_qid(cwid):
+    """
+    Return the Wikidata QID for a Compound Wiki ID, or None if it has none
+
+    IDs missing from the bulk map (e.g. items added since it was loaded)
+    are looked up one by one; the result, also None, is kept for
+    LOOKUP_TTL seconds.
+
+    Args:
+        cwid (str): Compound Wiki ID, e.g. Q37
+
+    Raises:
+        Exception: If the map has never been loaded and loading it fails
+        sparql.SparqlError: If the single-ID lookup fails
+    """
+    qid = wikidata_map.get().get(cwid)
+    if qid is None:
+        qid = _lookups.get_or_load(cwid, lambda: lookup_wikidata_qid(cwid))
+    return qid
@@ -0,0 +1,102 @@
+from upstream import sparql
+from upstream.refresh import RefreshingValue
+
+
+REFRESH_INTERVAL = 24 * 3600  # Seconds between two reloads of the property catalog.
+
+# Properties shown on the Identifiers and Toxicology tabs of the compound page.
+IDENTIFIER_PROPERTIES = (
+    "P13", "P22", "P23", "P26", "P27", "P28", "P36", "P41", "P43", "P44", "P45",
+)
+TOXICOLOGY_PROPERTIES = ("P17", "P19", "P4")
+
+DIRECT_PREFIX = "https://compoundcloud.wikibase.cloud/prop/direct/"
+
+CATALOG_QUERY = """
+PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>
+PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>
+
+SELECT ?property ?propertyLabel ?formatterURL WHERE {
+  VALUES ?property { %s }
+  OPTIONAL { ?property wdt:P6 ?formatterURL }
+  SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+}
+"""
+
+# Raw values only: labels and formatter URLs come from the property catalog.
+VALUES_QUERY = """
+PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>
+PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>
+
+SELECT ?valueProp ?value WHERE {
+  VALUES ?valueProp { %s }
+  $cmp ?valueProp ?value .
+}
+"""
+
+
+def load_property_catalog():
+    """
+    Fetch label and formatter URL of every property used on the compound page
+
+    Returns:
+        dict: {property id: {"label": str, "formatterURL": str}}
+    """
+    properties = IDENTIFIER_PROPERTIES + TOXICOLOGY_PROPERTIES
+    query = CATALOG_QUERY % " ".join("wd:" + pid for pid in properties)
+    result = sparql.compoundwiki().select(query)
+    catalog = {}
+    for prop, label, formatter in result.rows:
+        pid = prop.rsplit("/", 1)[-1]
+        entry = catalog.setdefault(pid, {"label": label or pid, "formatterURL": ""})
+        if formatter and not entry["formatterURL"]:
+            entry["formatterURL"] = formatter
+    return catalog
+
+
+property_catalog = RefreshingValue("property-catalog", load_property_catalog, REFRESH_INTERVAL)
+
+
+def compound_property_values(cwid, properties):
+    """
+    Fetch the values of the given properties for one compound
+
+    Args:
+        cwid (str): Compound Wiki ID, e.g. Q37
+        properties (tuple): Property ids, e.g. IDENTIFIER_PROPERTIES
+
+    Returns:
+        list: One dict per value with 'propertyLabel', 'value' and
+            'formatterURL', plus an empty entry for every property without
+            a value, in the order of properties
+    """
+    catalog = property_catalog.get()
+    query = VALUES_QUERY % " ".join("wdt:" + pid for pid in properties)
+    result = sparql.compoundwiki().select(
+        query, params={"cmp": sparql.PrefixedName("wd:" + cwid)}
+    )
+    return property_entries(result.rows, catalog, properties)
+
+
+def property_entries(rows, catalog, properties):
+    """
+    Combine the (property IRI, value) rows of VALUES_QUERY with the labels
+    and formatter URLs of the property catalog, as returned by
+    compound_property_values
+    """
+    values = {}
+    for value_prop, value in rows:
+        values.setdefault(value_prop[len(DIRECT_PREFIX):], []).append(value)
+
+    entries = []
+    for pid in properties:
+        meta = catalog.get(pid, {"label": pid, "formatterURL": ""})
+        for value in dict.fromkeys(values.get(pid, [""])):
+            entries.append(
+                {
+                    "propertyLabel": meta["label"],
+                    "value": value,
+                    "formatterURL": meta["formatterURL"] if value else "",
+                }
+            )
+    return entries
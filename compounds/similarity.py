@@ -0,0 +1,302 @@
+import re
+import zlib
+
+import numpy as np
+
+from upstream import sparql
+from upstream.refresh import RefreshingValue
+
+
+# Full list of compounds with their SMILES (see static/misc/get_compound_list.py).
+CATALOG_QUERY = """
+PREFIX wd: <https://compoundcloud.wikibase.cloud/entity/>
+PREFIX wdt: <https://compoundcloud.wikibase.cloud/prop/direct/>
+
+SELECT (substr(str(?cmp), 45) as ?ID) (?cmpLabel AS ?Term) ?SMILES
+WHERE{
+  { ?parent wdt:P21 wd:Q2059 ; wdt:P29 ?cmp . } UNION { ?cmp wdt:P21 wd:Q2059 . }
+  ?cmp rdfs:label ?cmpLabel . FILTER(lang(?cmpLabel) = 'en')
+  OPTIONAL { ?cmp wdt:P7 ?chiralSMILES }
+  OPTIONAL { ?cmp wdt:P12 ?nonchiralSMILES }
+  BIND (COALESCE(IF(BOUND(?chiralSMILES), ?chiralSMILES, 1/0), IF(BOUND(?nonchiralSMILES), ?nonchiralSMILES, 1/0),"") AS ?SMILES)
+}
+"""
+
+FP_BITS = 1024  # Fingerprint length, must be a multiple of 64.
+FP_MAX_PATH = 6  # Longest linear path (in atoms) hashed into the fingerprint.
+INDEX_TTL = 24 * 3600  # Seconds between two rebuilds of the compound index.
+
+_SMILES_TOKEN = re.compile(
+    r"\[[^\]]+\]|Br|Cl|[BCNOPSFI*]|[bcnops]|[-=#$:/\\.()]|%\d{2}|\d"
+)
+_BRACKET_ATOM = re.compile(r"\[\d*([A-Z][a-z]?|[a-z][a-z]?|\*)")
+_BOND_SYMBOLS = {"-": "-", "=": "=", "#": "#", "$": "$", ":": ":", "/": "-", "\\": "-"}
+
+# Popcount on 64-bit words; np.bitwise_count only exists in NumPy >= 2.0.
+if hasattr(np, "bitwise_count"):
+
+    def _popcount(words):
+        return np.bitwise_count(words)
+
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        as_bytes = words.view(np.uint8).reshape(words.shape + (8,))
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def parse_smiles(smiles):
+    """
+    Parse a SMILES string into a simple molecular graph
+
+    Only the information needed for path fingerprints is kept: the element
+    symbol and aromaticity of every atom, and the bond order between atoms.
+    Stereo, charges, isotopes and hydrogen counts are ignored.
+
+    Args:
+        smiles (str): SMILES string
+
+    Returns:
+        tuple: (atoms, neighbours) where atoms is a list of atom labels and
+            neighbours a list of [(atom index, bond label), ...] per atom
+
+    Raises:
+        ValueError: If the SMILES cannot be parsed
+    """
+    atoms = []
+    neighbours = []
+    branch_stack = []
+    open_rings = {}
+    previous = None
+    pending_bond = None
+    position = 0
+
+    def add_bond(a, b, symbol):
+        if symbol is None:
+            aromatic = atoms[a].islower() and atoms[b].islower()
+            symbol = ":" if aromatic else "-"
+        neighbours[a].append((b, symbol))
+        neighbours[b].append((a, symbol))
+
+    for match in _SMILES_TOKEN.finditer(smiles):
+        if match.start() != position:
+            raise ValueError(f"Unexpected character in SMILES at {position}: {smiles!r}")
+        position = match.end()
+        token = match.group()
+
+        if token[0] == "[" or token[0].isalpha() or token == "*":
+            if token[0] == "[":
+                element = _BRACKET_ATOM.match(token)
+                if not element:
+                    raise ValueError(f"Invalid bracket atom {token!r} in {smiles!r}")
+                token = element.group(1)
+            atoms.append(token)
+            neighbours.append([])
+            current = len(atoms) - 1
+            if previous is not None:
+                add_bond(previous, current, pending_bond)
+            previous = current
+            pending_bond = None
+        elif token in _BOND_SYMBOLS:
+            pending_bond = _BOND_SYMBOLS[token]
+        elif token == ".":
+            previous = None
+            pending_bond = None
+        elif token == "(":
+            if previous is None:
+                raise ValueError(f"Branch without a preceding atom in {smiles!r}")
+            branch_stack.append(previous)
+        elif token == ")":
+            if not branch_stack:
+                raise ValueError(f"Unbalanced parentheses in {smiles!r}")
+            previous = branch_stack.pop()
+        else:
+            # Ring closure digit (or %nn for ring numbers above 9).
+            if previous is None:
+                raise ValueError(f"Ring closure without a preceding atom in {smiles!r}")
+            ring = int(token.lstrip("%"))
+            if ring in open_rings:
+                start, start_bond = open_rings.pop(ring)
+                add_bond(start, previous, pending_bond or start_bond)
+            else:
+                open_rings[ring] = (previous, pending_bond)
+            pending_bond = None
+
+    if position != len(smiles) or branch_stack or open_rings:
+        raise ValueError(f"Incomplete SMILES: {smiles!r}")
+    if not atoms:
+        raise ValueError("Empty SMILES")
+    return atoms, neighbours
+
+
+def smiles_fingerprint(smiles, n_bits=FP_BITS, max_path=FP_MAX_PATH):
+    """
+    Compute a hashed linear-path fingerprint for a SMILES string
+
+    Every simple path of 1 up to max_path atoms in the molecular graph is
+    written as an atom/bond string, canonicalised over its direction and
+    hashed into one bit. Because every path of a substructure is also a
+    path of the molecule that contains it, the fingerprint can be used for
+    substructure screening as well as for similarity.
+
+    Args:
+        smiles (str): SMILES string
+        n_bits (int): Fingerprint length in bits (multiple of 64)
+        max_path (int): Longest path, counted in atoms
+
+    Returns:
+        numpy.ndarray: Fingerprint packed into n_bits // 64 uint64 words
+    """
+    atoms, neighbours = parse_smiles(smiles)
+    bits = np.zeros(n_bits, dtype=bool)
+
+    def walk(path, labels):
+        forward = "".join(labels)
+        backward = "".join(reversed(labels))
+        key = min(forward, backward).encode()
+        bits[zlib.crc32(key) % n_bits] = True
+        if len(path) == max_path:
+            return
+        for nxt, bond in neighbours[path[-1]]:
+            if nxt not in path:
+                path.append(nxt)
+                labels.extend((bond, atoms[nxt]))
+                walk(path, labels)
+                del labels[-2:]
+                path.pop()
+
+    for start in range(len(atoms)):
+        walk([start], [atoms[start]])
+
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+class FingerprintIndex:
+    """In-memory fingerprint index over a set of compounds"""
+
+    def __init__(self, compounds, n_bits=FP_BITS):
+        """
+        Build the index
+
+        Args:
+            compounds (list): List of dicts with 'id', 'label' and 'SMILES' keys.
+                Compounds without a parsable SMILES are skipped.
+            n_bits (int): Fingerprint length in bits
+        """
+        self.n_bits = n_bits
+        self.ids = []
+        self.labels = []
+        self.smiles = []
+        rows = []
+        for compound in compounds:
+            smiles = compound.get("SMILES", "")
+            if not smiles:
+                continue
+            try:
+                fp = smiles_fingerprint(smiles, n_bits)
+            except ValueError:
+                continue
+            self.ids.append(compound["id"])
+            self.labels.append(compound.get("label", ""))
+            self.smiles.append(smiles)
+            rows.append(fp)
+
+        words = n_bits // 64
+        self.fingerprints = (
+            np.vstack(rows) if rows else np.zeros((0, words), dtype=np.uint64)
+        )
+        self.bit_counts = _popcount(self.fingerprints).sum(axis=1, dtype=np.int32)
+        self.positions = {cid: i for i, cid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fingerprint_of(self, cwid):
+        """Return the stored fingerprint of a compound, or None if it is not indexed."""
+        row = self.positions.get(cwid)
+        return None if row is None else self.fingerprints[row]
+
+    def tanimoto(self, query_fp):
+        """Tanimoto similarity of the query fingerprint against every indexed compound."""
+        common = _popcount(self.fingerprints & query_fp).sum(axis=1, dtype=np.int32)
+        union = self.bit_counts + int(_popcount(query_fp).sum()) - common
+        return np.divide(
+            common, union, out=np.zeros(len(common), dtype=np.float64), where=union > 0
+        )
+
+    def top_k(self, query_fp, k=10, threshold=0.0, exclude=None):
+        """
+        Return the k most similar compounds
+
+        Args:
+            query_fp (numpy.ndarray): Packed query fingerprint
+            k (int): Maximum number of hits
+            threshold (float): Minimum Tanimoto similarity
+            exclude (str): Optional compound id to leave out (e.g. the query itself)
+
+        Returns:
+            list: Hits as dicts with id, label, SMILES and similarity, best first
+        """
+        scores = self.tanimoto(query_fp)
+        if exclude in self.positions:
+            scores[self.positions[exclude]] = -1.0
+        candidates = np.flatnonzero(scores >= max(threshold, 0.0))
+        if len(candidates) > k:
+            best = np.argpartition(scores[candidates], -k)[-k:]
+            candidates = candidates[best]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self._hit(i, similarity=round(float(scores[i]), 4)) for i in order]
+
+    def substructure_candidates(self, query_fp, limit=100):
+        """
+        Screen for compounds that may contain the query as a substructure
+
+        A compound passes when its fingerprint has every bit of the query
+        set. This is a necessary, not sufficient, condition: hits are
+        candidates that still need an exact substructure match.
+
+        Args:
+            query_fp (numpy.ndarray): Packed query fingerprint
+            limit (int): Maximum number of candidates returned
+
+        Returns:
+            tuple: (candidates, total) with up to limit hit dicts and the
+                total number of compounds passing the screen
+        """
+        passes = np.all((self.fingerprints & query_fp) == query_fp, axis=1)
+        rows = np.flatnonzero(passes)
+        return [self._hit(i) for i in rows[:limit]], len(rows)
+
+    def _hit(self, row, **extra):
+        return {
+            "id": self.ids[row],
+            "label": self.labels[row],
+            "SMILES": self.smiles[row],
+        } | extra
+
+
+def load_compound_catalog():
+    """
+    Fetch the id, label and SMILES of every compound in the Compound Wiki
+
+    Returns:
+        list: List of dicts with 'id', 'label' and 'SMILES' keys
+    """
+    result = sparql.compoundwiki().select(CATALOG_QUERY, timeout=(5, 120))
+    return [
+        {"id": cid, "label": label or "", "SMILES": smiles or ""}
+        for cid, label, smiles in result.rows
+    ]
+
+
+compound_index = RefreshingValue(
+    "compound-index",
+    lambda: FingerprintIndex(load_compound_catalog()),
+    INDEX_TTL,
+)
+
+
+def get_index():
+    """Return the shared compound fingerprint index, loading it on first use."""
+    return compound_index.get()
@@ -0,0 +1,188 @@
+import csv
+import os
+import threading
+
+import numpy as np
+
+from expression.store import DATA_DIR, LEVELS, get_store
+
+
+MIE_MODELS_CSV = os.path.join(DATA_DIR, "caseMieModel.csv")
+
+# Output field names for the columns of caseMieModel.csv.
+CSV_FIELDS = {
+    "case_study": "mie_query",
+    "model": "qsprpred_model",
+    "uniprot": "uniprot ID inferred from qspred name",
+    "protein": "protein name uniprot",
+    "gene_symbol": "Gene Symbol Uniprot",
+    "aop_url": "AOP",
+    "mie_name": "MIE name",
+    "mie": "MIE/KE identifier in AOP wiki",
+    "mie_description": "description MIE/KE from AOP wiki",
+    "mie_direction": "mie_direction",
+    "ensembl": "Ensembl",
+}
+
+
+def load_mie_models(path=MIE_MODELS_CSV):
+    """
+    Read the MIE to qsprpred model to gene mapping of the case studies
+
+    Args:
+        path (str): Path of caseMieModel.csv
+
+    Returns:
+        list: One dict per row with an Ensembl id, with the keys of CSV_FIELDS
+            plus 'aop' (the AOP number, e.g. "464")
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    models = []
+    for row in rows:
+        model = {name: (row.get(column) or "").strip() for name, column in CSV_FIELDS.items()}
+        if not model["ensembl"]:
+            continue
+        model["aop"] = model["aop_url"].rstrip("/").rsplit("/", 1)[-1] if model["aop_url"] else ""
+        models.append(model)
+    return models
+
+
+def _index(keys):
+    index = {}
+    for position, key in enumerate(keys):
+        if key:
+            index.setdefault(key.lower(), []).append(position)
+    return {key: np.array(positions, dtype=np.uint32) for key, positions in index.items()}
+
+
+class MieExpressionJoin:
+    """
+    Precomputed join of MIE -> model -> gene -> tissue expression
+
+    Every pair of a mapping row and an expression row of its Ensembl gene is
+    one joined row, stored as two parallel arrays; AOP, MIE and gene indexes
+    point into them, and organ and level filters use the codes of the
+    expression store.
+    """
+
+    def __init__(self, models, store):
+        """
+        Args:
+            models (list): Mapping rows as returned by load_mie_models
+            store (ExpressionStore): Expression store to join with
+        """
+        self.models = models
+        self.store = store
+        model_ids, row_ids = [], []
+        for i, model in enumerate(models):
+            rows = store.rows_with("Gene", [model["ensembl"]])
+            model_ids.extend([i] * len(rows))
+            row_ids.extend(rows.tolist())
+        self.model_ids = np.array(model_ids, dtype=np.uint32)
+        self.row_ids = np.array(row_ids, dtype=np.uint32)
+        self.indexes = {
+            field: _index([models[i][field] for i in self.model_ids])
+            for field in ("aop", "mie", "ensembl", "gene_symbol")
+        }
+
+    def _select(self, aop=None, mie=None, gene=None, organ=None, min_level=None):
+        selected = np.arange(len(self.model_ids), dtype=np.uint32)
+        for field, value in (("aop", aop), ("mie", mie)):
+            if value:
+                selected = np.intersect1d(selected, self.indexes[field].get(value.lower(), []))
+        if gene:
+            by_gene = np.union1d(
+                self.indexes["ensembl"].get(gene.lower(), []), self.indexes["gene_symbol"].get(gene.lower(), [])
+            )
+            selected = np.intersect1d(selected, by_gene)
+        selected = selected.astype(np.uint32)
+        rows = self.row_ids[selected]
+        if organ:
+            keep = self.store.arrays["codes/Organ_x"][rows] == self.store.code("Organ_x", organ)
+            selected, rows = selected[keep], rows[keep]
+        if min_level:
+            accepted = [self.store.code("Level", level) for level in LEVELS[LEVELS.index(min_level):]]
+            keep = np.isin(self.store.arrays["codes/Level"][rows], [c for c in accepted if c is not None])
+            selected, rows = selected[keep], rows[keep]
+        return selected, rows
+
+    def _expression(self, row):
+        store = self.store
+        return {
+            column: store.dictionaries[column][store.arrays["codes/" + column][row]]
+            for column in ("Tissue", "Cell type", "Level", "Reliability", "Organ_x", "Uberon")
+        }
+
+    def rows(self, offset=0, limit=100, **filters):
+        """
+        Return joined rows, filtered by aop, mie, gene (Ensembl id or symbol),
+        organ and min_level
+
+        Returns:
+            dict: 'total' and 'rows', each row the mapping fields plus the
+                expression columns of one tissue and cell type
+        """
+        selected, rows = self._select(**filters)
+        page = slice(offset, offset + limit)
+        return {
+            "total": int(selected.size),
+            "rows": [
+                {**self.models[m], **self._expression(r)}
+                for m, r in zip(self.model_ids[selected[page]].tolist(), rows[page].tolist())
+            ],
+        }
+
+    def organs(self, min_level="Low", **filters):
+        """
+        Return the organs where the selected MIE genes are expressed
+
+        Args:
+            min_level (str): Lowest expression level that counts as expressed
+
+        Returns:
+            list: One dict per organ with its 'tissues', 'genes' (symbols)
+                and 'mies', sorted by organ
+        """
+        selected, rows = self._select(min_level=min_level, **filters)
+        organs = {}
+        for m, r in zip(self.model_ids[selected].tolist(), rows.tolist()):
+            model = self.models[m]
+            expression = self._expression(r)
+            entry = organs.setdefault(expression["Organ_x"], {"tissues": set(), "genes": set(), "mies": set()})
+            entry["tissues"].add(expression["Tissue"])
+            entry["genes"].add(model["gene_symbol"] or model["ensembl"])
+            if model["mie"]:
+                entry["mies"].add(model["mie"])
+        return [
+            {"organ": organ, **{key: sorted(values) for key, values in entry.items()}}
+            for organ, entry in sorted(organs.items())
+        ]
+
+
+_join = None
+_join_key = None
+_lock = threading.Lock()
+
+
+def get_join():
+    """
+    Return the MIE expression join, rebuilding it when caseMieModel.csv or
+    the expression data changed
+
+    The expression data is compared by the source sha256 of the current
+    store, which get_store replaces when the dataset file changes.
+
+    Raises:
+        OSError, ValueError: If the mapping or the expression data cannot be read
+    """
+    global _join, _join_key
+    stat = os.stat(MIE_MODELS_CSV)
+    store = get_store()
+    key = (stat.st_mtime_ns, stat.st_size, store.source_sha256)
+    if key != _join_key:
+        with _lock:
+            if key != _join_key:
+                _join = MieExpressionJoin(load_mie_models(), store)
+                _join_key = key
+    return _join
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import zipfile
+
+import numpy as np
+
+from upstream.diskcache import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "data")
+SOURCE_ZIP = os.path.join(DATA_DIR, "organ_tissue_gene.json.zip")
+SOURCE_SUBSET = os.path.join(DATA_DIR, "organ_tissue_gene_subset.json")
+
+# Columns of the source rows, in output order.
+COLUMNS = ("Gene", "Gene name", "Tissue", "Cell type", "Level", "Reliability", "Organ_x", "Uberon")
+# Columns with a row index, by query parameter name.
+INDEXED = {"gene": "Gene", "gene_name": "Gene name", "tissue": "Tissue", "organ": "Organ_x", "level": "Level"}
+LEVELS = ("Not detected", "Low", "Medium", "High")
+
+MAGIC = b"VHPEXPR1"
+ALIGN = 64
+
+
+def source_path():
+    """
+    Return the path of the expression dataset (a zip member path is given as
+    'archive.zip/member')
+
+    The full dataset is expected as organ_tissue_gene.json inside
+    organ_tissue_gene.json.zip; without it the subset JSON is used.
+    """
+    if os.path.exists(SOURCE_ZIP):
+        with zipfile.ZipFile(SOURCE_ZIP) as archive:
+            for name in archive.namelist():
+                if os.path.basename(name) == "organ_tissue_gene.json":
+                    return os.path.join(SOURCE_ZIP, name)
+    return SOURCE_SUBSET
+
+
+def _read_source(path):
+    if ".zip" + os.sep in path:
+        archive_path, member = path.split(".zip" + os.sep, 1)
+        with zipfile.ZipFile(archive_path + ".zip") as archive:
+            return archive.read(member)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _code_dtype(size):
+    return np.uint8 if size <= 0xFF else np.uint16 if size <= 0xFFFF else np.uint32
+
+
+def build_store(raw, out_path):
+    """
+    Encode the expression rows and write them to a binary store file
+
+    Args:
+        raw (bytes): Source JSON, {ensembl id: [row, ...]} or a list of rows
+        out_path (str): Path of the file to write
+    """
+    data = json.loads(raw)
+    rows = [row for group in data.values() for row in group] if isinstance(data, dict) else data
+    rows.sort(key=lambda row: (row.get("Gene", ""), row.get("Tissue", ""), row.get("Cell type", "")))
+
+    dictionaries = {}
+    arrays = {}
+    for column in COLUMNS:
+        values = [row.get(column) or "" for row in rows]
+        dictionary = sorted(set(values))
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        dictionaries[column] = dictionary
+        arrays["codes/" + column] = np.fromiter(
+            (lookup[value] for value in values), dtype=_code_dtype(len(dictionary)), count=len(values)
+        )
+    for column in INDEXED.values():
+        # CSR layout: rows of value code c are order[offsets[c]:offsets[c + 1]].
+        codes = arrays["codes/" + column]
+        order = np.argsort(codes, kind="stable").astype(np.uint32)
+        offsets = np.searchsorted(codes[order], np.arange(len(dictionaries[column]) + 1)).astype(np.uint32)
+        arrays["order/" + column] = order
+        arrays["offsets/" + column] = offsets
+
+    specs = {}
+    position = 0
+    for name, array in arrays.items():
+        specs[name] = {"dtype": array.dtype.str, "count": int(array.size), "offset": position}
+        position += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps(
+        {
+            "source_sha256": hashlib.sha256(raw).hexdigest(),
+            "rows": len(rows),
+            "dictionaries": dictionaries,
+            "arrays": specs,
+        }
+    ).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+        for name, array in arrays.items():
+            f.seek(data_start + specs[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp_path, out_path)
+
+
+class ExpressionStore:
+    """
+    Organ-tissue-gene expression rows in dictionary-encoded columnar arrays
+
+    Every column keeps its distinct strings once plus one small integer code
+    per row; per-value row indexes (CSR layout) answer lookups by gene,
+    tissue, organ or level without scanning. The arrays are memory-mapped
+    from the store file written by build_store, so worker processes share
+    the pages and start without parsing JSON.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Store file written by build_store
+
+        Raises:
+            ValueError: If the file is not an expression store
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an expression store")
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], "little")
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self._mmap[len(MAGIC) + 8:header_end])
+        data_start = -(-header_end // ALIGN) * ALIGN
+
+        self.path = path
+        self.source_sha256 = header["source_sha256"]
+        self.rows = header["rows"]
+        self.dictionaries = header["dictionaries"]
+        self.arrays = {
+            name: np.frombuffer(
+                self._mmap, dtype=spec["dtype"], count=spec["count"], offset=data_start + spec["offset"]
+            )
+            for name, spec in header["arrays"].items()
+        }
+        # Case-insensitive value lookups for the indexed columns.
+        self._lookup = {
+            column: {value.lower(): code for code, value in enumerate(self.dictionaries[column])}
+            for column in INDEXED.values()
+        }
+
+    def code(self, column, value):
+        """Return the code of a value of an indexed column (case-insensitive), or None."""
+        return self._lookup[column].get(value.lower())
+
+    def rows_with(self, column, values):
+        """Return the ids of the rows whose indexed column has one of the values."""
+        order = self.arrays["order/" + column]
+        offsets = self.arrays["offsets/" + column]
+        codes = dict.fromkeys(self.code(column, value) for value in values)
+        parts = [order[offsets[c]:offsets[c + 1]] for c in codes if c is not None]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+
+    def query(self, filters, min_level=None, offset=0, limit=100):
+        """
+        Select expression rows
+
+        Args:
+            filters (dict): {parameter name in INDEXED: list of accepted values};
+                values are matched case-insensitively, filters are combined with AND
+            min_level (str): Only rows with at least this expression level (see LEVELS)
+            offset (int): Number of matching rows to skip
+            limit (int): Maximum number of rows returned
+
+        Returns:
+            dict: 'total' number of matching rows and the selected 'rows' as
+                dicts with the source column names, ordered by gene and tissue
+        """
+        selected = None
+        # Intersect the row sets of the filters, smallest first.
+        candidates = sorted(
+            (self.rows_with(INDEXED[name], values) for name, values in filters.items() if values),
+            key=len,
+        )
+        for rows in candidates:
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+        if selected is None:
+            selected = np.arange(self.rows, dtype=np.uint32)
+        if min_level is not None:
+            accepted = self.rows_with("Level", LEVELS[LEVELS.index(min_level):])
+            selected = np.intersect1d(selected, accepted, assume_unique=True)
+        selected = np.sort(selected)
+
+        page = selected[offset:offset + limit]
+        columns = {column: self.arrays["codes/" + column][page] for column in COLUMNS}
+        return {
+            "total": int(selected.size),
+            "rows": [
+                {column: self.dictionaries[column][columns[column][i]] for column in COLUMNS}
+                for i in range(page.size)
+            ],
+        }
+
+    def values(self, name):
+        """Return the distinct values of an indexed column, by parameter name."""
+        return list(self.dictionaries[INDEXED[name]])
+
+
+_store = None
+_store_key = None
+_lock = threading.Lock()
+
+
+def store_path(raw):
+    """Path of the store file for the given source content."""
+    return os.path.join(CACHE_DIR, f"expression-{hashlib.sha256(raw).hexdigest()[:16]}.bin")
+
+
+def _source_key(path):
+    """Path, mtime and size of the source file (the archive of a zip member)."""
+    file_path = path.split(".zip" + os.sep, 1)[0] + ".zip" if ".zip" + os.sep in path else path
+    stat = os.stat(file_path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def get_store():
+    """
+    Return the expression store, building the store file first if the source
+    dataset changed since it was built
+
+    The source file is checked on every call: when its mtime or size
+    changed, it is read again and, if its sha256 differs from that of the
+    current store, a new store replaces the current one. Callers holding
+    the old store keep using it until they are done.
+
+    Run `python -m expression.store` to build the file ahead of time.
+
+    Raises:
+        OSError, ValueError: If the dataset cannot be read or encoded
+    """
+    global _store, _store_key
+    key = _source_key(source_path())
+    if key != _store_key:
+        with _lock:
+            if key != _store_key:
+                raw = _read_source(key[0])
+                if _store is None or hashlib.sha256(raw).hexdigest() != _store.source_sha256:
+                    path = store_path(raw)
+                    if not os.path.exists(path):
+                        os.makedirs(CACHE_DIR, exist_ok=True)
+                        build_store(raw, path)
+                        logger.info("Built expression store %s", path)
+                    _store = ExpressionStore(path)
+                _store_key = key
+    return _store
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    store = get_store()
+    print(f"{store.path}: {store.rows} rows")
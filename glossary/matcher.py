@@ -0,0 +1,152 @@
+import collections
+
+
+def _fold(char):
+    # Case folding per UTF-16 code unit, mirrored by glossary_highlighter.js:
+    # characters whose lowercase form has another length are kept as they are,
+    # so match offsets in the original text stay valid.
+    lower = char.lower()
+    return lower if len(lower) == 1 else char
+
+
+def _is_word(char):
+    # Word characters as in JavaScript's \b.
+    return char.isascii() and (char.isalnum() or char == "_")
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over the labels and synonyms of the glossary terms
+
+    All terms are found in a single pass over the text, independent of the
+    number of terms. The automaton is built once per glossary version and
+    shipped to the browser with to_json(), where glossary_highlighter.js runs
+    the same scan.
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns (iterable): (text, term index) pairs; when two terms share
+                the same text (case-insensitively) the first one wins
+        """
+        children = [{}]
+        term = [-1]
+        length = [0]
+        for text, index in patterns:
+            # Characters outside the BMP are two code units in JavaScript and
+            # would break the offsets the browser computes.
+            if not text or any(ord(c) > 0xFFFF for c in text):
+                continue
+            state = 0
+            for char in map(_fold, text):
+                nxt = children[state].get(char)
+                if nxt is None:
+                    nxt = len(children)
+                    children[state][char] = nxt
+                    children.append({})
+                    term.append(-1)
+                    length.append(0)
+                state = nxt
+            if term[state] == -1:
+                term[state] = index
+                length[state] = len(text)
+
+        # Breadth-first renumbering, so the serialized edges of a state are
+        # contiguous and the root is state 0.
+        order = [0]
+        for state in order:
+            order.extend(children[state][c] for c in sorted(children[state]))
+        number = {old: new for new, old in enumerate(order)}
+
+        self.children = [{c: number[t] for c, t in children[old].items()} for old in order]
+        self.term = [term[old] for old in order]
+        self.length = [length[old] for old in order]
+        self.fail = [0] * len(order)
+        self.link = [-1] * len(order)
+
+        queue = collections.deque(self.children[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.children[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.children[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.children[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                suffix = self.fail[nxt]
+                self.link[nxt] = suffix if self.term[suffix] != -1 else self.link[suffix]
+                queue.append(nxt)
+
+    def __len__(self):
+        return len(self.children)
+
+    def matches(self, text, whole_words=True):
+        """
+        Find the glossary terms in a text
+
+        Overlapping matches are resolved leftmost-longest, which is what the
+        highlighter shows.
+
+        Args:
+            text (str): Text to scan
+            whole_words (bool): Only accept matches on word boundaries
+
+        Returns:
+            list: Non-overlapping (start, end, term index) tuples, by start
+        """
+        found = []
+        state = 0
+        for i, char in enumerate(text):
+            char = _fold(char)
+            while state and char not in self.children[state]:
+                state = self.fail[state]
+            state = self.children[state].get(char, 0)
+            out = state if self.term[state] != -1 else self.link[state]
+            while out != -1:
+                start = i + 1 - self.length[out]
+                if not whole_words or self._on_boundary(text, start, i + 1):
+                    found.append((start, i + 1, self.term[out]))
+                out = self.link[out]
+
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        end = 0
+        for match in found:
+            if match[0] >= end:
+                selected.append(match)
+                end = match[1]
+        return selected
+
+    @staticmethod
+    def _on_boundary(text, start, end):
+        before = start > 0 and _is_word(text[start - 1])
+        after = end < len(text) and _is_word(text[end])
+        return before != _is_word(text[start]) and after != _is_word(text[end - 1])
+
+    def to_json(self):
+        """
+        Return the automaton as compact parallel arrays
+
+        The edges of state s are chars[offsets[s]:offsets[s + 1]] leading to
+        targets[offsets[s]:offsets[s + 1]]. term[s] is the term index that
+        ends in s (-1 if none), length[s] its length in characters and link[s]
+        the next state on the fail chain that ends a term.
+        """
+        chars = []
+        targets = []
+        offsets = [0]
+        for edges in self.children:
+            for char in sorted(edges):
+                chars.append(char)
+                targets.append(edges[char])
+            offsets.append(len(chars))
+        return {
+            "chars": "".join(chars),
+            "offsets": offsets,
+            "targets": targets,
+            "fail": self.fail,
+            "term": self.term,
+            "length": self.length,
+            "link": self.link,
+        }
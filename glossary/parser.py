@@ -0,0 +1,76 @@
+import re
+
+
+# Same patterns as static/js/ttl_parser.js, so the server and the browser
+# agree on what counts as a glossary term.
+TERM_BLOCK = re.compile(r"<([^>]+)>\s*\n([\s\S]*?)(?=\n<|\Z)")
+RELATION = re.compile(r"dct:relation\s+<([^>]+)>")
+
+
+def _literal(props, name):
+    match = re.search(name + r'\s+"([^"]+)"(?:@[a-zA-Z-]+)?', props)
+    return match.group(1).strip() if match else ""
+
+
+def parse_glossary(text, min_label_length=2):
+    """
+    Parse the terms of the VHP4Safety glossary (glossary.owl in Turtle syntax)
+
+    Args:
+        text (str): Content of glossary.owl
+        min_label_length (int): Terms with a shorter label are skipped
+
+    Returns:
+        list: One dict per owl:Class with 'uri', 'label', 'definition',
+            'synonyms' and 'relations' (URIs of dct:relation objects), in
+            file order
+    """
+    terms = []
+    for match in TERM_BLOCK.finditer(text):
+        uri, props = match.groups()
+        if "rdf:type" not in props or "owl:Class" not in props:
+            continue
+        label = _literal(props, "rdfs:label")
+        if not label or label == "nan" or len(label) < min_label_length:
+            continue
+        synonym = _literal(props, "ncit:C42610")
+        terms.append(
+            {
+                "uri": uri,
+                "label": label,
+                "definition": _literal(props, "dc:description"),
+                "synonyms": [synonym] if synonym else [],
+                "relations": RELATION.findall(props),
+            }
+        )
+    return terms
+
+
+PROCESS_FLOW_SUFFIX = re.compile(r"\s*\(Process Flow Step\)\s*$", re.IGNORECASE)
+
+
+def process_flow_steps(terms):
+    """
+    Select the Process Flow Steps from the parsed glossary terms
+
+    The steps are the terms with a dct:relation, in glossary order.
+
+    Args:
+        terms (list): Terms as returned by parse_glossary
+
+    Returns:
+        list: One dict per step with 'id' (e.g. VHP0000056), 'uri', 'label'
+            (without the "(Process Flow Step)" suffix), 'definition' and
+            'relation' (URI of the first related term)
+    """
+    return [
+        {
+            "id": term["uri"].split("#", 1)[1] if "#" in term["uri"] else "",
+            "uri": term["uri"],
+            "label": PROCESS_FLOW_SUFFIX.sub("", term["label"]).strip(),
+            "definition": term["definition"],
+            "relation": term["relations"][0],
+        }
+        for term in terms
+        if term["relations"]
+    ]
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+
+from glossary.matcher import TermMatcher
+from glossary.parser import parse_glossary, process_flow_steps
+from upstream import http
+from upstream.refresh import RefreshingValue
+
+
+logger = logging.getLogger(__name__)
+
+GLOSSARY_URL = "https://raw.githubusercontent.com/VHP4Safety/glossary/refs/heads/main/glossary.owl"
+REFRESH_INTERVAL = 3600  # Seconds between two checks for a new glossary version.
+
+
+class GlossarySnapshot:
+    """One version of the glossary: its terms, matcher, process flow steps and serialized index."""
+
+    def __init__(self, text, etag=None):
+        """
+        Args:
+            text (str): Content of glossary.owl
+            etag (str): ETag of the upstream response, used for revalidation
+        """
+        self.etag = etag
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        self.terms = parse_glossary(text)
+        self.process_flow_steps = process_flow_steps(self.terms)
+        self.matcher = TermMatcher(
+            (name, index)
+            for index, term in enumerate(self.terms)
+            for name in [term["label"], *term["synonyms"]]
+        )
+        # Serialized once per version; the index route serves these bytes as they are.
+        self.index_json = json.dumps(
+            {
+                "version": self.version,
+                "terms": [
+                    {key: term[key] for key in ("uri", "label", "definition", "synonyms")}
+                    for term in self.terms
+                ],
+                "matcher": self.matcher.to_json(),
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+def load_glossary():
+    """
+    Fetch glossary.owl and build a new snapshot if it changed
+
+    The request is conditional on the ETag of the current snapshot, so an
+    unchanged glossary is neither downloaded nor parsed again.
+
+    Returns:
+        GlossarySnapshot: The new snapshot, or the current one if unchanged
+    """
+    current = glossary_snapshot.value
+    headers = {"User-Agent": "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"}
+    if current is not None and current.etag:
+        headers["If-None-Match"] = current.etag
+    response = http.get(GLOSSARY_URL, headers=headers, timeout=30)
+    if response.status_code == 304 and current is not None:
+        return current
+    response.raise_for_status()
+    response.encoding = "utf-8"
+    snapshot = GlossarySnapshot(response.text, etag=response.headers.get("ETag"))
+    if current is not None and snapshot.version == current.version:
+        current.etag = snapshot.etag
+        return current
+    logger.info("Loaded glossary version %s with %d terms", snapshot.version, len(snapshot.terms))
+    return snapshot
+
+
+glossary_snapshot = RefreshingValue("glossary", load_glossary, REFRESH_INTERVAL)
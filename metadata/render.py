@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import time
+import urllib.parse
+
+import markdown
+import nh3
+import requests
+
+from upstream import http
+from upstream.diskcache import DiskCache
+
+
+logger = logging.getLogger(__name__)
+
+# Metadata files are only fetched from the VHP4Safety repositories on GitHub.
+ALLOWED_PREFIX = "https://raw.githubusercontent.com/VHP4Safety/"
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists"]
+REVALIDATE_AFTER = 300  # Seconds a rendered file is used before asking GitHub again.
+KEEP_FOR = 7 * 24 * 3600  # Seconds a rendered file is kept to bridge GitHub outages.
+# Part of the cache key; bump it when the rendering or sanitizing changes.
+RENDER_VERSION = "1"
+
+_cache = DiskCache("metadata-html", ttl=KEEP_FOR)
+
+
+def check_url(url):
+    """
+    Raises:
+        ValueError: If url is not a markdown file that may be rendered
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = urllib.parse.unquote(parts.path)
+    if (
+        not url.startswith(ALLOWED_PREFIX)
+        or not path.endswith(".md")
+        or ".." in path.split("/")
+        or parts.query
+        or parts.fragment
+    ):
+        raise ValueError(f"Not a VHP4Safety metadata file: {url}")
+
+
+def render(text, base_url):
+    """
+    Render markdown to a sanitized HTML fragment
+
+    Scripts, event handlers, styles and non-http(s) links are removed;
+    relative links and images are resolved against base_url, and links
+    open in a new tab.
+
+    Args:
+        text (str): Markdown source
+        base_url (str): URL of the markdown file
+
+    Returns:
+        str: HTML fragment
+    """
+    html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS, output_format="html")
+
+    def resolve(tag, attribute, value):
+        if attribute in ("href", "src") and not value.startswith("#"):
+            return urllib.parse.urljoin(base_url, value)
+        return value
+
+    return nh3.clean(
+        html,
+        attribute_filter=resolve,
+        url_schemes={"http", "https", "mailto"},
+        link_rel="noopener noreferrer",
+        set_tag_attribute_values={"a": {"target": "_blank"}},
+    )
+
+
+def metadata_html(url):
+    """
+    Return a tool or method metadata file rendered as HTML
+
+    The rendered fragment is cached on disk per URL together with the ETag
+    of the markdown; after REVALIDATE_AFTER seconds GitHub is asked with
+    If-None-Match, so an unchanged file is neither downloaded nor rendered
+    again. When GitHub cannot be reached the cached fragment is used.
+
+    Args:
+        url (str): raw.githubusercontent.com URL of the .md file
+
+    Returns:
+        dict: 'html' (None if the file does not exist) and 'version', a
+            hash of the fragment usable as ETag
+
+    Raises:
+        ValueError: If the URL is not allowed (see check_url)
+        requests.RequestException: If the file cannot be fetched and was
+            never cached
+    """
+    check_url(url)
+    key = f"{RENDER_VERSION}:{url}"
+    entry = _cache.get(key)
+    if entry is not None and time.time() - entry["checked"] < REVALIDATE_AFTER:
+        return entry
+
+    headers = {"User-Agent": "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    try:
+        response = http.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and entry is not None:
+            pass
+        elif response.status_code == 404:
+            entry = {"html": None, "version": "missing", "etag": None}
+        else:
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            html = render(response.text, url)
+            entry = {
+                "html": html,
+                "version": hashlib.sha256(html.encode("utf-8")).hexdigest()[:16],
+                "etag": response.headers.get("ETag"),
+            }
+    except requests.RequestException as e:
+        if entry is None:
+            raise
+        logger.warning("Revalidating %s failed, serving cached copy: %s", url, e)
+        return entry
+
+    entry["checked"] = time.time()
+    _cache.set(key, entry)
+    return entry
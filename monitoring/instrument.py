@@ -0,0 +1,70 @@
+import hmac
+import ipaddress
+import os
+import time
+
+from flask import g, request
+
+from monitoring import metrics
+
+
+# Bearer token required to read /metrics; without it only clients on the
+# loopback interface may.
+METRICS_TOKEN = os.environ.get("VHP_METRICS_TOKEN", "")
+
+
+def metrics_authorized():
+    """
+    Whether the current request may read the metrics
+
+    With VHP_METRICS_TOKEN set the request must carry it in an
+    "Authorization: Bearer <token>" header (the authorization setting of a
+    Prometheus scrape config). Without a token only loopback clients are
+    allowed; behind a reverse proxy on the same host every request comes
+    from loopback, so set a token there.
+    """
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            token.strip().encode("utf-8"), METRICS_TOKEN.encode("utf-8")
+        )
+    try:
+        return ipaddress.ip_address(request.remote_addr or "").is_loopback
+    except ValueError:
+        return False
+
+
+def instrument_app(app):
+    """
+    Record the latency, status code and concurrency of every request
+    handled by app in the HTTP metrics
+
+    Requests are labelled with their Flask endpoint (the view function
+    name), so the number of label values stays bounded; requests that
+    match no route are counted as 'none'.
+    """
+    metrics.HTTP_IN_FLIGHT.set(0)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        metrics.HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def count_response(response):
+        g.metrics_counted = True
+        metrics.HTTP_REQUESTS.inc(
+            endpoint=request.endpoint or "none", method=request.method, status=response.status_code
+        )
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        metrics.HTTP_IN_FLIGHT.dec()
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=request.endpoint or "none")
+        if not g.pop("metrics_counted", False):
+            # after_request is skipped when an exception propagates (e.g. in debug mode).
+            metrics.HTTP_REQUESTS.inc(endpoint=request.endpoint or "none", method=request.method, status=500)
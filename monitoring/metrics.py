@@ -0,0 +1,259 @@
+"""
+Prometheus metrics of the app, in the text format returned by render()
+
+Exported are the latency and status counts of the requests per Flask
+endpoint and the requests in flight (monitoring/instrument.py), the
+latency and status counts of the outbound calls per upstream host, the
+SPARQL query and BioStudies operation latencies, the hits and misses of
+the named caches, and the circuit breakers, rate limits and coalesced
+calls of upstream/. app.py serves them at /metrics to the clients
+allowed by instrument.metrics_authorized().
+"""
+
+import bisect
+import functools
+import threading
+import time
+
+
+# Upper bounds of the latency histogram buckets in seconds; the last ones
+# catch calls that run into the 30 second upstream timeouts.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class of a metric family with a fixed set of label names."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.label_names)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def collect(self):
+        """Return the exposition lines of all label combinations."""
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in items:
+            lines.extend(self._lines(key, value))
+        return lines
+
+    def _lines(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests by status code."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. the number of requests in flight."""
+
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies) over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per bucket counts (the last one is +Inf), the sum and the count.
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def timed(self, **labels):
+        """Decorator observing the duration of every call of the function."""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def collect(self):
+        with self._lock:
+            items = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound if bound == float("inf") else float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+################################################################################
+### Metrics of the app
+
+HTTP_REQUEST_DURATION = Histogram(
+    "vhp_http_request_duration_seconds", "Time spent handling requests, by Flask endpoint.", ["endpoint"]
+)
+HTTP_REQUESTS = Counter(
+    "vhp_http_requests_total", "Handled requests, by Flask endpoint, method and status code.",
+    ["endpoint", "method", "status"],
+)
+HTTP_IN_FLIGHT = Gauge("vhp_http_requests_in_flight", "Requests currently being handled.")
+HTTP_DEADLINE_EXCEEDED = Counter(
+    "vhp_http_deadline_exceeded_total",
+    "Requests whose deadline cut short or skipped outbound calls, by Flask endpoint.",
+    ["endpoint"],
+)
+
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "vhp_upstream_request_duration_seconds",
+    "Time until the response headers of outbound HTTP calls arrived, by upstream host.",
+    ["host"],
+)
+UPSTREAM_REQUESTS = Counter(
+    "vhp_upstream_requests_total",
+    "Outbound HTTP calls, by upstream host and status code ('timeout' or 'error' without a response).",
+    ["host", "status"],
+)
+UPSTREAM_IN_FLIGHT = Gauge("vhp_upstream_requests_in_flight", "Outbound HTTP calls in progress, by upstream host.", ["host"])
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "vhp_upstream_circuit_state", "Circuit breaker state by upstream host: 0 closed, 1 half-open, 2 open.", ["host"]
+)
+UPSTREAM_CIRCUIT_TRANSITIONS = Counter(
+    "vhp_upstream_circuit_transitions_total", "Circuit breaker state changes, by upstream host and new state.",
+    ["host", "state"],
+)
+UPSTREAM_CIRCUIT_REJECTED = Counter(
+    "vhp_upstream_circuit_rejected_total", "Outbound calls rejected by an open circuit breaker, by upstream host.",
+    ["host"],
+)
+UPSTREAM_FALLBACKS = Counter(
+    "vhp_upstream_fallbacks_total",
+    "Rejected calls answered with the last successful response instead, by upstream host.",
+    ["host"],
+)
+UPSTREAM_RATE_LIMIT = Gauge(
+    "vhp_upstream_rate_limit", "Calls per second currently allowed, by rate-limited upstream host.", ["host"]
+)
+UPSTREAM_RATE_LIMIT_WAIT = Histogram(
+    "vhp_upstream_rate_limit_wait_seconds",
+    "Time outbound calls waited for the rate limit, by upstream host and priority (interactive or background).",
+    ["host", "priority"],
+)
+UPSTREAM_THROTTLED = Counter(
+    "vhp_upstream_throttled_total", "429 responses that slowed down the calls to a rate-limited upstream host.",
+    ["host"],
+)
+
+SPARQL_QUERY_DURATION = Histogram(
+    "vhp_sparql_query_duration_seconds",
+    "Duration of SPARQL SELECT queries including reading the results, by endpoint and outcome "
+    "(ok, timeout, unavailable or error).",
+    ["endpoint", "outcome"],
+)
+
+BIOSTUDIES_OPERATION_DURATION = Histogram(
+    "vhp_biostudies_operation_duration_seconds",
+    "Duration of BioStudiesExtractor operations, including metadata loading and backfill.",
+    ["operation"],
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "vhp_singleflight_calls_total",
+    "Calls made by the first of the callers coalesced on a key, by group (http, sparql or cache name).",
+    ["group"],
+)
+SINGLEFLIGHT_COLLAPSED = Counter(
+    "vhp_singleflight_collapsed_total",
+    "Calls not made because an identical call was in flight and its result was shared, by group.",
+    ["group"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "vhp_cache_lookups_total", "Cache lookups, by cache name and result (hit or miss).", ["cache", "result"]
+)
@@ -0,0 +1,323 @@
+"""
+Sampling profiler for single requests and low-rate continuous profiling
+
+Profiling is off unless VHP_PROFILE_TOKEN is set. A request carrying the
+token, as ?profile=<token> or in an X-Profile-Token header, is then run
+while a background thread samples its stack every millisecond, e.g.
+
+    curl -H "X-Profile-Token: $TOKEN" "https://.../data?query=kidney" > data.svg
+
+The response is replaced by a flamegraph of the samples (SVG); with
+profile_output=folded (or an X-Profile-Output header) by the folded stacks
+(input of flamegraph.pl and speedscope), and with profile_output=store the
+normal response is returned and the profile is stored, its URL in the
+X-Profile header. Only the thread handling the request is sampled.
+
+With VHP_PROFILE_CONTINUOUS_HZ=n the threads handling requests are sampled
+n times per second all the time; the aggregate of every window is stored.
+Stored profiles are served at /profiles/<name> (with the token as well);
+/profiles/continuous.svg shows the current window.
+
+Environment variables:
+    VHP_PROFILE_TOKEN                  Secret enabling the profiling surface
+    VHP_PROFILE_DIR                    Where profiles are stored (default: <cache dir>/profiles)
+    VHP_PROFILE_CONTINUOUS_HZ=n        Continuous sampling rate (default 0, off)
+    VHP_PROFILE_CONTINUOUS_WINDOW=s    Seconds aggregated per stored continuous profile (default 600)
+"""
+
+import collections
+import hashlib
+import hmac
+import html
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+from flask import Response, abort, g, request, send_from_directory
+
+from upstream.diskcache import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.environ.get("VHP_PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("VHP_PROFILE_DIR", os.path.join(CACHE_DIR, "profiles"))
+CONTINUOUS_HZ = float(os.environ.get("VHP_PROFILE_CONTINUOUS_HZ", 0))
+CONTINUOUS_WINDOW = float(os.environ.get("VHP_PROFILE_CONTINUOUS_WINDOW", 600))
+REQUEST_INTERVAL = 0.001  # Seconds between two samples of a profiled request.
+MAX_REQUEST_SECONDS = 300  # A profiled request stops being sampled after this.
+
+
+################################################################################
+### Sampling
+
+
+_labels = {}
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for prefix in sorted(sys.path, key=len, reverse=True):
+            if prefix and path.startswith(prefix + os.sep):
+                path = path[len(prefix) + 1:]
+                break
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+    return label
+
+
+def fold(frame):
+    """Return the stack of a frame as 'outermost;...;innermost' function labels."""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """Samples the stacks of some threads at a fixed interval in a background thread."""
+
+    def __init__(self, interval, thread_ids, max_seconds=None):
+        """
+        Args:
+            interval (float): Seconds between two samples
+            thread_ids (callable): Returns the ids of the threads to sample
+            max_seconds (float): Stop sampling after this many seconds
+        """
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.max_seconds = max_seconds
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the folded stacks, {stack: samples}."""
+        self._stopped.set()
+        self._thread.join()
+        return self.take()
+
+    def snapshot(self):
+        """Return a copy of the stacks sampled so far."""
+        with self._lock:
+            return collections.Counter(self.stacks)
+
+    def take(self):
+        """Return the stacks sampled so far and start counting from zero."""
+        with self._lock:
+            stacks, self.stacks = self.stacks, collections.Counter()
+        return stacks
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if self.max_seconds and time.perf_counter() - self.started > self.max_seconds:
+                return
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id in self.thread_ids():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[fold(frame)] += 1
+                        self.samples += 1
+            del frames
+
+
+################################################################################
+### Output
+
+
+def folded_text(stacks):
+    """The stacks in the folded format: one 'stack count' line per stack."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def _color(name):
+    digest = hashlib.md5(name.encode("utf-8")).digest()
+    return f"rgb({205 + digest[0] % 50},{digest[1] % 180},{digest[2] % 55})"
+
+
+def flamegraph_svg(stacks, title, interval, width=1200, frame_height=16):
+    """
+    Render folded stacks as a self-contained SVG flamegraph, root at the
+    bottom; hovering a frame shows its samples and share
+    """
+    root = {"children": {}, "value": 0}
+    for stack, count in stacks.items():
+        root["value"] += count
+        node = root
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"children": {}, "value": 0})
+            node["value"] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    total = root["value"] or 1
+    levels = depth(root)
+    height = (levels + 2) * frame_height + 10
+    scale = (width - 20) / total
+    rects = []
+
+    def draw(name, node, x, level):
+        w = node["value"] * scale
+        if w < 0.3:
+            return
+        y = height - (level + 1) * frame_height - 5
+        tooltip = html.escape(f"{name} ({node['value']} samples, {100 * node['value'] / total:.1f}%)")
+        label = html.escape(name[: int(w / 7)]) if w > 21 else ""
+        rects.append(
+            f'<g><title>{tooltip}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" '
+            f'fill="{_color(name)}" rx="2"/><text x="{x + 3:.1f}" y="{y + frame_height - 4}">{label}</text></g>'
+        )
+        for child_name, child in sorted(node["children"].items()):
+            draw(child_name, child, x, level + 1)
+            x += child["value"] * scale
+
+    draw("all", root, 10, 0)
+    heading = html.escape(f"{title} - {root['value']} samples every {1000 * interval:g} ms")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana, sans-serif" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fdfdf5"/>'
+        f'<text x="{width / 2}" y="{frame_height}" text-anchor="middle" font-size="14">{heading}</text>'
+        + "".join(rects)
+        + "</svg>"
+    )
+
+
+def store(name, stacks, title, interval):
+    """Write name.svg and name.folded to PROFILE_DIR and return the SVG file name."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for suffix, content in ((".folded", folded_text(stacks)), (".svg", flamegraph_svg(stacks, title, interval))):
+        path = os.path.join(PROFILE_DIR, name + suffix)
+        with open(f"{path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return name + ".svg"
+
+
+################################################################################
+### Flask integration
+
+
+def authorized():
+    """Whether the current request carries the profiling token."""
+    token = request.headers.get("X-Profile-Token") or request.args.get("profile") or ""
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+class ContinuousProfiler:
+    """Samples the threads handling requests at a low rate and stores one profile per window."""
+
+    def __init__(self, hz, window):
+        self.active = set()
+        self.window = window
+        self.sampler = Sampler(1 / hz, lambda: tuple(self.active)).start()
+        self.window_started = time.time()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="profiler-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.window)
+            stacks = self.sampler.take()
+            started, self.window_started = self.window_started, time.time()
+            if stacks:
+                name = "continuous-" + time.strftime("%Y%m%d-%H%M%S", time.gmtime(started))
+                try:
+                    store(name, stacks, f"All requests from {name[11:]} UTC", self.sampler.interval)
+                except OSError as e:
+                    logger.warning("Storing the continuous profile failed: %s", e)
+
+
+_continuous = None
+
+
+def profile_requests(app):
+    """
+    Profile the requests of app that carry VHP_PROFILE_TOKEN and, with
+    VHP_PROFILE_CONTINUOUS_HZ, start the continuous profiler. Without
+    either setting no hook is added.
+    """
+    global _continuous
+    if CONTINUOUS_HZ > 0:
+        continuous = _continuous = ContinuousProfiler(CONTINUOUS_HZ, CONTINUOUS_WINDOW)
+
+        @app.before_request
+        def track_request_thread():
+            continuous.active.add(threading.get_ident())
+
+        @app.teardown_request
+        def untrack_request_thread(exception):
+            continuous.active.discard(threading.get_ident())
+
+    if not PROFILE_TOKEN:
+        return
+
+    @app.before_request
+    def start_request_profile():
+        if request.endpoint == "stored_profile" or not authorized():
+            return
+        thread_id = threading.get_ident()
+        g.profiler = Sampler(REQUEST_INTERVAL, lambda: (thread_id,), max_seconds=MAX_REQUEST_SECONDS).start()
+
+    @app.after_request
+    def finish_request_profile(response):
+        sampler = g.pop("profiler", None)
+        if sampler is None:
+            return response
+        stacks = sampler.stop()
+        elapsed = time.perf_counter() - sampler.started
+        # The query string without the profiling parameters, which hold the token.
+        query = urllib.parse.urlencode([(k, v) for k, v in request.args.items(multi=True) if not k.startswith("profile")])
+        title = f"{request.method} {request.path}{'?' if query else ''}{query} - {response.status_code} in {1000 * elapsed:.0f} ms"
+        output = request.headers.get("X-Profile-Output") or request.args.get("profile_output", "svg")
+        if output == "store":
+            name = time.strftime("%Y%m%d-%H%M%S") + "-" + re.sub(r"[^A-Za-z0-9_.-]", "_", request.endpoint or "none")
+            response.headers["X-Profile"] = f"/profiles/{store(name, stacks, title, sampler.interval)}"
+            return response
+        if output == "folded":
+            profile = Response(folded_text(stacks), mimetype="text/plain")
+        else:
+            profile = Response(flamegraph_svg(stacks, title, sampler.interval), mimetype="image/svg+xml")
+        profile.headers["X-Profiled-Status"] = str(response.status_code)
+        profile.headers["Cache-Control"] = "no-store"
+        return profile
+
+    @app.teardown_request
+    def stop_request_profile(exception):
+        sampler = g.pop("profiler", None)
+        if sampler is not None:
+            sampler.stop()
+
+
+def profile_response(name):
+    """
+    Response for /profiles/<name>: a stored profile, or the current window
+    of the continuous profiler as continuous.svg or continuous.folded;
+    404 without the profiling token
+    """
+    if not authorized():
+        abort(404)
+    if name in ("continuous.svg", "continuous.folded") and _continuous is not None:
+        stacks = _continuous.sampler.snapshot()
+        if name.endswith(".folded"):
+            return Response(folded_text(stacks), mimetype="text/plain")
+        title = "All requests since " + time.strftime("%H:%M:%S UTC", time.gmtime(_continuous.window_started))
+        return Response(flamegraph_svg(stacks, title, _continuous.sampler.interval), mimetype="image/svg+xml")
+    mimetype = "text/plain" if name.endswith(".folded") else None
+    return send_from_directory(PROFILE_DIR, name, mimetype=mimetype, max_age=0)
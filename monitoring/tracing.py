@@ -0,0 +1,209 @@
+"""
+Per-request trace spans, reported in the Server-Timing response header
+
+Every request handled by the app gets a trace. Outbound HTTP calls
+(upstream.http), template rendering and the stages wrapped in span() or
+traced() add spans to it. The header sums the spans per name, e.g.
+
+    Server-Timing: total;dur=812.4, upstream.www.ebi.ac.uk;dur=655.0;desc="19 calls",
+        biostudies.parse_metadata;dur=41.7;desc="18 calls", render;dur=23.9
+
+Spans can overlap (a parse stage runs inside a BioStudies operation), so
+their durations do not add up to the total.
+
+Environment variables:
+    VHP_SERVER_TIMING=0      Do not send the Server-Timing header
+    VHP_TRACE_LOG=1          Log every trace as one JSON line (logger monitoring.tracing)
+    VHP_TRACE_LOG_MIN_MS=n   Only log traces of requests taking at least n milliseconds
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import g, request
+from flask.signals import before_render_template, template_rendered
+
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = os.environ.get("VHP_SERVER_TIMING", "1") != "0"
+TRACE_LOG = os.environ.get("VHP_TRACE_LOG", "0") == "1"
+TRACE_LOG_MIN_MS = float(os.environ.get("VHP_TRACE_LOG_MIN_MS", 0))
+MAX_SPANS = 1000  # Spans kept per trace; more are counted but not stored.
+
+_current = contextvars.ContextVar("trace", default=None)
+_NOT_TOKEN = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class Trace:
+    """The spans recorded while handling one request."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = time.perf_counter()
+        self.status = None
+        self.spans = []
+        self.dropped = 0
+        self.totals = {}  # {span name: [summed duration, count]}, including dropped spans
+        self._lock = threading.Lock()
+
+    def add(self, name, started, duration, **attributes):
+        """Record a span that started at perf_counter() time started."""
+        with self._lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += duration
+            total[1] += 1
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append((name, started, duration, attributes))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Return the Server-Timing header value: the total and the spans summed per name."""
+        with self._lock:
+            totals = [(name, duration, count) for name, (duration, count) in self.totals.items()]
+        parts = [f"total;dur={1000 * self.elapsed():.1f}"]
+        for name, duration, count in totals:
+            part = f"{_NOT_TOKEN.sub('_', name)};dur={1000 * duration:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        return ", ".join(parts)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace": self.id,
+            "name": self.name,
+            "status": self.status,
+            "duration_ms": round(1000 * self.elapsed(), 1),
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round(1000 * (started - self.started), 1),
+                    "duration_ms": round(1000 * duration, 1),
+                    **attributes,
+                }
+                for name, started, duration, attributes in spans
+            ],
+        }
+
+
+def current():
+    """Return the trace of the current request, or None outside a request."""
+    return _current.get()
+
+
+def record(name, started, duration, **attributes):
+    """Add a span that was timed by the caller to the current trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, started, duration, **attributes)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record the duration of the with block as a span of the current trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, **attributes)
+
+
+def traced(name):
+    """Decorator recording every call of the function as a span."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                trace.add(name, started, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_requests(app):
+    """
+    Start a trace for every request handled by app, record template
+    rendering as 'render' spans and report the trace in the Server-Timing
+    header and, with VHP_TRACE_LOG=1, as a JSON log line
+    """
+    if TRACE_LOG and not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    @app.before_request
+    def start_trace():
+        trace = Trace(request.endpoint or "none")
+        g.trace_token = _current.set(trace)
+        g.trace = trace
+
+    @app.after_request
+    def add_server_timing(response):
+        trace = g.get("trace")
+        if trace is None:
+            return response
+        trace.status = response.status_code
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def finish_trace(exception):
+        trace = g.pop("trace", None)
+        token = g.pop("trace_token", None)
+        if token is not None:
+            _current.reset(token)
+        if trace is None or not TRACE_LOG or 1000 * trace.elapsed() < TRACE_LOG_MIN_MS:
+            return
+        entry = trace.to_dict()
+        entry.update(method=request.method, path=request.path, error=repr(exception) if exception else None)
+        logger.info(json.dumps(entry, default=str))
+
+    def start_render(sender, template, context, **extra):
+        trace = _current.get()
+        if trace is not None:
+            g.setdefault("render_started", []).append(time.perf_counter())
+
+    def finish_render(sender, template, context, **extra):
+        trace = _current.get()
+        stack = g.get("render_started")
+        if trace is not None and stack:
+            started = stack.pop()
+            trace.add("render", started, time.perf_counter() - started, template=template.name)
+
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
+    # Keep references: blinker holds receivers weakly.
+    app.extensions["tracing"] = (start_render, finish_render)
@@ -0,0 +1,100 @@
+import concurrent.futures
+import contextvars
+import logging
+import urllib.parse
+
+import requests
+
+from upstream import http
+from upstream.diskcache import DiskCache
+
+
+logger = logging.getLogger(__name__)
+
+OLS_TERMS_URL = "https://www.ebi.ac.uk/ols4/api/terms/{}?lang=en"
+OLS_CLASS_URL = "https://www.ebi.ac.uk/ols4/ontologies/{}/classes/{}"
+MAX_BATCH = 200  # Maximum number of IRIs resolved in one request.
+MAX_WORKERS = 8  # Concurrent requests to OLS for cache misses.
+LABEL_TTL = 30 * 24 * 3600  # Seconds a resolved label is kept.
+MISSING_TTL = 24 * 3600  # Seconds an IRI unknown to OLS is remembered.
+
+_cache = DiskCache("ontology-labels", ttl=LABEL_TTL)
+_session = http.Session(pool_size=MAX_WORKERS)
+
+
+def _double_encode(iri):
+    # OLS expects the IRI URL-encoded twice in the path.
+    return urllib.parse.quote(urllib.parse.quote(iri, safe=""), safe="")
+
+
+def fetch_label(iri):
+    """
+    Look up one IRI in EBI OLS4
+
+    Args:
+        iri (str): Ontology term IRI, e.g. http://purl.obolibrary.org/obo/GO_0008150
+
+    Returns:
+        dict: 'label', 'shortForm' (may be empty) and 'url' (OLS page of the
+            term, empty if unknown), or None if OLS does not know the IRI
+
+    Raises:
+        requests.RequestException: On network errors and server errors
+    """
+    encoded = _double_encode(iri)
+    response = _session.get(OLS_TERMS_URL.format(encoded), timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    terms = (response.json().get("_embedded") or {}).get("terms") or []
+    if not terms or not terms[0].get("label"):
+        return None
+    term = terms[0]
+    ontology = term.get("ontology_name")
+    return {
+        "label": term["label"],
+        "shortForm": term.get("short_form") or term.get("ontology_prefix") or "",
+        "url": OLS_CLASS_URL.format(ontology, encoded) if ontology else "",
+    }
+
+
+def resolve_labels(iris):
+    """
+    Resolve a batch of IRIs to their OLS labels
+
+    Labels are answered from the persistent cache; only misses are fetched
+    from OLS, concurrently. IRIs unknown to OLS are cached as None for
+    MISSING_TTL seconds; IRIs whose lookup failed are not cached.
+
+    Args:
+        iris (list): IRIs starting with http(s)
+
+    Returns:
+        dict: {iri: result of fetch_label} for every IRI that could be looked up
+    """
+    iris = [iri for iri in dict.fromkeys(iris) if iri.startswith(("http://", "https://"))]
+    cached = _cache.get_many(iris)
+    labels = {iri: cached[iri] for iri in iris if iri in cached}
+    misses = [iri for iri in iris if iri not in cached]
+    if not misses:
+        return labels
+
+    found, missing = {}, {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # Each lookup runs in a copy of the caller's context, so the request
+        # deadline caps its timeout (see upstream/deadline.py).
+        futures = {pool.submit(contextvars.copy_context().run, fetch_label, iri): iri for iri in misses}
+        for future in concurrent.futures.as_completed(futures):
+            iri = futures[future]
+            try:
+                entry = future.result()
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Resolving ontology label of %s failed: %s", iri, e)
+                continue
+            (found if entry is not None else missing)[iri] = entry
+            labels[iri] = entry
+    if found:
+        _cache.set_many(found)
+    if missing:
+        _cache.set_many(missing, ttl=MISSING_TTL)
+    return labels
@@ -246,29 +246,38 @@ function getCaseStudyVersionFromUrl() {
 }
 
 function loadCaseStudyContent() {
+  // The server inlines the content into the page; only fetch it from GitHub
+  // when it could not provide it.
+  const inlined = document.getElementById("casestudy-content");
+  if (inlined) {
+    applyCaseStudyContent(JSON.parse(inlined.textContent));
+    return;
+  }
   const caseStudy = getCaseStudyNameFromUrl();
   const caseStudyBranch = getCaseStudyVersionFromUrl();
   var data_url = `https://raw.githubusercontent.com/VHP4Safety/ui-casestudy-config/${caseStudyBranch}/${caseStudy}_content.json`;
   //var data_url_test = `https://raw.githubusercontent.com/johannehouweling/ui-casestudy-config/refs/heads/jh-content-structure/${caseStudy}_content.json`
   fetch(data_url)
     .then((res) => res.json())
-    .then((content) => {
-      step1Contents = content.step1Contents;
-      step2Contents = content.step2Contents;
-      step3Contents = content.step3Contents;
-      step4Contents = content.step4Contents;
-      step5Contents = content.step5Contents;
-      step6Contents = content.step6Contents;
-      contentLoaded = true;
-      currentStep1Value = "Q1";
-      updateStep1Content();
-      updateBreadcrumb(1);
-      updateStep2Content();
-      updateStep3Content();
-      updateStep4Content();
-      updateStep5Content();
-      updateStep6Content();
-    });
+    .then(applyCaseStudyContent);
+}
+
+function applyCaseStudyContent(content) {
+  step1Contents = content.step1Contents;
+  step2Contents = content.step2Contents;
+  step3Contents = content.step3Contents;
+  step4Contents = content.step4Contents;
+  step5Contents = content.step5Contents;
+  step6Contents = content.step6Contents;
+  contentLoaded = true;
+  currentStep1Value = "Q1";
+  updateStep1Content();
+  updateBreadcrumb(1);
+  updateStep2Content();
+  updateStep3Content();
+  updateStep4Content();
+  updateStep5Content();
+  updateStep6Content();
 }
 
 function getCaseStudyDisplayName() {
@@ -1,56 +1,36 @@
 /**
- * Fetches ontology label information from EBI OLS4 API for a given IRI.
- * Updates the provided anchor element with the label and short form.
- * 
+ * Updates the provided anchor element with a resolved ontology label.
+ *
  * @param {HTMLAnchorElement} anchorElement - The anchor element to update
- * @param {string} iri - The ontology IRI (e.g., "http://purl.obolibrary.org/obo/GO_0008150")
- * @returns {Promise<void>}
+ * @param {Object} term - Resolved term from /ontology/labels ({label, shortForm, url})
+ * @returns {void}
  */
-async function getOntologyLabel(anchorElement, iri) {
-    if (!anchorElement || !iri || !iri.startsWith('http')) {
+function applyOntologyLabel(anchorElement, term) {
+    if (!anchorElement || !term) {
         return;
     }
 
-    const encodedIri = encodeURIComponent(encodeURIComponent(iri));
-    const apiUrl = `https://www.ebi.ac.uk/ols4/api/terms/${encodedIri}?lang=en`;
-
-    try {
-        const response = await fetch(apiUrl);
-        if (!response.ok) {
-            return;
-        }
-
-        const data = await response.json();
-        const term = data._embedded?.terms?.[0];
+    // Update anchor text with label and optional short form
+    anchorElement.textContent = term.shortForm
+        ? `${term.label} (${term.shortForm})`
+        : term.label;
 
-        if (term) {
-            // Update anchor text with label and optional short form
-            const shortForm = term.short_form || term.ontology_prefix;
-            anchorElement.textContent = shortForm 
-                ? `${term.label} (${shortForm})` 
-                : term.label;
-            
-            // Construct OLS page URL
-            // Format: https://www.ebi.ac.uk/ols4/ontologies/{ontology_name}/classes/{double-encoded IRI}
-            if (term.ontology_name) {
-                anchorElement.href = `https://www.ebi.ac.uk/ols4/ontologies/${term.ontology_name}/classes/${encodedIri}`;
-            }
-        }
-    } catch (error) {
-        // Silently fail - keep original IRI as text
-        console.warn('Failed to fetch ontology label for:', iri, error);
+    // OLS page of the term, e.g. https://www.ebi.ac.uk/ols4/ontologies/{ontology_name}/classes/{double-encoded IRI}
+    if (term.url) {
+        anchorElement.href = term.url;
     }
 }
 
 /**
  * Processes all ontology IRI links on the page.
- * Looks for anchor elements with hrefs starting with common ontology prefixes.
- * 
+ * Looks for anchor elements with hrefs starting with common ontology prefixes
+ * and resolves all their labels with one request to the server, which answers
+ * from its label cache and only asks EBI OLS4 for unknown IRIs.
+ *
  * @param {string} selector - Optional CSS selector to limit scope (default: defaultSelector)
- * @param {number} delay - Delay between API calls in ms (default: 100)
  * @returns {Promise<void>}
  */
-async function processOntologyLinks(selector, delay = 100) {
+async function processOntologyLinks(selector) {
     // Ontology-specific prefixes
     const defaultSelector = [
         'a[href^="http://purl.obolibrary.org"]',      // OBO Foundry ontologies
@@ -62,11 +42,34 @@ async function processOntologyLinks(selector, delay = 100) {
         'a[href^="http://semanticscience.org"]',      // SIO ontology
         'a[href^="http://www.orpha.net"]'             // Orphanet
     ].join(', ');
-    const links = document.querySelectorAll(selector || defaultSelector);
+    const links = Array.from(document.querySelectorAll(selector || defaultSelector))
+        .filter(link => link.href.startsWith('http'));
+    if (!links.length) {
+        return;
+    }
+
+    // The server accepts at most 200 IRIs per request
+    const iris = [...new Set(links.map(link => link.href))];
+    const labels = {};
+    try {
+        for (let i = 0; i < iris.length; i += 200) {
+            const response = await fetch('/ontology/labels', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ iris: iris.slice(i, i + 200) })
+            });
+            if (!response.ok) {
+                break;
+            }
+            Object.assign(labels, (await response.json()).labels);
+        }
+    } catch (error) {
+        // Silently fail - keep original IRIs as text
+        console.warn('Failed to fetch ontology labels:', error);
+        return;
+    }
 
     for (const link of links) {
-        await getOntologyLabel(link, link.href);
-        // Rate limiting to avoid overwhelming the API
-        await new Promise(resolve => setTimeout(resolve, delay));
+        applyOntologyLabel(link, labels[link.href]);
     }
 }
@@ -1,17 +1,24 @@
 /**
  * VHP4Safety Glossary Term Highlighter
  * Automatically highlights glossary terms in page content with interactive tooltips
+ *
+ * The terms and a precompiled Aho-Corasick automaton over their labels and
+ * synonyms come from the server (/glossary/index.json, see glossary/), so
+ * every text node is scanned once regardless of the number of terms.
  */
 
 (function() {
   'use strict';
 
+  // Versioned index URL rendered by base.html; must be read while the script executes.
+  const scriptIndexUrl = document.currentScript?.dataset.indexUrl;
+
   // ============================================================================
   // CONFIGURATION - All tweakable parameters
   // ============================================================================
   const CONFIG = {
     // Source
-    glossaryUrl: 'https://raw.githubusercontent.com/VHP4Safety/glossary/refs/heads/main/glossary.owl',
+    indexUrl: scriptIndexUrl || '/glossary/index.json',
     glossaryWebsiteUrl: 'https://glossary.vhp4safety.nl/',
     loadLast: true,               // Load glossary after other scripts have run
     // Tooltip behavior
@@ -22,8 +29,7 @@
     tooltipHideDelay: 2000,        // ms before hiding tooltip after unhover
     singleTooltipOnly: true,       // Only show one tooltip at a time
     
-    // Highlighting
-    caseSensitive: false,          // Match terms case-insensitively
+    // Highlighting (always case-insensitive: the server-built matcher is case-folded)
     matchWholeWords: true,         // Only match whole words (use word boundaries, keep true, not working well otherwise)
     highlightClass: 'glossary-term',
     highlightType: 'bold',         // 'subtle' = dotted underline, 'bold' = bold text
@@ -80,6 +86,7 @@
   // STATE
   // ============================================================================
   let glossaryTerms = [];
+  let matcher = null;
   let isProcessing = false;
   const tooltipManager = {
     activeTooltip: null,
@@ -92,12 +99,6 @@
   
   const log = (...args) => CONFIG.debug && console.log('[VHP Glossary]', ...args);
   const escapeHtml = text => { const div = document.createElement('div'); div.textContent = text; return div.innerHTML; };
-  const escapeRegex = str => str.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
-  
-  const extractProperty = (props, pattern) => {
-    const match = props.match(pattern);
-    return match ? match[1].trim() : '';
-  };
   
   const getGlossaryUrl = uri => {
     if (uri?.includes('#')) {
@@ -181,54 +182,6 @@
     log('Custom styles injected');
   }
 
-  // ============================================================================
-  // PARSING
-  // ============================================================================
-  
-  function parseOWLGlossary(turtleText) {
-    // Use shared TTLParser if available, otherwise use embedded parser
-    if (window.TTLParser) {
-      log('Using shared TTLParser module');
-      return window.TTLParser.parseGlossary(turtleText, {
-        requireLabel: true,
-        requireClass: true,
-        minLabelLength: 2,
-        extractRelations: false
-      });
-    }
-    
-    // Fallback: embedded parser (for backwards compatibility)
-    log('Using embedded parser (TTLParser not loaded)');
-    const termBlockRegex = /<([^>]+)>\s*\n([\s\S]*?)(?=\n<|$)/g;
-    const terms = [];
-    let match;
-    
-    while ((match = termBlockRegex.exec(turtleText)) !== null) {
-      const [, uri, props] = match;
-      
-      // Must be an owl:Class with a label
-      if (!props.includes('rdf:type') || !props.includes('owl:Class')) continue;
-      
-      const label = extractProperty(props, /rdfs:label\s+"([^"]+)"(?:@[a-zA-Z-]+)?/);
-      if (!label || label === 'nan' || label.length < 2) continue;
-      const smiles = extractProperty(props, /chebi:smiles\s+"([^"]+)"(?:@[a-zA-Z-]+)?/);
-      const definition = extractProperty(props, /dc:description\s+"([^"]+)"(?:@[a-zA-Z-]+)?/);
-      const synonym = extractProperty(props, /ncit:C42610\s+"([^"]+)"(?:@[a-zA-Z-]+)?/);
-      
-      const termObj = {
-        uri,
-        label,
-        definition,
-        synonyms: synonym ? [synonym] : []
-      };
-      if (smiles) termObj.smiles = smiles;
-      terms.push(termObj);
-    }
-    
-    log(`Parsed ${terms.length} glossary terms`);
-    return terms;
-  }
-
   // ============================================================================
   // TOOLTIP CONTENT
   // ============================================================================
@@ -290,40 +243,54 @@
   // HIGHLIGHTING
   // ============================================================================
   
+  // Mirrors glossary/matcher.py: case folding per code unit and JavaScript's \b.
+  const fold = ch => {
+    const lower = ch.toLowerCase();
+    return lower.length === 1 ? lower : ch;
+  };
+  const isWordChar = ch => /\w/.test(ch);
+  const onWordBoundary = (text, start, end) =>
+    (start > 0 && isWordChar(text[start - 1])) !== isWordChar(text[start]) &&
+    (end < text.length && isWordChar(text[end])) !== isWordChar(text[end - 1]);
+
+  function nextState(state, ch) {
+    const { chars, offsets, targets } = matcher;
+    for (let i = offsets[state]; i < offsets[state + 1]; i++) {
+      if (chars[i] === ch) return targets[i];
+    }
+    return -1;
+  }
+
   function findMatches(text, terms) {
+    const { fail, term, length, link } = matcher;
     const matches = [];
-    const flags = CONFIG.caseSensitive ? 'g' : 'gi';
-    const boundary = CONFIG.matchWholeWords ? '\\b' : '';
-    
-    let totalAttempts = 0;
-    terms.forEach(term => {
-      [term.label, ...term.synonyms].forEach(label => {
-        totalAttempts++;
-        const pattern = `${boundary}${escapeRegex(label)}${boundary}`;
-        const regex = new RegExp(pattern, flags);
-        let match;
-        
-        while ((match = regex.exec(text)) !== null) {
-          log(`MATCH FOUND: "${label}" in text`);
-          matches.push({
-            start: match.index,
-            end: match.index + match[0].length,
-            text: match[0],
-            term
-          });
+    let state = 0;
+
+    for (let i = 0; i < text.length; i++) {
+      const ch = fold(text[i]);
+      let next = nextState(state, ch);
+      while (next === -1 && state !== 0) {
+        state = fail[state];
+        next = nextState(state, ch);
+      }
+      state = next === -1 ? 0 : next;
+
+      for (let out = term[state] !== -1 ? state : link[state]; out !== -1; out = link[out]) {
+        const start = i + 1 - length[out];
+        if (!CONFIG.matchWholeWords || onWordBoundary(text, start, i + 1)) {
+          matches.push({ start, end: i + 1, text: text.substring(start, i + 1), term: terms[term[out]] });
         }
-      });
-    });
-    
-    if (matches.length === 0 && totalAttempts > 0) {
-      log(`No matches found after trying ${totalAttempts} patterns in text: "${text.substring(0, 100)}..."`);
+      }
     }
-    
-    // Sort and remove overlaps (keep first match)
-    matches.sort((a, b) => a.start - b.start);
-    return matches.filter((match, i) => 
-      i === 0 || match.start >= matches[i - 1].end
-    );
+
+    // Leftmost-longest, non-overlapping
+    matches.sort((a, b) => a.start - b.start || b.end - a.end);
+    let lastEnd = 0;
+    return matches.filter(match => {
+      if (match.start < lastEnd) return false;
+      lastEnd = match.end;
+      return true;
+    });
   }
   
   function createHighlightSpan(match) {
@@ -491,15 +458,17 @@
   
   async function fetchAndProcess() {
     try {
-      log(`Fetching glossary from ${CONFIG.glossaryUrl}`);
-      const response = await fetch(CONFIG.glossaryUrl);
+      log(`Fetching glossary index from ${CONFIG.indexUrl}`);
+      const response = await fetch(CONFIG.indexUrl);
       
       if (!response.ok) {
         throw new Error(`HTTP ${response.status}: ${response.statusText}`);
       }
       
-      const text = await response.text();
-      glossaryTerms = parseOWLGlossary(text);
+      const index = await response.json();
+      matcher = index.matcher;
+      glossaryTerms = index.terms;
+      log(`Loaded glossary version ${index.version} with ${glossaryTerms.length} terms`);
       
       if (glossaryTerms.length) {
         processDocument();
@@ -0,0 +1,65 @@
+/**
+ * On-demand loading of the asset bundles a page declares as lazy
+ * (see assets/bundles.py). base.html passes the bundle URLs in data-bundles.
+ *
+ *   LazyAssets.whenVisible(element, 'jsmol').then(() => { ... Jmol ... });
+ */
+
+(function(window) {
+  'use strict';
+
+  const bundles = JSON.parse(document.currentScript?.dataset.bundles || '{}');
+  const loading = {};
+
+  function loadScript(src) {
+    return new Promise((resolve, reject) => {
+      const script = document.createElement('script');
+      script.src = src;
+      script.onload = resolve;
+      script.onerror = () => reject(new Error(`Failed to load ${src}`));
+      document.head.appendChild(script);
+    });
+  }
+
+  const LazyAssets = {
+    /**
+     * Load a bundle once; scripts are executed in their declared order
+     * @param {string} name - Bundle name
+     * @returns {Promise<void>}
+     */
+    load(name) {
+      if (!loading[name]) {
+        const bundle = bundles[name];
+        loading[name] = bundle
+          ? bundle.scripts.reduce((done, src) => done.then(() => loadScript(src)), Promise.resolve())
+          : Promise.reject(new Error(`Unknown asset bundle: ${name}`));
+      }
+      return loading[name];
+    },
+
+    /**
+     * Load a bundle as soon as an element is (about to be) visible
+     * @param {Element} element - Element that needs the bundle, e.g. the viewer panel
+     * @param {string} name - Bundle name
+     * @returns {Promise<void>}
+     */
+    whenVisible(element, name) {
+      const visible = new Promise(resolve => {
+        if (!element || !('IntersectionObserver' in window)) {
+          resolve();
+          return;
+        }
+        const observer = new IntersectionObserver(entries => {
+          if (entries.some(entry => entry.isIntersecting)) {
+            observer.disconnect();
+            resolve();
+          }
+        }, { rootMargin: '200px' });
+        observer.observe(element);
+      });
+      return visible.then(() => LazyAssets.load(name));
+    }
+  };
+
+  window.LazyAssets = LazyAssets;
+})(window);
@@ -1,10 +1,10 @@
 /**
  * Metadata Modal Module
  * Provides reusable functionality for displaying markdown metadata in a Bootstrap modal
+ * The markdown is rendered and sanitized by the server (/metadata?url=...)
  * 
  * Requirements:
  * - Bootstrap 5 (for Modal component)
- * - marked.js library (for markdown parsing)
  * 
  * HTML Structure Required:
  * - Modal with id="metadataModal"
@@ -119,26 +119,14 @@
      */
     async fetchAndDisplay(url) {
       try {
-        const response = await fetch(url);
+        const response = await fetch('/metadata?url=' + encodeURIComponent(url));
         
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        // Get the markdown text
-        const markdownText = await response.text();
-
-        // Check if marked.js is available
-        if (typeof marked === 'undefined') {
-          console.error('[MetadataModal] marked.js library not found');
-          throw new Error('Markdown parser not available');
-        }
-
-        // Parse markdown to HTML using marked.js
-        const htmlContent = marked.parse(markdownText);
-
-        // Display rendered HTML
-        this.elements.metadataContent.innerHTML = htmlContent;
+        // The server returns the markdown as a sanitized HTML fragment
+        this.elements.metadataContent.innerHTML = await response.text();
 
         // Add Bootstrap img-fluid class to all images for responsive sizing
         this.elements.metadataContent.querySelectorAll('img').forEach(img => {
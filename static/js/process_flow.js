@@ -1,13 +1,14 @@
 /**
  * Process Flow Page - Dynamic loading of Process Flow Steps
- * Uses TTLParser to load terms with dct:relation from glossary
+ * The steps are normally rendered by the server; this only loads them from
+ * /process_flow/steps.json when the glossary was not cached yet at render time
  */
 
 (function() {
   'use strict';
 
   const CONFIG = {
-    glossaryUrl: 'https://raw.githubusercontent.com/VHP4Safety/glossary/refs/heads/main/glossary.owl',
+    stepsUrl: '/process_flow/steps.json',
     glossaryWebsiteUrl: 'https://glossary.vhp4safety.nl/',
     // Map relation URIs to accordion IDs
     stepMapping: {
@@ -25,27 +26,26 @@
     return '';
   }
 
+  const escapeHtml = text => { const div = document.createElement('div'); div.textContent = text; return div.innerHTML; };
+
   /**
    * Create accordion item HTML
    */
-  function createAccordionItem(term, index) {
+  function createAccordionItem(step, index) {
     const collapseId = `about-collapse${index === 0 ? 'One' : index === 1 ? 'Two' : index === 2 ? 'Three' : index === 3 ? 'Four' : index === 4 ? 'Five' : index + 1}`;
     const headingId = `about-heading${index === 0 ? 'One' : index === 1 ? 'Two' : index === 2 ? 'Three' : index === 3 ? 'Four' : index === 4 ? 'Five' : index + 1}`;
     
-    // Clean label - remove "(Process Flow Step)" suffix if present
-    const cleanLabel = term.label.replace(/\s*\(Process Flow Step\)\s*$/i, '').trim();
-    
     return `
   <div class="accordion-item">
     <h2 class="accordion-header" id="${headingId}">
         <button class="accordion-button collapsed" type="button" data-bs-toggle="collapse" data-bs-target="#${collapseId}" aria-expanded="false" aria-controls="${collapseId}">
-          ${cleanLabel}
+          ${escapeHtml(step.label)}
         </button>
       </h2>
       <div id="${collapseId}" class="accordion-collapse collapse" aria-labelledby="${headingId}">
         <div class="accordion-body"  style="text-align: justify;">
           <p>
-            ${term.definition || 'No definition available.'}
+            ${escapeHtml(step.definition || 'No definition available.')}
           </p>
         </div>
       </div>
@@ -61,24 +61,28 @@
       console.warn('[Process Flow] Accordion container not found');
       return;
     }
+    if (container.dataset.rendered) return;
 
     // Show loading state
     container.innerHTML = '<div class="text-center py-4"><div class="spinner-border text-primary" role="status"><span class="visually-hidden">Loading...</span></div></div>';
 
     try {
-      // Fetch and parse terms with relations
-      const terms = await TTLParser.fetchTermsWithRelations(CONFIG.glossaryUrl);
+      const response = await fetch(CONFIG.stepsUrl);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const { steps } = await response.json();
       
-      if (terms.length === 0) {
+      if (steps.length === 0) {
         container.innerHTML = '<p class="text-muted">No process flow steps found.</p>';
         return;
       }
 
-      console.log('[Process Flow] Loaded', terms.length, 'process flow steps');
+      console.log('[Process Flow] Loaded', steps.length, 'process flow steps');
 
       // Generate accordion HTML
-      const accordionHtml = terms
-        .map((term, index) => createAccordionItem(term, index))
+      const accordionHtml = steps
+        .map((step, index) => createAccordionItem(step, index))
         .join('');
 
       container.innerHTML = accordionHtml;
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The modules under test are imported from the repository root, and their
+# disk caches (read from the environment at import) go to a scratch directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("VHP_CACHE_DIR", tempfile.mkdtemp(prefix="vhp-tests-"))
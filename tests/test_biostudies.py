@@ -0,0 +1,64 @@
+import pytest
+
+from biostudies import search
+from biostudies.search import BioStudiesExtractor
+
+
+def study(*attributes):
+    return {
+        "accno": "S-VHPS1",
+        "title": "Thyroid study",
+        "attributes": [{"name": name, "value": value} for name, value in attributes],
+    }
+
+
+@pytest.mark.parametrize(
+    "attributes",
+    [
+        [("Case Study", "Thyroid")],
+        [("Case Study", "Thyroid"), ("Regulatory Question", "q1"), ("Flow Step", "s1")],
+        [("AttachTo", "VHP4Safety"), ("Case Study", "Thyroid"), ("Organism", "Homo sapiens")],
+    ],
+)
+def test_case_study_survives_later_attributes(attributes):
+    extractor = BioStudiesExtractor()
+    metadata = extractor.parse_metadata(study(*attributes))
+
+    assert metadata["case_study"] == "Thyroid"
+    hits = [{"accession": "S-VHPS1", "metadata": metadata}]
+    assert extractor._apply_filters(hits, [("case_study", "thyroid")]) == hits
+
+
+def test_later_attributes_keep_their_values():
+    metadata = BioStudiesExtractor().parse_metadata(
+        study(("Regulatory Question", "q1"), ("Flow Step", "s1"), ("Title", "x"))
+    )
+
+    assert metadata["regulatory_question"] == "q1"
+    assert metadata["flow_step"] == "s1"
+    assert metadata["case_study"] == ""
+
+
+def test_cached_studies_leave_out_the_raw_response(monkeypatch):
+    calls = []
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return study(("Case Study", "Thyroid"), ("Organism", "Homo sapiens"))
+
+    def get(url, **kwargs):
+        calls.append(url)
+        return Response()
+
+    monkeypatch.setattr(search.http, "get", get)
+    extractor = BioStudiesExtractor()
+
+    fresh = extractor.get_study_metadata("S-VHPS1")
+    cached = extractor.get_study_metadata("S-VHPS1")
+
+    assert len(calls) == 1
+    assert "raw_data" in fresh
+    assert "raw_data" not in cached
+    assert cached == {k: v for k, v in fresh.items() if k != "raw_data"}
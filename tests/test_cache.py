@@ -0,0 +1,31 @@
+from upstream.cache import TTLCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_total_weight_is_bounded():
+    cache = TTLCache(maxsize=100, ttl=60, maxweight=10, weigh=len)
+    cache.set("a", b"xxxx")
+    cache.set("b", b"xxxx")
+    cache.set("a", b"xx")  # Replacing an entry replaces its weight.
+    assert cache.weight == 6
+    cache.set("c", b"xxxxxx")
+    assert cache.get("b") is None
+    assert cache.weight == 8
+    cache.set("d", b"x" * 11)  # Heavier than the bound: not kept.
+    assert len(cache) == 0
+    assert cache.weight == 0
+
+
+def test_expired_entries_are_dropped():
+    cache = TTLCache(maxsize=2, ttl=60, maxweight=10, weigh=len)
+    cache.set("a", b"xxxx", ttl=-1)
+    assert cache.get("a") is None
+    assert cache.weight == 0
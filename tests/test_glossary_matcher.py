@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from glossary.matcher import TermMatcher
+
+
+HIGHLIGHTER_JS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "js", "glossary_highlighter.js"
+)
+
+PATTERNS = [
+    ("adverse outcome pathway", 0),
+    ("AOP", 0),
+    ("adverse outcome", 1),
+    ("outcome", 2),
+    ("he", 3),
+    ("she", 4),
+    ("hers", 5),
+    ("his", 6),
+    ("Aop", 7),  # Same text as term 0 case-insensitively: term 0 wins.
+    ("in vitro", 8),
+    ("in vitro-in vivo", 9),
+    ("C++", 10),
+    ("Straße", 11),
+    ("İstanbul", 12),
+    ("𝔸lpha", 13),  # Outside the BMP: skipped.
+    ("", 14),
+]
+
+TEXTS = [
+    "An adverse outcome pathway (AOP) links an adverse outcome to a molecular event.",
+    "ushers said she sees his hers",
+    "aop, Aop and AOP; aops and kAOP are no match",
+    "in vitro-in vivo extrapolation versus in vitro",
+    "C++ code; STRASSE and straße",
+    "İstanbul and i̇stanbul",
+    "outcome",
+    "",
+]
+
+
+def spans(matcher, text, whole_words=True):
+    return [(text[start:end], term) for start, end, term in matcher.matches(text, whole_words)]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return TermMatcher(PATTERNS)
+
+
+def test_leftmost_longest(matcher):
+    text = TEXTS[0]
+    assert spans(matcher, text) == [
+        ("adverse outcome pathway", 0),
+        ("AOP", 0),
+        ("adverse outcome", 1),
+    ]
+
+
+def test_duplicate_text_keeps_the_first_term(matcher):
+    assert spans(matcher, TEXTS[2]) == [("aop", 0), ("Aop", 0), ("AOP", 0)]
+
+
+def test_whole_words(matcher):
+    assert spans(matcher, TEXTS[1]) == [("she", 4), ("his", 6), ("hers", 5)]
+
+
+def test_substrings_without_word_boundaries(matcher):
+    # "ushers" holds "she", "he" and "hers"; the leftmost one wins.
+    assert spans(matcher, TEXTS[1], whole_words=False) == [("she", 4), ("she", 4), ("his", 6), ("hers", 5)]
+
+
+def test_overlapping_terms(matcher):
+    assert spans(matcher, TEXTS[3]) == [("in vitro-in vivo", 9), ("in vitro", 8)]
+
+
+def test_word_boundaries_as_in_javascript(matcher):
+    # Like \b: "C++" followed by a space and "İstanbul" (non-ASCII first
+    # character) have no word boundary at one of their ends.
+    assert ("C++", 10) not in spans(matcher, TEXTS[4])
+    assert ("C++", 10) in spans(matcher, TEXTS[4], whole_words=False)
+    assert spans(matcher, TEXTS[5]) == []
+
+
+def test_case_folding_keeps_offsets(matcher):
+    # "ß" folds to itself, and "İ" (two characters in lower case) is kept as is.
+    assert spans(matcher, TEXTS[4]) == [("straße", 11)]
+    assert spans(matcher, TEXTS[5], whole_words=False) == [("İstanbul", 12)]
+
+
+def test_skipped_patterns(matcher):
+    assert 13 not in matcher.term
+    assert 14 not in matcher.term
+
+
+def test_to_json_round_trip(matcher):
+    data = json.loads(json.dumps(matcher.to_json()))
+    assert len(data["offsets"]) == len(matcher) + 1
+    assert len(data["chars"]) == len(data["targets"]) == data["offsets"][-1]
+    for state, edges in enumerate(matcher.children):
+        start, end = data["offsets"][state], data["offsets"][state + 1]
+        assert dict(zip(data["chars"][start:end], data["targets"][start:end])) == edges
+
+
+def _mirror_source():
+    """The matching functions of glossary_highlighter.js, without the DOM code around them."""
+    with open(HIGHLIGHTER_JS, encoding="utf-8") as f:
+        source = f.read()
+    start = source.index("  // Mirrors glossary/matcher.py")
+    end = source.index("  function createHighlightSpan")
+    return source[start:end]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs Node.js")
+@pytest.mark.parametrize("whole_words", [True, False])
+def test_javascript_mirror_finds_the_same_matches(matcher, whole_words):
+    script = (
+        f"const CONFIG = {{ matchWholeWords: {json.dumps(whole_words)} }};\n"
+        f"const matcher = {json.dumps(matcher.to_json())};\n"
+        + _mirror_source()
+        + f"const texts = {json.dumps(TEXTS)};\n"
+        "const terms = Array.from({ length: 20 }, (_, i) => i);\n"
+        "process.stdout.write(JSON.stringify(texts.map(text =>\n"
+        "  findMatches(text, terms).map(m => [m.start, m.end, m.term]))));\n"
+    )
+    output = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output) == [[list(match) for match in matcher.matches(text, whole_words)] for text in TEXTS]
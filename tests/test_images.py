@@ -0,0 +1,64 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from assets import images
+from assets.images import ImageError, normalize_source
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "https://raw.githubusercontent.com/VHP4Safety/cloud/main/docs/service/aop.png",
+        "https://cloud.vhp4safety.nl/service/aop.png",
+        "images/partners/HU.png",
+        "/static/images/logo.png",
+    ],
+)
+def test_allowed_sources(src):
+    assert normalize_source(src)
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "https://raw.githubusercontent.com/someone/repo/main/big.png",
+        "https://raw.githubusercontent.com/VHP4Safety/../someone/repo/main/big.png",
+        "https://raw.githubusercontent.com/VHP4Safety%2F..%2Fsomeone/big.png",
+        "https://raw.githubusercontent.com/VHP4Safety/cloud/main/a.png?x=1",
+        "http://raw.githubusercontent.com/VHP4Safety/cloud/main/a.png",
+        "https://cloud.vhp4safety.nl.example.org/a.png",
+        "https://example.org/a.png",
+        "ftp://cloud.vhp4safety.nl/a.png",
+        "images/../../app.py",
+        "templates/home.html",
+    ],
+)
+def test_rejected_sources(src):
+    with pytest.raises(ImageError):
+        normalize_source(src)
+
+
+def test_cache_is_bounded(tmp_path, monkeypatch):
+    static = tmp_path / "static"
+    (static / "images").mkdir(parents=True)
+    for i in range(4):
+        out = io.BytesIO()
+        Image.effect_noise((300, 300), 100 + i).save(out, "PNG")
+        (static / "images" / f"{i}.png").write_bytes(out.getvalue())
+    monkeypatch.setattr(images, "STATIC_DIR", str(static))
+    monkeypatch.setattr(images, "IMAGE_CACHE_DIR", str(tmp_path / "cache"))
+
+    first, _ = images.get_image("images/0.png", 240)
+    monkeypatch.setattr(images, "MAX_CACHE_BYTES", os.path.getsize(first) * 2.5)
+    paths = []
+    for i in range(4):
+        path, _ = images.get_image(f"images/{i}.png", 240)
+        os.utime(path, (i, i))  # Written in this order.
+        paths.append(path)
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted(
+        name for path in paths[2:] for name in (os.path.basename(path), os.path.basename(path)[:-5] + ".json")
+    )
@@ -0,0 +1,32 @@
+import pytest
+from flask import Flask
+
+from monitoring import instrument
+
+
+app = Flask(__name__)
+
+
+def authorized(remote_addr="127.0.0.1", **headers):
+    with app.test_request_context("/metrics", headers=headers, environ_base={"REMOTE_ADDR": remote_addr}):
+        return instrument.metrics_authorized()
+
+
+@pytest.mark.parametrize("remote_addr", ["127.0.0.1", "127.0.0.2", "::1"])
+def test_loopback_clients_without_token(remote_addr):
+    assert authorized(remote_addr)
+
+
+@pytest.mark.parametrize("remote_addr", ["10.0.0.5", "203.0.113.7", "2001:db8::1", ""])
+def test_other_clients_without_token(remote_addr):
+    assert not authorized(remote_addr)
+
+
+def test_token_required_when_set(monkeypatch):
+    monkeypatch.setattr(instrument, "METRICS_TOKEN", "s3cret")
+
+    assert authorized("203.0.113.7", Authorization="Bearer s3cret")
+    assert authorized("203.0.113.7", Authorization="bearer s3cret")
+    assert not authorized("127.0.0.1")
+    assert not authorized("127.0.0.1", Authorization="Bearer wrong")
+    assert not authorized("127.0.0.1", Authorization="Basic s3cret")
@@ -0,0 +1,188 @@
+import contextvars
+import email.utils
+import sqlite3
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from upstream import deadline, ratelimit
+from upstream.ratelimit import BACKGROUND, INTERACTIVE, BucketStore, RateLimiter
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BucketStore(str(tmp_path / "ratelimit.sqlite3"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the bucket store, moved by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+def test_parse_limits():
+    assert ratelimit.parse_limits("www.EBI.ac.uk=10/20, api.github.com=0.5 ,") == {
+        "www.ebi.ac.uk": (10.0, 20.0),
+        "api.github.com": (0.5, 1.0),
+    }
+
+
+@pytest.mark.parametrize("value", ["host", "host=fast", "host=0", "host=5/0.5", "host=-1"])
+def test_parse_limits_rejects_invalid_limits(value):
+    with pytest.raises(ValueError):
+        ratelimit.parse_limits(value)
+
+
+def test_retry_after_seconds():
+    assert ratelimit.retry_after_seconds("7") == 7
+    assert ratelimit.retry_after_seconds("-3") == 0
+    assert ratelimit.retry_after_seconds("100000") == ratelimit.MAX_RETRY_AFTER
+    assert ratelimit.retry_after_seconds(None) == ratelimit.DEFAULT_RETRY_AFTER
+    assert ratelimit.retry_after_seconds("soon") == ratelimit.DEFAULT_RETRY_AFTER
+    in_ten_seconds = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= ratelimit.retry_after_seconds(in_ten_seconds) <= 10
+
+
+def test_burst_then_rate(store, clock):
+    for _ in range(3):
+        assert store.take("h", 2, 3) == (0.0, 2)
+    wait, _ = store.take("h", 2, 3)
+    assert wait == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert store.take("h", 2, 3)[0] == 0.0
+
+
+def test_bucket_refills_up_to_the_burst(store, clock):
+    store.take("h", 2, 3)
+    clock[0] += 3600
+    for _ in range(3):
+        assert store.take("h", 2, 3)[0] == 0.0
+    assert store.take("h", 2, 3)[0] > 0
+
+
+def test_reserve_is_left_for_interactive_calls(store, clock):
+    # Background calls keep 2 of the 4 tokens.
+    assert store.take("h", 1, 4, reserve=2)[0] == 0.0
+    assert store.take("h", 1, 4, reserve=2)[0] == 0.0
+    assert store.take("h", 1, 4, reserve=2)[0] == pytest.approx(1.0)
+    assert store.take("h", 1, 4)[0] == 0.0
+    assert store.take("h", 1, 4)[0] == 0.0
+    assert store.take("h", 1, 4)[0] > 0
+
+
+def test_buckets_are_per_host(store, clock):
+    store.take("a", 1, 1)
+    assert store.take("a", 1, 1)[0] > 0
+    assert store.take("b", 1, 1)[0] == 0.0
+
+
+def test_bucket_is_shared_between_stores(store, clock):
+    other = BucketStore(store.path)
+    assert store.take("h", 1, 1)[0] == 0.0
+    assert other.take("h", 1, 1)[0] > 0
+
+
+def test_throttle_halves_the_rate_and_pauses(store, clock):
+    assert store.throttle("h", 10, 20, pause=5) == 5
+    wait, rate = store.take("h", 10, 20)
+    assert (wait, rate) == (5, 5)
+    # A 429 during the pause extends it, without halving the rate again.
+    clock[0] += 1
+    assert store.throttle("h", 10, 20, pause=6) == pytest.approx(5 + 10 / ratelimit.RECOVERY)
+    assert store.take("h", 10, 20)[0] == pytest.approx(6)
+
+
+def test_throttled_rate_recovers(store, clock):
+    store.throttle("h", 10, 20, pause=0)
+    store.throttle("h", 10, 20, pause=0)
+    assert store.take("h", 10, 20)[1] == pytest.approx(2.5)
+    clock[0] += ratelimit.RECOVERY
+    assert store.take("h", 10, 20)[1] == 10
+
+
+def test_throttled_rate_has_a_floor(store, clock):
+    for _ in range(20):
+        rate = store.throttle("h", 10, 20, pause=0)
+    assert rate == pytest.approx(10 * ratelimit.MIN_RATE_FRACTION)
+
+
+def test_priority_defaults_to_background():
+    assert ratelimit.current_priority() == BACKGROUND
+    with ratelimit.priority(INTERACTIVE):
+        assert ratelimit.current_priority() == INTERACTIVE
+    assert ratelimit.current_priority() == BACKGROUND
+
+
+def test_requests_are_interactive_also_in_their_worker_threads():
+    app = Flask(__name__)
+    ratelimit.prioritize_requests(app)
+    seen = {}
+
+    @app.route("/")
+    def view():
+        seen["request"] = ratelimit.current_priority()
+        context = contextvars.copy_context()
+        threads = [
+            threading.Thread(target=context.run, args=(lambda: seen.update(copied=ratelimit.current_priority()),)),
+            threading.Thread(target=lambda: seen.update(plain=ratelimit.current_priority())),
+        ]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        return ""
+
+    app.test_client().get("/")
+    assert seen == {"request": INTERACTIVE, "copied": INTERACTIVE, "plain": BACKGROUND}
+    assert ratelimit.current_priority() == BACKGROUND
+
+
+def test_interactive_calls_go_first(store):
+    limiter = RateLimiter("h", 10, 1, store)
+    limiter.acquire()  # Empty the bucket: the next token comes in 0.1 s.
+    order = []
+
+    def call(priority):
+        with ratelimit.priority(priority):
+            limiter.acquire()
+        order.append(priority)
+
+    background = threading.Thread(target=call, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_waiting_ends_at_the_deadline(store):
+    limiter = RateLimiter("h", 0.1, 1, store)
+    limiter.acquire()
+    with deadline.scope(0.2), ratelimit.priority(INTERACTIVE):
+        started = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded):
+            limiter.acquire()
+    assert time.monotonic() - started < 1
+
+
+def test_locked_store_lets_the_call_through(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(ratelimit, "BUSY_TIMEOUT", 0.05)
+    path = str(tmp_path / "ratelimit.sqlite3")
+    limiter = RateLimiter("h", 1, 1, BucketStore(path))
+    other_process = sqlite3.connect(path, isolation_level=None)
+    other_process.execute("BEGIN IMMEDIATE")
+    try:
+        assert limiter.acquire() < 2
+        limiter.throttled("1")
+    finally:
+        other_process.execute("ROLLBACK")
+        other_process.close()
+    assert "Rate limit of h skipped" in caplog.text
+    assert "could not be lowered" in caplog.text
+    # The store works again once the lock is released.
+    assert limiter.store.take("h", 1, 1)[0] == 0.0
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from compounds.similarity import FingerprintIndex, _popcount, parse_smiles, smiles_fingerprint
+
+
+def bonds(neighbours):
+    return sorted((a, b, symbol) for a, edges in enumerate(neighbours) for b, symbol in edges if a < b)
+
+
+def test_chain_with_branch():
+    atoms, neighbours = parse_smiles("CC(=O)O")
+    assert atoms == ["C", "C", "O", "O"]
+    assert bonds(neighbours) == [(0, 1, "-"), (1, 2, "="), (1, 3, "-")]
+
+
+def test_two_letter_elements():
+    atoms, _ = parse_smiles("ClCBr")
+    assert atoms == ["Cl", "C", "Br"]
+
+
+def test_aromatic_ring_closure():
+    atoms, neighbours = parse_smiles("c1ccccc1")
+    assert len(atoms) == 6
+    assert (0, 5, ":") in bonds(neighbours)
+    assert {symbol for _, _, symbol in bonds(neighbours)} == {":"}
+
+
+def test_ring_bond_order_from_either_end():
+    assert bonds(parse_smiles("C=1CCCCC1")[1]) == bonds(parse_smiles("C1CCCCC=1")[1])
+    assert (0, 5, "=") in bonds(parse_smiles("C=1CCCCC1")[1])
+
+
+def test_two_digit_ring_numbers():
+    atoms, neighbours = parse_smiles("C%10CCCCC%10")
+    assert len(atoms) == 6
+    assert (0, 5, "-") in bonds(neighbours)
+
+
+def test_ring_number_reused_after_closing():
+    _, neighbours = parse_smiles("C1CC1C1CC1")
+    assert len(bonds(neighbours)) == 7
+
+
+def test_bracket_atoms_keep_only_the_element():
+    atoms, _ = parse_smiles("[NH4+].[13CH3][C@@H](O)[O-]")
+    assert atoms == ["N", "C", "C", "O", "O"]
+
+
+def test_dot_separates_components():
+    _, neighbours = parse_smiles("[Na+].[Cl-]")
+    assert bonds(neighbours) == []
+
+
+def test_stereo_bonds_are_single_bonds():
+    assert bonds(parse_smiles("F/C=C/F")[1]) == bonds(parse_smiles("FC=CF")[1])
+
+
+@pytest.mark.parametrize(
+    "smiles",
+    ["", "C(", "C)", "(C)", "C1CC", "1CC", "C?C", "[", "[+]", "CC)C("],
+)
+def test_invalid_smiles(smiles):
+    with pytest.raises(ValueError):
+        parse_smiles(smiles)
+
+
+def test_fingerprint_shape():
+    fp = smiles_fingerprint("CCO", n_bits=256)
+    assert fp.dtype == np.uint64
+    assert fp.shape == (4,)
+
+
+def test_fingerprint_does_not_depend_on_atom_order():
+    assert np.array_equal(smiles_fingerprint("OCC"), smiles_fingerprint("CCO"))
+    assert np.array_equal(smiles_fingerprint("c1ccccc1O"), smiles_fingerprint("Oc1ccccc1"))
+
+
+def test_substructure_bits_are_a_subset():
+    phenol = smiles_fingerprint("Oc1ccccc1")
+    benzene = smiles_fingerprint("c1ccccc1")
+    assert np.array_equal(phenol & benzene, benzene)
+
+
+def test_popcount():
+    words = np.array([[0, 1, 2**64 - 1]], dtype=np.uint64)
+    assert _popcount(words).tolist() == [[0, 1, 64]]
+
+
+@pytest.fixture
+def index():
+    return FingerprintIndex(
+        [
+            {"id": "Q1", "label": "benzene", "SMILES": "c1ccccc1"},
+            {"id": "Q2", "label": "phenol", "SMILES": "Oc1ccccc1"},
+            {"id": "Q3", "label": "ethanol", "SMILES": "CCO"},
+            {"id": "Q4", "label": "broken", "SMILES": "C1CC"},
+            {"id": "Q5", "label": "no smiles", "SMILES": ""},
+        ]
+    )
+
+
+def test_index_skips_unparsable_compounds(index):
+    assert index.ids == ["Q1", "Q2", "Q3"]
+    assert index.fingerprint_of("Q4") is None
+
+
+def test_top_k(index):
+    hits = index.top_k(index.fingerprint_of("Q1"), k=2)
+    assert [hit["id"] for hit in hits] == ["Q1", "Q2"]
+    assert hits[0]["similarity"] == 1.0
+    assert [hit["id"] for hit in index.top_k(index.fingerprint_of("Q1"), k=2, exclude="Q1")] == ["Q2", "Q3"]
+
+
+def test_top_k_threshold(index):
+    hits = index.top_k(index.fingerprint_of("Q1"), threshold=0.99)
+    assert [hit["id"] for hit in hits] == ["Q1"]
+
+
+def test_substructure_candidates(index):
+    candidates, total = index.substructure_candidates(smiles_fingerprint("c1ccccc1"))
+    assert total == 2
+    assert [hit["id"] for hit in candidates] == ["Q1", "Q2"]
+
+
+def test_empty_index():
+    index = FingerprintIndex([])
+    assert len(index) == 0
+    assert index.top_k(smiles_fingerprint("C")) == []
+    assert index.substructure_candidates(smiles_fingerprint("C")) == ([], 0)
@@ -0,0 +1,209 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+from upstream import deadline
+from upstream import http as upstream_http
+from upstream.cache import TTLCache
+from upstream.singleflight import SingleFlight
+
+
+def call_concurrently(count, target):
+    """Run target(i) in count threads at once and return their results (or exceptions) by i."""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except BaseException as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def slow(value, calls, seconds=0.2):
+    def function():
+        calls.append(value)
+        time.sleep(seconds)
+        return value
+
+    return function
+
+
+def test_concurrent_calls_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+    results = call_concurrently(8, lambda i: flight.do("key", slow("value", calls)))
+    assert calls == ["value"]
+    assert [value for value, _ in results] == ["value"] * 8
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight("test")
+    calls = []
+    results = call_concurrently(4, lambda i: flight.do(i % 2, slow(i % 2, calls)))
+    assert sorted(calls) == [0, 1]
+    assert [value for value, _ in results] == [0, 1, 0, 1]
+
+
+def test_error_reaches_every_waiting_caller():
+    flight = SingleFlight("test")
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise KeyError("upstream failed")
+
+    results = call_concurrently(5, lambda i: flight.do("key", failing))
+    assert calls == [1]
+    assert all(isinstance(result, KeyError) for result in results)
+    assert len({id(result) for result in results}) == 1
+
+
+def test_later_callers_make_a_new_call():
+    flight = SingleFlight("test")
+    calls = []
+    assert flight.do("key", slow(1, calls, 0)) == (1, False)
+    assert flight.do("key", slow(2, calls, 0)) == (2, False)
+    assert calls == [1, 2]
+
+
+def test_failed_call_is_not_remembered():
+    flight = SingleFlight("test")
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.do("key", lambda: 42) == (42, False)
+
+
+def test_waiting_caller_stops_at_its_deadline():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    owner = threading.Thread(target=flight.do, args=("key", blocking))
+    owner.start()
+    started.wait(5)
+    try:
+        with deadline.scope(0.1):
+            begin = time.monotonic()
+            with pytest.raises(deadline.DeadlineExceeded):
+                flight.do("key", lambda: "own")
+            assert time.monotonic() - begin < 1
+    finally:
+        release.set()
+        owner.join(5)
+
+
+@pytest.fixture
+def slow_server():
+    """Local server answering after 0.6 s, before the headers (path /headers) or within the body (/body)."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path.startswith("/headers"):
+                time.sleep(0.6)
+            self.send_response(200)
+            self.send_header("Content-Length", "4")
+            self.end_headers()
+            self.wfile.write(b"sl")
+            self.wfile.flush()
+            if self.path.startswith("/body"):
+                time.sleep(0.6)
+            self.wfile.write(b"ow")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("path", ["/headers", "/body"])
+def test_caller_retries_when_the_shared_call_hit_another_deadline(slow_server, path):
+    # The first caller's timeout is capped to its 0.2 s budget; the second
+    # caller joins its GET and must not inherit the timeout.
+    session = upstream_http.Session()
+    url = slow_server + path
+    results = {}
+
+    def call(name, budget, delay):
+        time.sleep(delay)
+        with deadline.scope(budget):
+            try:
+                results[name] = session.get(url, timeout=5).content
+            except Exception as e:
+                results[name] = e
+
+    threads = [
+        threading.Thread(target=call, args=("short", 0.2, 0)),
+        threading.Thread(target=call, args=("long", 10, 0.05)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert isinstance(results["short"], deadline.DeadlineExceeded)
+    assert results["long"] == b"slow"
+
+
+def test_errors_caused_by_a_deadline_are_not_shared():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+
+    def cut_short():
+        started.set()
+        release.wait(5)
+        try:
+            raise deadline.DeadlineExceeded("deadline of another request")
+        except deadline.DeadlineExceeded as e:
+            raise RuntimeError("query timed out") from e
+
+    def owner():
+        with pytest.raises(RuntimeError):
+            flight.do("key", cut_short)
+
+    results = []
+
+    def waiter():
+        results.append(flight.do("key", lambda: "own"))
+
+    threads = [threading.Thread(target=owner), threading.Thread(target=waiter)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    time.sleep(0.1)  # The second caller now waits for the first one's call.
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [("own", False)]
+
+
+def test_cache_loads_are_coalesced():
+    cache = TTLCache(maxsize=4, ttl=60)
+    calls = []
+    results = call_concurrently(6, lambda i: cache.get_or_load("key", slow("value", calls)))
+    assert calls == ["value"]
+    assert results == ["value"] * 6
+    assert cache.get_or_load("key", slow("other", calls)) == "value"
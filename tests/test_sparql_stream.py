@@ -0,0 +1,142 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from upstream import sparql
+from upstream.sparql import iter_bindings
+
+
+BINDINGS = [
+    {"ID": {"type": "literal", "value": "Q1"}, "label": {"type": "literal", "value": "benzène"}},
+    {"ID": {"type": "literal", "value": "Q2"}},
+    {"ID": {"type": "literal", "value": "Q3"}, "label": {"type": "literal", "value": "a \"quoted\" ] value"}},
+]
+HEAD_FIRST = json.dumps(
+    {"head": {"vars": ["ID", "label"]}, "results": {"bindings": BINDINGS}}, ensure_ascii=False
+).encode("utf-8")
+HEAD_LAST = json.dumps(
+    {"results": {"bindings": BINDINGS}, "head": {"vars": ["label", "ID"]}}, ensure_ascii=False
+).encode("utf-8")
+NO_HEAD = json.dumps({"results": {"bindings": BINDINGS}}, ensure_ascii=False).encode("utf-8")
+
+
+def chunked(document, size):
+    return [document[i:i + size] for i in range(0, len(document), size)]
+
+
+@pytest.mark.parametrize("size", range(1, 40))
+def test_any_chunk_split(size):
+    # Splits keys, values and multi-byte characters at every position.
+    head = []
+    assert list(iter_bindings(chunked(HEAD_FIRST, size), head=head)) == BINDINGS
+    assert head == ["ID", "label"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 65536])
+def test_head_after_the_bindings(size):
+    head = []
+    bindings = iter_bindings(chunked(HEAD_LAST, size), head=head)
+    assert list(bindings) == BINDINGS
+    assert head == ["label", "ID"]
+
+
+@pytest.mark.parametrize("size", [1, 5, 65536])
+def test_no_head(size):
+    head = []
+    assert list(iter_bindings(chunked(NO_HEAD, size), head=head)) == BINDINGS
+    assert head == []
+
+
+def test_bindings_are_yielded_before_the_document_ends():
+    chunks = iter(chunked(HEAD_FIRST, 16))
+    bindings = iter_bindings(chunks)
+    assert next(bindings) == BINDINGS[0]
+    assert next(chunks, None) is not None
+
+
+def test_empty_bindings():
+    head = []
+    assert list(iter_bindings([b'{"head": {"vars": ["x"]}, "results": {"bindings": []}}'], head=head)) == []
+    assert head == ["x"]
+
+
+def test_truncated_document():
+    with pytest.raises(ValueError):
+        list(iter_bindings([HEAD_FIRST[:-20]]))
+
+
+def test_document_without_bindings():
+    with pytest.raises(ValueError):
+        list(iter_bindings([b'{"boolean": true}']))
+
+
+def test_bind():
+    query = sparql.bind(
+        "SELECT * WHERE { $cmp ?p $value . FILTER(?x = $flag) }",
+        {"cmp": sparql.PrefixedName("wd:Q42"), "value": 'say "hi"\n', "flag": True},
+    )
+    assert query == 'SELECT * WHERE { wd:Q42 ?p "say \\"hi\\"\\n" . FILTER(?x = true) }'
+
+
+@pytest.mark.parametrize(
+    "value",
+    [sparql.Iri("http://example.org/> } DROP ALL {"), sparql.PrefixedName("wd:Q1 }"), object()],
+)
+def test_bind_rejects_unsafe_values(value):
+    with pytest.raises(ValueError):
+        sparql.bind("SELECT * WHERE { $x ?p ?o }", {"x": value})
+
+
+@pytest.fixture
+def endpoint():
+    """A local SPARQL endpoint answering every query with served["body"]."""
+    served = {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.send_header("Content-Length", str(len(served["body"])))
+            self.end_headers()
+            self.wfile.write(served["body"])
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = sparql.SparqlClient(f"http://127.0.0.1:{server.server_port}/sparql")
+    yield client, served
+    server.shutdown()
+    server.server_close()
+
+
+def test_select_rows_in_head_order(endpoint):
+    client, served = endpoint
+    served["body"] = HEAD_LAST
+    result = client.select("SELECT ?label ?ID WHERE { ?ID ?p ?label }")
+    assert result.vars == ("label", "ID")
+    assert result.rows == [("benzène", "Q1"), (None, "Q2"), ('a "quoted" ] value', "Q3")]
+
+
+def test_select_without_head(endpoint):
+    client, served = endpoint
+    served["body"] = NO_HEAD
+    result = client.select("SELECT * WHERE { ?ID ?p ?o } # no head")
+    assert result.vars == ("ID", "label")
+    assert result.rows[1] == ("Q2", None)
+
+
+def test_select_row_limit(endpoint):
+    client, served = endpoint
+    served["body"] = HEAD_FIRST
+    with pytest.raises(sparql.ResultTooLarge):
+        client.select("SELECT * WHERE { ?s ?p ?o } # limited", max_rows=2)
+
+
+def test_select_invalid_parameters(endpoint):
+    client, _ = endpoint
+    with pytest.raises(sparql.SparqlError, match="Invalid query parameters"):
+        client.select("SELECT * WHERE { $cmp ?p ?o }", params={"other": 1})
@@ -0,0 +1,133 @@
+"""
+Circuit breakers per upstream host
+
+Every outbound call of the shared HTTP layer (upstream/http.py) passes the
+breaker of its host. A breaker is closed while the host is healthy. When
+at least MIN_CALLS calls in the last WINDOW seconds were made and at least
+ERROR_RATE of them failed (5xx, 429, no response, or slower than
+SLOW_CALL seconds), it opens: calls fail at once with CircuitOpen for
+OPEN_SECONDS, instead of each waiting for a timeout. Then it is half-open:
+one probe call is let through, closing the breaker when it succeeds and
+opening it again when it fails. While a breaker is open, the HTTP layer
+answers a GET with the last successful response for it when it has one.
+
+The state of every breaker is exported as vhp_upstream_circuit_state.
+Set VHP_CIRCUIT_BREAKERS=0 to let every call through.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from monitoring import metrics
+
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("VHP_CIRCUIT_BREAKERS", "1") != "0"
+WINDOW = 30  # Seconds of call outcomes the error rate is computed over.
+MIN_CALLS = 10  # Fewer calls in the window never open the breaker.
+ERROR_RATE = 0.5
+SLOW_CALL = 10  # Seconds; slower calls count as failures.
+OPEN_SECONDS = 20  # Seconds an open breaker rejects calls before a probe.
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(requests.ConnectionError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed, open and half-open state of the calls to one host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.state = CLOSED
+        self._outcomes = collections.deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.UPSTREAM_CIRCUIT_STATE.set(STATE_VALUES[CLOSED], host=host)
+
+    def allow(self):
+        """
+        Admit a call
+
+        Raises:
+            CircuitOpen: If the breaker is open, or half-open with its probe in flight
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= OPEN_SECONDS:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        metrics.UPSTREAM_CIRCUIT_REJECTED.inc(host=self.host)
+        raise CircuitOpen(f"Circuit breaker for {self.host} is open")
+
+    def record(self, failed):
+        """Record the outcome of an admitted call."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                self._transition(OPEN if failed else CLOSED)
+                return
+            if self.state != CLOSED:
+                return  # A call admitted before the breaker opened.
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and self._outcomes[0][0] < now - WINDOW:
+                self._failures -= self._outcomes.popleft()[1]
+            if len(self._outcomes) >= MIN_CALLS and self._failures >= ERROR_RATE * len(self._outcomes):
+                self._transition(OPEN)
+
+    def release(self):
+        """End an admitted call without an outcome; a half-open breaker lets the next call probe."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _transition(self, state):
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            if self.state == HALF_OPEN:
+                logger.warning("Circuit breaker for %s reopened after a failed probe", self.host)
+            else:
+                logger.warning(
+                    "Circuit breaker for %s opened after %d of %d calls failed",
+                    self.host, self._failures, len(self._outcomes),
+                )
+        elif state == CLOSED:
+            logger.info("Circuit breaker for %s closed", self.host)
+        self._outcomes.clear()
+        self._failures = 0
+        self.state = state
+        metrics.UPSTREAM_CIRCUIT_STATE.set(STATE_VALUES[state], host=self.host)
+        metrics.UPSTREAM_CIRCUIT_TRANSITIONS.inc(host=self.host, state=state)
+
+
+def is_failure(response, duration):
+    """Whether a call that got a response counts as failed."""
+    return response.status_code >= 500 or response.status_code == 429 or duration > SLOW_CALL
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def for_host(host):
+    """Return the breaker of a host, creating it on first use."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
@@ -0,0 +1,93 @@
+import collections
+import threading
+import time
+
+from monitoring import metrics
+from upstream.singleflight import SingleFlight
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ttl seconds, bounded by count and optionally by weight."""
+
+    def __init__(self, maxsize=256, ttl=600, name=None, keep_stale=False, maxweight=None, weigh=None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries kept
+            maxweight (float): Maximum total weight of the entries kept, e.g. bytes
+            weigh (callable): Weight of a value, required with maxweight
+            ttl (float): Seconds an entry stays valid
+            name (str): Name of the cache in the cache metrics; unnamed
+                caches are not counted
+            keep_stale (bool): Keep expired entries (until evicted) for get_stale
+        """
+        self.name = name
+        self.keep_stale = keep_stale
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._loads = SingleFlight(name or "cache")
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                if not self.keep_stale:
+                    self._remove(key)
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+        if self.name is not None:
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return default if entry is None else entry[1]
+
+    def get_stale(self, key, default=None):
+        """Return the value for key even if it expired (see keep_stale), or default if missing."""
+        with self._lock:
+            entry = self._data.get(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entry if full."""
+        weight = self.weigh(value) if self.maxweight is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value, weight)
+            self.weight += weight
+            # Least recently used first.
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        self.weight -= self._data.pop(key)[2]
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() and caching its
+        result on a miss; concurrent misses for the same key share one call
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value, _ = self._loads.do(key, lambda: self._load(key, loader))
+        return value
+
+    def _load(self, key, loader):
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
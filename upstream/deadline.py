@@ -0,0 +1,168 @@
+"""
+Per-request deadlines, propagated to every outbound call
+
+Every request gets a latency budget when it arrives: the budget of its
+view (see budget; 10 s for the home page and 15 s for /data) or
+VHP_REQUEST_DEADLINE seconds. Outbound calls of the shared HTTP layer
+(upstream/http.py) get at most the remaining budget as timeout and fail
+at once with DeadlineExceeded when nothing is left, so routes can render
+what they have instead of waiting. exceeded() tells whether the request
+ran out of budget; /data then shows the studies loaded so far with a
+"results incomplete" notice.
+
+Threads started while handling a request do not inherit its deadline;
+functions run in them with contextvars.copy_context().run do. Calls made
+within suspended() have no deadline: the first, synchronous loads of
+upstream.refresh.RefreshingValue values (e.g. the compound catalog) are
+made that way, because they cannot be retried with the rest of the budget.
+
+Environment variables:
+    VHP_REQUEST_DEADLINE    Budget of views without their own, in seconds (default 20)
+"""
+
+import contextlib
+import contextvars
+import os
+import time
+
+import requests
+from flask import g, request
+
+from monitoring import metrics
+
+
+DEFAULT_BUDGET = float(os.environ.get("VHP_REQUEST_DEADLINE", 20))
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Raised instead of an outbound call when the request deadline has passed."""
+
+
+class Deadline:
+    """Point in time by which a request should be answered."""
+
+    def __init__(self, budget):
+        """
+        Args:
+            budget (float): Seconds from now
+        """
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+        self.exceeded = False
+
+    def remaining(self):
+        """Seconds left, negative once the deadline has passed."""
+        return self.expires - time.monotonic()
+
+
+def current():
+    """The deadline of the request being handled, or None."""
+    return _current.get()
+
+
+def expired():
+    """Whether the current request has a deadline and it has passed."""
+    deadline = _current.get()
+    return deadline is not None and deadline.remaining() <= 0
+
+
+def exceeded():
+    """Whether the current request skipped or cut short work because of its deadline."""
+    deadline = _current.get()
+    return deadline is not None and deadline.exceeded
+
+
+def check():
+    """
+    Raises:
+        DeadlineExceeded: If the deadline of the current request has passed
+    """
+    deadline = _current.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        deadline.exceeded = True
+        raise DeadlineExceeded(f"Request deadline of {deadline.budget:g} s exceeded")
+
+
+def limit_timeout(timeout):
+    """
+    Cap the timeout of an outbound call (None, seconds or a (connect,
+    read) tuple) to the remaining budget of the current request
+
+    Returns:
+        tuple: (timeout to use, whether it was shortened)
+
+    Raises:
+        DeadlineExceeded: If no budget is left
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return timeout, False
+    check()
+    remaining = deadline.remaining()
+    if timeout is None:
+        return (remaining, remaining), True
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        limited = (
+            remaining if connect is None else min(connect, remaining),
+            remaining if read is None else min(read, remaining),
+        )
+        return limited, limited != timeout
+    return min(timeout, remaining), remaining < timeout
+
+
+def mark_exceeded():
+    """Record that the current request skipped or cut short work because of its deadline."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.exceeded = True
+
+
+@contextlib.contextmanager
+def scope(budget):
+    """Run the block with a deadline budget seconds from now."""
+    token = _current.set(Deadline(budget))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def suspended():
+    """Run the block without the deadline of the current request."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def budget(seconds):
+    """Decorator giving a view its own deadline budget, e.g. @deadline.budget(15)."""
+
+    def decorate(view):
+        view.deadline_budget = seconds
+        return view
+
+    return decorate
+
+
+def apply_deadlines(app):
+    """Give every request handled by app a deadline."""
+
+    @app.before_request
+    def start_deadline():
+        view = app.view_functions.get(request.endpoint)
+        g.deadline_token = _current.set(Deadline(getattr(view, "deadline_budget", DEFAULT_BUDGET)))
+
+    @app.teardown_request
+    def finish_deadline(exception):
+        token = g.pop("deadline_token", None)
+        if token is None:
+            return
+        if _current.get().exceeded:
+            metrics.HTTP_DEADLINE_EXCEEDED.inc(endpoint=request.endpoint or "none")
+        _current.reset(token)
@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from monitoring import metrics
+
+
+# Directory of the persistent caches; survives restarts of the app.
+CACHE_DIR = os.environ.get(
+    "VHP_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+)
+
+
+class DiskCache:
+    """
+    Persistent key-value cache with per-entry expiry, stored in SQLite
+
+    Values must be JSON serializable. The database is shared by all
+    processes of the app, so a value fetched by one worker is reused by the
+    others and after a restart.
+    """
+
+    def __init__(self, name, ttl=30 * 24 * 3600, directory=None):
+        """
+        Args:
+            name (str): Name of the cache, used as the database file name
+            ttl (float): Default seconds an entry stays valid
+            directory (str): Directory of the database, defaults to CACHE_DIR
+        """
+        directory = directory or CACHE_DIR
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached and not expired."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite limits the number of parameters of one statement.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    "SELECT key, value FROM entries WHERE expires > ? AND key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    [time.time(), *chunk],
+                )
+                found.update((key, json.loads(value)) for key, value in rows)
+        metrics.CACHE_LOOKUPS.inc(len(found), cache=self.name, result="hit")
+        metrics.CACHE_LOOKUPS.inc(len(keys) - len(found), cache=self.name, result="miss")
+        return found
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (default: the cache ttl)."""
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        """Store all {key: value} items for ttl seconds (default: the cache ttl)."""
+        expires = time.time() + (ttl or self.ttl)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires) for key, value in items.items()],
+            )
+
+    def purge(self):
+        """Delete the expired entries."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
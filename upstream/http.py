@@ -0,0 +1,252 @@
+import os
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from monitoring import metrics, tracing
+from upstream import breaker, deadline, ratelimit, recording
+from upstream.singleflight import SingleFlight
+from upstream.cache import TTLCache
+
+
+USER_AGENT = "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)"
+FALLBACK_MAX_AGE = 24 * 3600  # Seconds a successful response can stand in for a rejected call.
+# Fallbacks are kept in memory: responses of up to FALLBACK_MAX_BYTES, at
+# most FALLBACK_TOTAL_BYTES together per process.
+FALLBACK_MAX_BYTES = 4 * 1024 * 1024
+FALLBACK_TOTAL_BYTES = 48 * 1024 * 1024
+
+
+def parse_overrides(value):
+    """
+    Parse VHP_UPSTREAM_OVERRIDES, e.g.
+    "www.ebi.ac.uk=http://127.0.0.1:9001,raw.githubusercontent.com=http://127.0.0.1:9002"
+
+    Returns:
+        dict: {upstream host: base URL the requests are sent to instead}
+    """
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, base_url = item.partition("=")
+        if not base_url.startswith(("http://", "https://")):
+            raise ValueError(f"Invalid upstream override: {item!r}")
+        overrides[host.strip().lower()] = base_url.rstrip("/")
+    return overrides
+
+
+# Sends the calls to some upstream hosts elsewhere, e.g. to the stand-in
+# servers of the load test (benchmarks/upstreams.py). Metrics and traces keep
+# the original host.
+OVERRIDES = parse_overrides(os.environ.get("VHP_UPSTREAM_OVERRIDES", ""))
+# With VHP_UPSTREAM_OVERRIDES_ONLY=1 calls to hosts without an override
+# fail at once instead of going to the internet.
+OVERRIDES_ONLY = os.environ.get("VHP_UPSTREAM_OVERRIDES_ONLY", "0") != "0"
+
+
+def redirect_url(url):
+    """Return url with its scheme and host replaced according to OVERRIDES."""
+    parts = urllib.parse.urlsplit(url)
+    base_url = OVERRIDES.get(parts.hostname or "")
+    if base_url is None:
+        return url
+    return base_url + urllib.parse.urlunsplit(("", "", parts.path, parts.query, ""))
+
+
+def _interceptor():
+    """The Recorder or Player selected by VHP_UPSTREAM_RECORD / VHP_UPSTREAM_REPLAY, if any."""
+    if os.environ.get("VHP_UPSTREAM_REPLAY"):
+        archive = recording.Archive(os.environ["VHP_UPSTREAM_REPLAY"])
+        return recording.Player(archive, os.environ.get("VHP_UPSTREAM_REPLAY_TIMING", "original"))
+    if os.environ.get("VHP_UPSTREAM_RECORD"):
+        return recording.Recorder(recording.Archive(os.environ["VHP_UPSTREAM_RECORD"]))
+    return None
+
+
+# Records or replays every call (see upstream/recording.py).
+INTERCEPTOR = _interceptor()
+
+# The last successful response of GET calls, by recording.request_key,
+# returned when the circuit breaker of the host is open.
+_fallbacks = TTLCache(
+    maxsize=512, ttl=FALLBACK_MAX_AGE, maxweight=FALLBACK_TOTAL_BYTES, weigh=lambda fallback: len(fallback[2])
+)
+
+# GET calls in flight (not streamed), by recording.request_key.
+_flights = SingleFlight("http")
+
+
+class Session(requests.Session):
+    """
+    requests.Session that records every outbound call in the upstream
+    metrics: latency per host (until the response headers arrived), counts
+    per host and status code, and the calls in flight. Calls made while
+    handling a request are also added to its trace as upstream.<host> spans.
+
+    Calls pass the circuit breaker of their host (upstream/breaker.py). While
+    it is open, a GET whose last successful response (not streamed) is
+    known gets that response; other calls raise breaker.CircuitOpen.
+
+    While a request is handled, the timeout of a call is capped to the
+    remaining budget of its deadline (upstream/deadline.py); without budget
+    left calls raise deadline.DeadlineExceeded.
+
+    Calls to a host with a rate limit (upstream/ratelimit.py) wait for a
+    token of its bucket first; its 429 responses slow the host's calls down.
+
+    A GET (not streamed) identical to one in flight, from any thread, waits
+    for it and gets a copy of its response (upstream/singleflight.py); only
+    the call made is counted in the upstream metrics.
+
+    Use the shared session of this module (get) unless a client needs its
+    own headers or connection pool.
+    """
+
+    def __init__(self, pool_size=10):
+        """
+        Args:
+            pool_size (int): Maximum number of pooled connections per host
+        """
+        super().__init__()
+        self.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def send(self, request, **kwargs):
+        if request.method != "GET" or kwargs.get("stream"):
+            return self._send_instrumented(request, **kwargs)
+        started = time.perf_counter()
+        response, shared = _flights.do(
+            recording.request_key(request), lambda: self._send_instrumented(request, **kwargs)
+        )
+        if not shared:
+            return response
+        tracing.record(
+            f"upstream.{urllib.parse.urlsplit(request.url).hostname or 'unknown'}",
+            started,
+            time.perf_counter() - started,
+            method=request.method,
+            url=request.url,
+            status=str(response.status_code),
+            coalesced=True,
+        )
+        copy = recording.build_response(
+            request, response.status_code, recording.stored_headers(response), response.content
+        )
+        copy.elapsed = response.elapsed
+        return copy
+
+    def _send_instrumented(self, request, **kwargs):
+        host = urllib.parse.urlsplit(request.url).hostname or "unknown"
+        status = "error"
+        metrics.UPSTREAM_IN_FLIGHT.inc(host=host)
+        started = time.perf_counter()
+        shortened = False
+        try:
+            kwargs["timeout"], shortened = deadline.limit_timeout(kwargs.get("timeout"))
+            if INTERCEPTOR is not None:
+                response = INTERCEPTOR.send(self._send, request, **kwargs)
+            else:
+                response = self._send(request, **kwargs)
+            status = str(response.status_code)
+            return response
+        except breaker.CircuitOpen:
+            status = "circuit_open"
+            raise
+        except deadline.DeadlineExceeded:
+            status = "deadline_exceeded"
+            raise
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if shortened and deadline.expired():
+                # Cut short by the deadline rather than by the upstream (a read
+                # timeout in the body is a ConnectionError): callers sharing
+                # this call (singleflight) make their own.
+                status = "deadline_exceeded"
+                deadline.mark_exceeded()
+                raise deadline.DeadlineExceeded(f"Request deadline reached while calling {host}") from e
+            if isinstance(e, requests.exceptions.Timeout):
+                status = "timeout"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.UPSTREAM_IN_FLIGHT.dec(host=host)
+            metrics.UPSTREAM_REQUEST_DURATION.observe(duration, host=host)
+            metrics.UPSTREAM_REQUESTS.inc(host=host, status=status)
+            tracing.record(
+                f"upstream.{host}", started, duration, method=request.method, url=request.url, status=status
+            )
+
+    def _send(self, request, **kwargs):
+        host = urllib.parse.urlsplit(request.url).hostname or "unknown"
+        limiter = ratelimit.for_host(host)
+        # Calls an open breaker will reject do not wait for a token.
+        if limiter is not None and not (breaker.ENABLED and breaker.for_host(host).state == breaker.OPEN):
+            limiter.acquire()
+            kwargs["timeout"], _ = deadline.limit_timeout(kwargs.get("timeout"))
+        if not breaker.ENABLED:
+            return self._send_network(request, **kwargs)
+        circuit = breaker.for_host(host)
+        try:
+            circuit.allow()
+        except breaker.CircuitOpen:
+            fallback = _fallbacks.get(recording.request_key(request)) if request.method == "GET" else None
+            if fallback is None:
+                raise
+            metrics.UPSTREAM_FALLBACKS.inc(host=host)
+            response = recording.build_response(request, *fallback)
+            # Not an upstream response: the Recorder does not archive it.
+            response.fallback = True
+            return response
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self._send_network(request, **kwargs)
+            failed = breaker.is_failure(response, time.perf_counter() - started)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            # A timeout shortened by the request deadline (a read timeout in
+            # the body is a ConnectionError) says nothing about the host: it
+            # is not recorded as a success or a failure.
+            if deadline.expired():
+                failed = None
+                deadline.mark_exceeded()
+            raise
+        finally:
+            if failed is None:
+                circuit.release()
+            else:
+                circuit.record(failed)
+        if (
+            request.method == "GET"
+            and response.status_code == 200
+            and not kwargs.get("stream")
+            and len(response.content) <= FALLBACK_MAX_BYTES
+        ):
+            _fallbacks.set(recording.request_key(request), (200, recording.stored_headers(response), response.content))
+        return response
+
+    def _send_network(self, request, **kwargs):
+        url = request.url
+        if OVERRIDES:
+            request.url = redirect_url(url)
+            if OVERRIDES_ONLY and request.url == url:
+                raise requests.ConnectionError(f"No upstream override for {url}", request=request)
+        try:
+            response = super().send(request, **kwargs)
+        finally:
+            request.url = url
+        if response.status_code == 429:
+            limiter = ratelimit.for_host(urllib.parse.urlsplit(url).hostname or "unknown")
+            if limiter is not None:
+                limiter.throttled(response.headers.get("Retry-After"))
+        return response
+
+
+session = Session()
+
+
+def get(url, **kwargs):
+    """requests.get through the shared, instrumented session."""
+    return session.get(url, **kwargs)
@@ -0,0 +1,328 @@
+"""
+Outbound rate limits per upstream host, shared by all processes of the app
+
+Calls of the shared HTTP layer (upstream/http.py) to a host in
+VHP_RATE_LIMITS take a token from the bucket of that host first, waiting
+until one is available. The buckets are kept in a SQLite database in the
+cache directory, so all workers together stay within the limit.
+
+Waiting calls are served by priority: calls made while handling a request
+(INTERACTIVE) go before calls of background threads such as refreshes
+(BACKGROUND), and background calls leave BACKGROUND_RESERVE tokens for
+interactive calls. The priority is a context variable, set to INTERACTIVE
+for each request by prioritize_requests() and to anything else by
+priority(); calls without one are BACKGROUND. Worker threads of a request
+get its priority by running in a copy of its context
+(contextvars.copy_context().run). An interactive call waits no longer
+than the deadline of its request (upstream/deadline.py).
+
+When the database is locked by another process for longer than its busy
+timeout, a call waits LOCKED_RETRIES times with backoff and then goes out
+without a token, with a warning, rather than failing the request.
+
+A 429 response halves the rate of the host and pauses its calls for the
+Retry-After of the response; the rate then recovers to the configured one
+over RECOVERY seconds. So the calls go at the highest rate the host
+accepts.
+
+Environment variables:
+    VHP_RATE_LIMITS    Rates per host as host=calls per second[/burst],
+                       comma-separated (default: www.ebi.ac.uk=25/50)
+"""
+
+import contextlib
+import contextvars
+import email.utils
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g
+
+from monitoring import metrics
+from upstream import deadline
+from upstream.diskcache import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+BACKGROUND_RESERVE = 2  # Tokens background calls leave for interactive ones.
+RECOVERY = 60  # Seconds for a throttled rate to grow back to the configured rate.
+MIN_RATE_FRACTION = 0.05  # A throttled rate never drops below this fraction of the configured rate.
+DEFAULT_RETRY_AFTER = 5  # Seconds to pause after a 429 without Retry-After.
+MAX_RETRY_AFTER = 120
+POLL = 0.5  # Seconds between checks of the shared bucket while waiting.
+BUSY_TIMEOUT = 1  # Seconds SQLite waits for a database locked by another process.
+LOCKED_RETRIES = 3  # Tries to get the bucket of a locked database, waiting LOCKED_BACKOFF * 2**n in between.
+LOCKED_BACKOFF = 0.05
+
+
+def parse_limits(value):
+    """
+    Parse VHP_RATE_LIMITS, e.g. "www.ebi.ac.uk=10/20,api.github.com=1"
+
+    Returns:
+        dict: {host: (calls per second, burst)}; the burst defaults to the rate
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, limit = item.partition("=")
+        rate, _, burst = limit.partition("/")
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else max(rate, 1.0)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit: {item!r}") from None
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid rate limit: {item!r}")
+        limits[host.strip().lower()] = (rate, burst)
+    return limits
+
+
+LIMITS = parse_limits(os.environ.get("VHP_RATE_LIMITS", "www.ebi.ac.uk=25/50"))
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=None)
+
+
+def current_priority():
+    """The priority of calls made now: as set by priority() or prioritize_requests(), else BACKGROUND."""
+    return _priority.get() or BACKGROUND
+
+
+@contextlib.contextmanager
+def priority(value):
+    """Make the calls of the with block with priority INTERACTIVE or BACKGROUND."""
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def prioritize_requests(app):
+    """Make the calls made while app handles a request INTERACTIVE."""
+
+    @app.before_request
+    def start_priority():
+        g.priority_token = _priority.set(INTERACTIVE)
+
+    @app.teardown_request
+    def finish_priority(exception):
+        token = g.pop("priority_token", None)
+        if token is not None:
+            _priority.reset(token)
+
+
+def retry_after_seconds(value):
+    """Seconds to wait according to a Retry-After header (seconds or HTTP date), or the default."""
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = DEFAULT_RETRY_AFTER
+    else:
+        seconds = DEFAULT_RETRY_AFTER
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class BucketStore:
+    """Token buckets of all hosts in one SQLite database, shared between processes."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL, rate REAL, "
+                "updated REAL, paused_until REAL)"
+            )
+
+    @contextlib.contextmanager
+    def _bucket(self, host, rate, burst):
+        """
+        Yield the refilled state of the bucket of host as a dict, holding
+        the database write lock, and store it afterwards
+
+        Raises:
+            sqlite3.OperationalError: If the database stays locked for longer than its busy timeout
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute(
+                    "SELECT tokens, rate, updated, paused_until FROM buckets WHERE host = ?", (host,)
+                ).fetchone()
+                tokens, current_rate, updated, paused_until = row or (burst, rate, now, 0.0)
+                elapsed = max(now - updated, 0.0)
+                current_rate = min(rate, current_rate + rate * elapsed / RECOVERY)
+                bucket = {
+                    "now": now,
+                    "tokens": min(burst, tokens + elapsed * current_rate),
+                    "rate": current_rate,
+                    "paused_until": paused_until,
+                }
+                yield bucket
+                self._db.execute(
+                    "INSERT OR REPLACE INTO buckets (host, tokens, rate, updated, paused_until) VALUES (?, ?, ?, ?, ?)",
+                    (host, bucket["tokens"], bucket["rate"], now, bucket["paused_until"]),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def take(self, host, rate, burst, reserve=0):
+        """
+        Take a token from the bucket of host if more than reserve are left
+
+        Returns:
+            tuple: (seconds until a token can be taken, 0 if one was taken; current rate)
+        """
+        with self._bucket(host, rate, burst) as bucket:
+            if bucket["paused_until"] > bucket["now"]:
+                wait = bucket["paused_until"] - bucket["now"]
+            elif bucket["tokens"] >= 1 + reserve:
+                bucket["tokens"] -= 1
+                wait = 0.0
+            else:
+                wait = (1 + reserve - bucket["tokens"]) / bucket["rate"]
+            return wait, bucket["rate"]
+
+    def throttle(self, host, rate, burst, pause):
+        """
+        Halve the rate of host, empty its bucket and pause its calls for
+        pause seconds; a 429 during a pause (of a call made before it) only
+        extends the pause
+
+        Returns:
+            float: The new rate
+        """
+        with self._bucket(host, rate, burst) as bucket:
+            if bucket["paused_until"] <= bucket["now"]:
+                bucket["rate"] = max(bucket["rate"] / 2, rate * MIN_RATE_FRACTION)
+            bucket["tokens"] = 0.0
+            bucket["paused_until"] = max(bucket["paused_until"], bucket["now"] + pause)
+            return bucket["rate"]
+
+
+class RateLimiter:
+    """The token bucket of one host and the calls of this process waiting for it."""
+
+    def __init__(self, host, rate, burst, store):
+        """
+        Args:
+            host (str): Upstream host
+            rate (float): Calls per second
+            burst (float): Calls that can be made at once after a quiet period
+            store (BucketStore): Where the bucket is kept
+        """
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+        self._waiting = []  # Heap of (rank of the priority, arrival) of the waiting calls.
+        self._arrivals = itertools.count()
+        self._condition = threading.Condition()
+        metrics.UPSTREAM_RATE_LIMIT.set(rate, host=host)
+
+    def acquire(self):
+        """
+        Wait for a token, behind waiting calls of higher priority
+
+        Returns:
+            float: Seconds waited
+
+        Raises:
+            deadline.DeadlineExceeded: If the deadline of the request passes while waiting
+        """
+        priority = current_priority()
+        entry = (0 if priority == INTERACTIVE else 1, next(self._arrivals))
+        reserve = 0 if priority == INTERACTIVE else min(BACKGROUND_RESERVE, self.burst - 1)
+        started = time.perf_counter()
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            # A call of higher priority may now be first.
+            self._condition.notify_all()
+            try:
+                while True:
+                    wait = POLL
+                    if self._waiting[0] == entry:
+                        wait = self._take(reserve)
+                        if wait == 0:
+                            break
+                    deadline.check()
+                    current = deadline.current()
+                    if current is not None:
+                        wait = min(wait, max(current.remaining(), 0.001))
+                    self._condition.wait(min(wait, POLL))
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+        waited = time.perf_counter() - started
+        metrics.UPSTREAM_RATE_LIMIT_WAIT.observe(waited, host=self.host, priority=priority)
+        return waited
+
+    def _take(self, reserve):
+        """
+        Take a token from the shared bucket, retrying while its database is
+        locked; after LOCKED_RETRIES tries the call goes without a token
+
+        Returns:
+            float: Seconds until a token can be taken, 0 if one was taken (or skipped)
+        """
+        for attempt in range(LOCKED_RETRIES):
+            try:
+                wait, rate = self.store.take(self.host, self.rate, self.burst, reserve)
+            except sqlite3.OperationalError as e:
+                if attempt + 1 < LOCKED_RETRIES:
+                    time.sleep(LOCKED_BACKOFF * 2**attempt)
+                    continue
+                logger.warning("Rate limit of %s skipped: bucket store unavailable (%s)", self.host, e)
+                return 0.0
+            metrics.UPSTREAM_RATE_LIMIT.set(rate, host=self.host)
+            return wait
+
+    def throttled(self, retry_after=None):
+        """Slow down after the host answered 429, with the Retry-After header of the response."""
+        pause = retry_after_seconds(retry_after)
+        try:
+            rate = self.store.throttle(self.host, self.rate, self.burst, pause)
+        except sqlite3.OperationalError as e:
+            metrics.UPSTREAM_THROTTLED.inc(host=self.host)
+            logger.warning("%s answered 429, but its rate limit could not be lowered: %s", self.host, e)
+            return
+        metrics.UPSTREAM_THROTTLED.inc(host=self.host)
+        metrics.UPSTREAM_RATE_LIMIT.set(rate, host=self.host)
+        logger.warning("%s answered 429: pausing %.1f s, rate lowered to %.2f/s", self.host, pause, rate)
+
+
+_store = None
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def for_host(host):
+    """Return the rate limiter of a host, or None if its calls are not limited."""
+    if host not in LIMITS:
+        return None
+    global _store
+    with _limiters_lock:
+        if host not in _limiters:
+            if _store is None:
+                _store = BucketStore(os.path.join(CACHE_DIR, "ratelimit.sqlite3"))
+            _limiters[host] = RateLimiter(host, *LIMITS[host], _store)
+        return _limiters[host]
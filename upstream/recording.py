@@ -0,0 +1,201 @@
+"""
+Record and replay of upstream responses
+
+With VHP_UPSTREAM_RECORD=<file> every call of the shared HTTP layer
+(upstream/http.py) is stored in an archive; with VHP_UPSTREAM_REPLAY=<file>
+calls are answered from that archive instead of the network, after the
+recorded duration (VHP_UPSTREAM_REPLAY_TIMING=original, the default) or
+immediately (VHP_UPSTREAM_REPLAY_TIMING=none). Calls without a recording
+fail like an unreachable host.
+
+    python -m upstream.recording <file>   # summary of an archive
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+
+# Request headers that select a different response and are part of the key.
+KEY_HEADERS = ("Accept", "If-None-Match", "If-Modified-Since")
+# Response headers that describe the transfer rather than the stored body.
+TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+def request_key(request):
+    """
+    Return the archive key of a prepared request: method, URL with sorted
+    query parameters, the KEY_HEADERS and a digest of the request body
+    """
+    parts = urllib.parse.urlsplit(request.url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    url = urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ""))
+    headers = [f"{name}: {request.headers[name]}" for name in KEY_HEADERS if request.headers.get(name)]
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return "\n".join([request.method, url, *headers, hashlib.sha256(body).hexdigest()[:16] if body else ""])
+
+
+def stored_headers(response):
+    """The response headers without those of the transfer (the stored body is decoded)."""
+    return {name: value for name, value in response.headers.items() if name.lower() not in TRANSFER_HEADERS}
+
+
+def build_response(request, status, headers, body):
+    """Return a requests.Response for the request as if the body came from the network."""
+    raw = HTTPResponse(
+        body=io.BytesIO(body),
+        headers=headers,
+        status=status,
+        preload_content=False,
+        decode_content=False,
+    )
+    return HTTPAdapter().build_response(request, raw)
+
+
+class Archive:
+    """
+    Recorded upstream exchanges in one SQLite file
+
+    Bodies are stored zlib-compressed and once per distinct content, so
+    repeated responses (e.g. the service index fetched by every page) take
+    no extra space. A request recorded several times is replayed in the
+    recorded order, the last recording repeating.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._replayed = {}  # key -> number of times replayed
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS bodies (digest TEXT PRIMARY KEY, data BLOB, size INTEGER)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS exchanges (id INTEGER PRIMARY KEY, key TEXT, host TEXT, "
+                "status INTEGER, headers TEXT, digest TEXT, duration REAL, recorded REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS exchanges_key ON exchanges (key, id)")
+
+    def record(self, request, response, body, duration):
+        """Store a response and its body, which the caller has already read."""
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO bodies (digest, data, size) VALUES (?, ?, ?)",
+                (digest, zlib.compress(body, 6), len(body)),
+            )
+            self._db.execute(
+                "INSERT INTO exchanges (key, host, status, headers, digest, duration, recorded) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    request_key(request),
+                    urllib.parse.urlsplit(request.url).hostname,
+                    response.status_code,
+                    json.dumps(stored_headers(response)),
+                    digest,
+                    duration,
+                    time.time(),
+                ),
+            )
+
+    def lookup(self, request):
+        """
+        Return the next recorded (status, headers, body, duration) for the
+        request, or None if it was never recorded
+        """
+        key = request_key(request)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, headers, digest, duration FROM exchanges WHERE key = ? ORDER BY id", (key,)
+            ).fetchall()
+            if not rows:
+                return None
+            index = min(self._replayed.get(key, 0), len(rows) - 1)
+            self._replayed[key] = index + 1
+            status, headers, digest, duration = rows[index]
+            (data,) = self._db.execute("SELECT data FROM bodies WHERE digest = ?", (digest,)).fetchone()
+        return status, json.loads(headers), zlib.decompress(data), duration
+
+    def summary(self):
+        """Return (host, number of exchanges, bytes of their bodies, bytes stored) per host."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT e.host, COUNT(*), SUM(b.size), "
+                "(SELECT SUM(LENGTH(data)) FROM bodies WHERE digest IN (SELECT digest FROM exchanges WHERE host = e.host)) "
+                "FROM exchanges e JOIN bodies b ON b.digest = e.digest GROUP BY e.host ORDER BY e.host"
+            ).fetchall()
+
+
+class Recorder:
+    """Records the calls of an http.Session into an archive."""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def send(self, send, request, **kwargs):
+        """
+        Send the request with send (the network) and record the response
+
+        Returns a response rebuilt from the recorded body, so streaming
+        callers read the same bytes. Responses that did not come from the
+        upstream (the fallbacks of an open circuit breaker) are not recorded.
+        """
+        started = time.perf_counter()
+        response = send(request, **kwargs)
+        if getattr(response, "fallback", False):
+            return response
+        body = response.content
+        self.archive.record(request, response, body, time.perf_counter() - started)
+        replayed = build_response(request, response.status_code, stored_headers(response), body)
+        replayed.elapsed = response.elapsed
+        return replayed
+
+
+class Player:
+    """Answers the calls of an http.Session from an archive."""
+
+    def __init__(self, archive, timing="original"):
+        """
+        Args:
+            archive (Archive): The recordings
+            timing (str): 'original' to wait for the recorded duration, 'none' to answer at once
+        """
+        if timing not in ("original", "none"):
+            raise ValueError(f"Replay timing must be 'original' or 'none', not {timing!r}")
+        self.archive = archive
+        self.timing = timing
+
+    def send(self, send, request, **kwargs):
+        """
+        Return the recorded response for the request
+
+        Raises:
+            requests.ConnectionError: If the request was never recorded
+        """
+        recorded = self.archive.lookup(request)
+        if recorded is None:
+            raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+        status, headers, body, duration = recorded
+        if self.timing == "original":
+            time.sleep(duration)
+        return build_response(request, status, headers, body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize an archive of recorded upstream responses")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    print(f"{'host':<32} {'responses':>9} {'body KiB':>9} {'stored KiB':>10}")
+    for host, count, size, stored in Archive(args.path).summary():
+        print(f"{host:<32} {count:>9} {(size or 0) / 1024:>9.1f} {(stored or 0) / 1024:>10.1f}")
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+from upstream import deadline
+
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshingValue:
+    """
+    Value loaded from an upstream source, kept in memory and refreshed in
+    a background thread.
+
+    The first call to get() loads the value synchronously, without the
+    deadline of the request it is made for, and starts the refresh
+    thread. Afterwards get() never blocks: callers always receive the
+    last successfully loaded value, and a failed refresh keeps the old
+    value and is retried after retry_interval seconds.
+    """
+
+    def __init__(self, name, loader, interval, retry_interval=60):
+        """
+        Args:
+            name (str): Name used in log messages
+            loader (callable): Function without arguments returning the new value
+            interval (float): Seconds between two refreshes
+            retry_interval (float): Seconds before retrying a failed refresh
+        """
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.loaded_at = None
+        self._value = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self):
+        """
+        Return the current value, loading it first if it was never loaded
+
+        Raises:
+            Exception: Whatever the loader raises when the initial load fails
+        """
+        if self.loaded_at is None:
+            with self._lock:
+                if self.loaded_at is None:
+                    # The loader's own timeouts apply, not the remaining
+                    # budget of the request that happens to load first.
+                    with deadline.suspended():
+                        self._set(self.loader())
+                    self._start()
+        return self._value
+
+    @property
+    def value(self):
+        """The last loaded value, or None; never loads or blocks."""
+        return self._value
+
+    def peek(self):
+        """
+        Return the current value without blocking
+
+        If the value was never loaded, None is returned and the initial load
+        is started in the background thread.
+        """
+        if self.loaded_at is None:
+            with self._lock:
+                self._start()
+        return self._value
+
+    def refresh(self):
+        """Reload the value now; on failure the previous value is kept."""
+        try:
+            self._set(self.loader())
+            return True
+        except Exception as e:
+            logger.warning("Refreshing %s failed: %s", self.name, e)
+            return False
+
+    def _set(self, value):
+        self._value = value
+        self.loaded_at = time.time()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"refresh-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        delay = 0 if self.loaded_at is None else self.interval
+        while True:
+            time.sleep(delay)
+            delay = self.interval if self.refresh() else self.retry_interval
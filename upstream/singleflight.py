@@ -0,0 +1,102 @@
+"""
+Coalescing of identical concurrent calls
+
+When many requests need the same upstream data at once (e.g. every page
+fetching the service index after a restart, or a burst of requests for one
+compound), only the first caller for a key makes the call; callers for
+the same key arriving while it is in flight wait for it and share its
+result or exception. Callers arriving after it finished make a new call.
+The GET requests of the shared HTTP session (upstream/http.py), SPARQL
+queries (upstream/sparql.py) and the loads of TTLCache.get_or_load (e.g.
+the expdata per compound) are coalesced this way.
+
+The calls made and the callers that shared another's call are counted in
+vhp_singleflight_calls_total and vhp_singleflight_collapsed_total, per
+group (http, sparql, or the name of a cache).
+"""
+
+import threading
+
+from monitoring import metrics
+from upstream import deadline
+
+
+def _cut_by_deadline(error):
+    """Whether an error is, or was raised because of, DeadlineExceeded (e.g. a SparqlTimeout from one)."""
+    while error is not None:
+        if isinstance(error, deadline.DeadlineExceeded):
+            return True
+        error = error.__cause__
+    return False
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """The calls in flight of one group, by key."""
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Name of the group in the metrics, e.g. 'http'
+        """
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Return function(), or the result of the call for the same key
+        already in flight
+
+        A caller waits no longer than the deadline of the request it
+        handles. When the call in flight was cut short by the deadline of
+        another request (it raised DeadlineExceeded, or an error caused by
+        it), the caller makes its own call.
+
+        Returns:
+            tuple: (result, whether it was shared from another caller's call)
+
+        Raises:
+            deadline.DeadlineExceeded: If the deadline passes while waiting
+            Exception: Whatever the function raised, also in waiting callers
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    break
+            self._wait(flight)
+            if _cut_by_deadline(flight.error):
+                continue
+            metrics.SINGLEFLIGHT_COLLAPSED.inc(group=self.name)
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        metrics.SINGLEFLIGHT_CALLS.inc(group=self.name)
+        try:
+            flight.value = function()
+            return flight.value, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    @staticmethod
+    def _wait(flight):
+        current = deadline.current()
+        if current is None:
+            flight.done.wait()
+            return
+        while not flight.done.wait(max(current.remaining(), 0)):
+            deadline.check()
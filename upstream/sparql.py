@@ -0,0 +1,399 @@
+import codecs
+import itertools
+import json
+import re
+import threading
+import time
+
+import requests
+
+from monitoring import metrics
+from upstream import breaker, deadline, http
+from upstream.singleflight import SingleFlight
+
+
+COMPOUNDWIKI_EP = "https://compoundcloud.wikibase.cloud/query/sparql"
+QLEVER_WIKIDATA_EP = "https://qlever.cs.uni-freiburg.de/api/wikidata"
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) timeout in seconds
+DEFAULT_MAX_ROWS = 50000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+CHUNK_SIZE = 65536
+
+HEADERS = {
+    "Accept": "application/sparql-results+json",
+    "User-Agent": "VHP4Safety-UI/1.0 (https://github.com/VHP4Safety/ui-design)",
+}
+
+_BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+_VARS_START = re.compile(r'"vars"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+_PLACEHOLDER = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)")
+_IRI_FORBIDDEN = re.compile(r'[\s<>"{}|^`\\]')
+_PNAME = re.compile(r"[A-Za-z][A-Za-z0-9_-]*:[A-Za-z0-9_][A-Za-z0-9_.-]*")
+
+
+class SparqlError(Exception):
+    """Raised when a SPARQL query fails or returns an unusable response."""
+
+
+class SparqlTimeout(SparqlError):
+    """Raised when the endpoint does not answer within the timeout."""
+
+
+class ResultTooLarge(SparqlError):
+    """Raised when a result exceeds the configured row or byte limit."""
+
+
+class SparqlUnavailable(SparqlError):
+    """Raised without querying when the circuit breaker of the endpoint is open."""
+
+
+################################################################################
+### Parameter binding
+
+
+class Iri(str):
+    """A full IRI, written as <...> when bound into a query."""
+
+
+class PrefixedName(str):
+    """A prefixed name such as wd:Q42, written as-is when bound into a query."""
+
+
+def format_term(value):
+    """
+    Format a Python value as a SPARQL term
+
+    Args:
+        value: Iri, PrefixedName, str (plain literal), bool, int or float
+
+    Returns:
+        str: The SPARQL representation of the value
+
+    Raises:
+        ValueError: If the value cannot be represented safely
+    """
+    if isinstance(value, Iri):
+        if _IRI_FORBIDDEN.search(value):
+            raise ValueError(f"Invalid IRI: {value!r}")
+        return f"<{value}>"
+    if isinstance(value, PrefixedName):
+        if not _PNAME.fullmatch(value):
+            raise ValueError(f"Invalid prefixed name: {value!r}")
+        return str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        escaped = (
+            value.replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+        return f'"{escaped}"'
+    raise ValueError(f"Cannot bind value of type {type(value).__name__}")
+
+
+def bind(query, params):
+    """
+    Substitute $name placeholders in a query with safely formatted terms
+
+    Args:
+        query (str): SPARQL query using $name placeholders
+        params (dict): Values for the placeholders (see format_term)
+
+    Returns:
+        str: The query with all placeholders replaced
+
+    Raises:
+        ValueError: If a placeholder has no value or a value is invalid
+    """
+
+    def replace(match):
+        name = match.group(1)
+        if name not in params:
+            raise ValueError(f"No value bound for ${name}")
+        return format_term(params[name])
+
+    return _PLACEHOLDER.sub(replace, query)
+
+
+################################################################################
+### Streaming results decoding
+
+
+def iter_bindings(chunks, encoding="utf-8", head=None):
+    """
+    Incrementally decode the bindings of a SPARQL JSON results document
+
+    The document is consumed chunk by chunk and every binding is yielded
+    as soon as it is complete, so the full response text never has to be
+    held in memory.
+
+    Args:
+        chunks (iterable): Raw byte chunks, e.g. response.iter_content(65536)
+        encoding (str): Text encoding of the response
+        head (list): Optional list that is filled with the result variables;
+            when the "head" section follows the bindings it is only filled
+            after the last binding was yielded
+
+    Yields:
+        dict: One binding ({variable: {"type": ..., "value": ...}})
+
+    Raises:
+        ValueError: If the document ends before the bindings array is closed
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    buffer = ""
+    in_array = False
+    want_vars = head is not None
+    chunks = iter(chunks)
+
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+
+        if not in_array:
+            if want_vars:
+                start = _VARS_START.search(buffer)
+                if start:
+                    try:
+                        variables, _ = decoder.raw_decode(buffer, start.end() - 1)
+                        head.extend(variables)
+                        want_vars = False
+                    except json.JSONDecodeError:
+                        continue  # vars array is split across chunks
+            start = _BINDINGS_START.search(buffer)
+            if not start:
+                # Keep a tail in case the key is split across chunks.
+                if not want_vars:
+                    buffer = buffer[-32:]
+                continue
+            buffer = buffer[start.end():]
+            in_array = True
+
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                if want_vars:
+                    _trailing_vars(decoder, text_decoder, buffer[pos + 1:], chunks, head)
+                return
+            try:
+                binding, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # incomplete binding, wait for more data
+            yield binding
+        buffer = buffer[pos:]
+
+    if in_array and buffer.strip():
+        raise ValueError("Malformed SPARQL JSON results")
+    if in_array:
+        raise ValueError("SPARQL JSON results ended before the bindings were closed")
+    raise ValueError("No bindings found in the SPARQL JSON results")
+
+
+def _trailing_vars(decoder, text_decoder, buffer, chunks, head):
+    """Fill head from a "head" section after the bindings, if there is one."""
+    for chunk in itertools.chain((b"",), chunks):
+        buffer += text_decoder.decode(chunk)
+        start = _VARS_START.search(buffer)
+        if start:
+            try:
+                variables, _ = decoder.raw_decode(buffer, start.end() - 1)
+            except json.JSONDecodeError:
+                continue  # vars array is split across chunks
+            head.extend(variables)
+            return
+
+
+class SparqlResult:
+    """Result of a SELECT query as compact row tuples."""
+
+    __slots__ = ("vars", "rows", "elapsed")
+
+    def __init__(self, variables, rows, elapsed):
+        self.vars = tuple(variables)
+        self.rows = rows
+        self.elapsed = elapsed
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def dicts(self):
+        """Rows as dicts keyed by variable name (unbound variables are None)."""
+        return [dict(zip(self.vars, row)) for row in self.rows]
+
+
+################################################################################
+### Client
+
+
+def _row(binding, variables):
+    return tuple(binding[var]["value"] if var in binding else None for var in variables)
+
+
+class SparqlClient:
+    """SPARQL client for one endpoint with a pooled HTTP session."""
+
+    def __init__(
+        self,
+        endpoint,
+        timeout=DEFAULT_TIMEOUT,
+        max_rows=DEFAULT_MAX_ROWS,
+        max_bytes=DEFAULT_MAX_BYTES,
+        params=None,
+        pool_size=10,
+    ):
+        """
+        Args:
+            endpoint (str): URL of the SPARQL endpoint
+            timeout (tuple): Default (connect, read) timeout in seconds
+            max_rows (int): Default maximum number of result rows
+            max_bytes (int): Maximum size of a response body in bytes
+            params (dict): Extra query string parameters sent with every query
+            pool_size (int): Maximum number of pooled connections
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.params = params or {}
+        self.session = http.Session(pool_size=pool_size)
+        self.session.headers.update(HEADERS)
+
+    def select(self, query, params=None, timeout=None, max_rows=None):
+        """
+        Run a SELECT query and return its rows as tuples
+
+        Args:
+            query (str): SPARQL query, optionally with $name placeholders
+            params (dict): Values for the placeholders (see bind)
+            timeout (tuple): (connect, read) timeout overriding the default
+            max_rows (int): Row limit overriding the default
+
+        Returns:
+            SparqlResult: Variables and rows; each row is a tuple of values
+                in variable order, with None for unbound variables
+
+        Raises:
+            SparqlTimeout: If the endpoint does not answer in time
+            ResultTooLarge: If the result exceeds the row or byte limit
+            SparqlError: On any other failure
+        """
+        if params:
+            try:
+                query = bind(query, params)
+            except ValueError as e:
+                raise SparqlError(f"Invalid query parameters: {e}") from e
+        max_rows = max_rows or self.max_rows
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            # Identical queries in flight share one result (the calls are
+            # streamed, so the session does not coalesce them).
+            result, _ = _flights.do(
+                (self.endpoint, tuple(sorted(self.params.items())), query, max_rows),
+                lambda: self._select(query, timeout or self.timeout, max_rows, started),
+            )
+            outcome = "ok"
+            return result
+        except requests.exceptions.Timeout as e:
+            outcome = "timeout"
+            raise SparqlTimeout(f"{self.endpoint} timed out") from e
+        except breaker.CircuitOpen as e:
+            outcome = "unavailable"
+            raise SparqlUnavailable(f"{self.endpoint} is unavailable, try again later") from e
+        except requests.exceptions.RequestException as e:
+            raise SparqlError(f"Request to {self.endpoint} failed: {e}") from e
+        except ValueError as e:
+            raise SparqlError(f"Invalid response from {self.endpoint}: {e}") from e
+        finally:
+            metrics.SPARQL_QUERY_DURATION.observe(time.perf_counter() - started, endpoint=self.endpoint, outcome=outcome)
+
+    def _select(self, query, timeout, max_rows, started):
+        with self.session.get(
+            self.endpoint,
+            params=self.params | {"query": query},
+            timeout=timeout,
+            stream=True,
+        ) as response:
+            if response.status_code != 200:
+                raise SparqlError(
+                    f"{self.endpoint} returned status {response.status_code}"
+                )
+            head = []
+            rows = []
+            # Bindings are kept until the head is known: it may follow them.
+            # Without any head the variables are those bound in any binding.
+            pending = []
+            for binding in iter_bindings(self._limited(response), head=head):
+                if len(rows) + len(pending) >= max_rows:
+                    raise ResultTooLarge(f"Result has more than {max_rows} rows")
+                if head:
+                    rows.append(_row(binding, head))
+                else:
+                    pending.append(binding)
+        if pending:
+            if not head:
+                head.extend(dict.fromkeys(var for binding in pending for var in binding))
+            rows = [_row(binding, head) for binding in pending]
+        return SparqlResult(head, rows, time.perf_counter() - started)
+
+    def _limited(self, response):
+        received = 0
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        while True:
+            try:
+                chunk = next(chunks, None)
+            except requests.exceptions.RequestException as e:
+                # The read timeout is capped to the deadline (see http.Session).
+                if deadline.expired():
+                    deadline.mark_exceeded()
+                    raise deadline.DeadlineExceeded(f"Request deadline reached while reading {self.endpoint}") from e
+                raise
+            if chunk is None:
+                return
+            deadline.check()
+            received += len(chunk)
+            if received > self.max_bytes:
+                raise ResultTooLarge(f"Response is larger than {self.max_bytes} bytes")
+            yield chunk
+
+
+# SELECT queries in flight, by endpoint, parameters, query and row limit.
+_flights = SingleFlight("sparql")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(endpoint, **options):
+    """
+    Return the shared client for an endpoint, creating it on first use
+
+    Options are only applied when the client is created.
+    """
+    with _clients_lock:
+        if endpoint not in _clients:
+            _clients[endpoint] = SparqlClient(endpoint, **options)
+        return _clients[endpoint]
+
+
+def compoundwiki():
+    """Shared client for the Compound Wiki query service."""
+    return client(COMPOUNDWIKI_EP)
+
+
+def qlever_wikidata():
+    """Shared client for the qlever Wikidata endpoint."""
+    return client(QLEVER_WIKIDATA_EP, params={"format": "json"})